@@ -0,0 +1,139 @@
+"""Fachada asíncrona sobre `db.py`.
+
+Las funciones de `db` son síncronas; llamarlas directamente desde un endpoint
+`async def` bloquea el event loop y serializa a todos los clientes del worker
+mientras dura la consulta. Aquí se ejecutan en un pool de hilos dedicado, de
+modo que `await adb.get_statistics(path)` deja al loop atender otras peticiones.
+
+Cada hilo del pool mantiene su propia conexión (ver `db._connect`); con WAL
+las lecturas de distintos hilos no se bloquean entre sí. En hosts de un solo
+núcleo las consultas se ejecutan por defecto en el loop (`DB_INLINE`).
+"""
+import asyncio
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import db as _db
+import metrics as _metrics
+
+# Hilos dedicados a SQLite por worker
+DB_MAX_WORKERS = int(os.getenv("SIMTS_DB_MAX_WORKERS", "4"))
+
+
+def _cpu_count() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+# Ejecuta las consultas en el propio event loop, como antes de esta capa. Sin
+# valor explícito se elige según los núcleos: con uno solo el pool no acorta la
+# cola de las rutas que consultan la base y alarga las pesadas, porque los hilos
+# y el loop compiten por la misma CPU (ver `tools/bench_mixed_load.py`)
+_DB_INLINE_ENV = os.getenv("SIMTS_DB_INLINE", "").lower()
+DB_INLINE = _DB_INLINE_ENV in ("1", "true", "yes") if _DB_INLINE_ENV else _cpu_count() <= 1
+
+_executor = ThreadPoolExecutor(max_workers=DB_MAX_WORKERS, thread_name_prefix="db")
+_wrappers: Dict[str, Callable] = {}
+
+
+async def run(fn: Callable, *args, **kwargs):
+    """Ejecuta `fn(*args, **kwargs)` en el pool de la base de datos."""
+    if DB_INLINE:
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _metrics.add_db_time(time.perf_counter() - start)
+    elapsed = [0.0]
+
+    def timed():
+        # Se mide en el hilo (sin la espera en cola) y se acumula en el loop
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed[0] = time.perf_counter() - start
+
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_executor, timed)
+    finally:
+        _metrics.add_db_time(elapsed[0])
+
+
+async def iterate(gen):
+    """Consume un generador síncrono de `db` (p. ej. una exportación) en el pool,
+    un elemento por salto, y lo cierra al terminar o si el cliente se desconecta."""
+    try:
+        while True:
+            item = await run(next, gen, None)
+            if item is None:
+                break
+            yield item
+    finally:
+        await run(gen.close)
+
+
+def _wrap(name: str) -> Callable:
+    @functools.wraps(getattr(_db, name))
+    async def wrapper(*args, **kwargs):
+        # Se resuelve en cada llamada para respetar reemplazos de `db` (tests)
+        return await run(getattr(_db, name), *args, **kwargs)
+
+    return wrapper
+
+
+def __getattr__(name: str) -> Callable:
+    """`adb.<función>` devuelve la versión awaitable de `db.<función>`."""
+    wrapper = _wrappers.get(name)
+    if wrapper is None:
+        if name.startswith("_") or not callable(getattr(_db, name, None)):
+            raise AttributeError(f"module 'adb' has no attribute {name!r}")
+        wrapper = _wrappers[name] = _wrap(name)
+    return wrapper
+
+
+# ===== Escrituras de estudiantes: escritor único con commits agrupados =====
+# Se esperan directamente (sin ocupar un hilo del pool) para que muchas
+# peticiones concurrentes entren en el mismo commit.
+
+async def write(db_path: str, op: str, *args):
+    """Encola una escritura en `db.writer_for(db_path)` y espera su commit."""
+    start = time.perf_counter()
+    try:
+        return await asyncio.wrap_future(_db.submit_write(db_path, op, *args))
+    finally:
+        _metrics.add_db_time(time.perf_counter() - start)
+
+
+async def create_session(db_path: str, student_id: int, case_id: int) -> int:
+    return await write(db_path, "create_session", student_id, case_id)
+
+
+async def submit_session(db_path: str, session_id: int, duration_seconds: Optional[int] = None):
+    await write(db_path, "submit_session", session_id, duration_seconds)
+
+
+async def save_answer(db_path: str, session_id: int, question_index: int, selected_option: Optional[int], open_answer: Optional[str], is_correct: Optional[int] = None) -> int:
+    return await write(db_path, "save_answer", session_id, question_index, selected_option, open_answer, is_correct)
+
+
+async def update_answer_feedback(db_path: str, answer_id: int, feedback: str, score: Optional[float] = None) -> bool:
+    return await write(db_path, "update_answer_feedback", answer_id, feedback, score)
+
+
+async def submit_session_bulk(db_path: str, student_id: int, case_id: int, answers: List[Dict], duration_seconds: Optional[int] = None) -> Dict:
+    # La corrección lee el caso: va al pool de lectura, no al escritor
+    rows, score, total = await run(_db.grade_session, db_path, case_id, answers)
+    session_id = await write(db_path, "insert_graded_session", student_id, case_id, rows, duration_seconds)
+    return {"session_id": session_id, "score": score, "total": total}
+
+
+def shutdown():
+    """Espera las consultas en curso y libera los hilos (hook de apagado)."""
+    _executor.shutdown(wait=True)
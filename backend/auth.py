@@ -0,0 +1,145 @@
+"""Tokens firmados de estudiantes.
+
+El token lleva el id y el vencimiento del estudiante firmados con HMAC-SHA256,
+de modo que verificarlo no requiere consultar la tabla `students` en cada
+petición:
+
+    base64url(json {"sid", "exp"}) + "." + base64url(hmac)
+
+Por lo mismo, desactivar a un estudiante no invalida los tokens que ya tiene:
+siguen valiendo hasta que vencen (`SIMTS_TOKEN_TTL_HOURS`). Para revocarlos
+todos hay que cambiar `SIMTS_TOKEN_SECRET` (o borrar el secreto generado, ver
+`init_secret`). El login sí consulta siempre la base, así que un estudiante
+desactivado no obtiene tokens nuevos.
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import time
+from typing import Dict, Optional, Tuple
+
+from fastapi import Header, HTTPException
+
+import adb as _adb
+
+logger = logging.getLogger("simts.backend")
+
+# Secreto de firma; debe ser el mismo en todos los workers para que los tokens sean válidos entre ellos
+TOKEN_SECRET = os.getenv("SIMTS_TOKEN_SECRET", "")
+TOKEN_TTL_HOURS = float(os.getenv("SIMTS_TOKEN_TTL_HOURS", "12"))
+# Sin SIMTS_TOKEN_SECRET, `init_secret` guarda un secreto generado con este nombre
+# junto a la base: lo comparten los workers y sobrevive a reinicios y redeploys
+SECRET_FILENAME = ".simts_token_secret"
+
+# Provisorio hasta `init_secret` (p. ej. en tests que no ejecutan `lifespan`)
+_secret = (TOKEN_SECRET or secrets.token_hex(32)).encode("utf-8")
+
+
+def init_secret(db_path: str):
+    """Fija el secreto de firma: `SIMTS_TOKEN_SECRET` o, si no está configurado, el
+    guardado en `SECRET_FILENAME` junto a `db_path`, que se crea la primera vez."""
+    global _secret
+    if TOKEN_SECRET:
+        return
+    path = os.path.join(os.path.dirname(os.path.abspath(db_path)), SECRET_FILENAME)
+    if not os.path.exists(path):
+        # Se escribe aparte y se enlaza: si dos workers arrancan a la vez gana uno
+        # y el otro lee un archivo ya completo
+        tmp = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="ascii") as f:
+            f.write(secrets.token_hex(32))
+        try:
+            os.link(tmp, path)
+            logger.warning(f"SIMTS_TOKEN_SECRET no configurado: se generó un secreto en {path}")
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp)
+    with open(path, encoding="ascii") as f:
+        _secret = f.read().strip().encode("ascii")
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(_secret, payload.encode("ascii"), hashlib.sha256).digest())
+
+
+def issue_token(student: Dict, ttl_hours: float = TOKEN_TTL_HOURS) -> str:
+    """Token firmado para `student` (dict con `id`)."""
+    claims = {"sid": student["id"], "exp": int(time.time() + ttl_hours * 3600)}
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+    return f"{payload}.{_sign(payload)}"
+
+
+def verify_token(token: str) -> Optional[Dict]:
+    """Devuelve los claims si la firma es válida y el token no venció."""
+    payload, _, signature = token.partition(".")
+    try:
+        # Se comparan bytes: con texto no ASCII `_sign` y `compare_digest` lanzan excepciones
+        if not payload or not hmac.compare_digest(signature.encode("utf-8"), _sign(payload).encode("ascii")):
+            return None
+        claims = json.loads(_b64decode(payload))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(claims, dict) or claims.get("exp", 0) < time.time():
+        return None
+    return claims
+
+
+def _bearer_token(authorization: Optional[str]) -> Optional[str]:
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    return token.strip() if scheme.lower() == "bearer" and token.strip() else None
+
+
+async def optional_student(authorization: Optional[str] = Header(None)) -> Optional[int]:
+    """Dependencia: id del estudiante del token, o None si la petición no trae token."""
+    token = _bearer_token(authorization)
+    if token is None:
+        return None
+    claims = verify_token(token)
+    if claims is None:
+        raise HTTPException(status_code=401, detail="Token inválido o vencido")
+    return claims["sid"]
+
+
+async def current_student(authorization: Optional[str] = Header(None)) -> int:
+    """Dependencia: id del estudiante autenticado; 401 si no hay token válido."""
+    student_id = await optional_student(authorization)
+    if student_id is None:
+        raise HTTPException(status_code=401, detail="Se requiere iniciar sesión")
+    return student_id
+
+
+# Logins en curso por (db_path, usuario, hash de la contraseña). Los logins iguales
+# simultáneos comparten una consulta; el resultado no se guarda una vez terminada,
+# así que un cambio de contraseña o de estado rige desde el siguiente login.
+_inflight_logins: Dict[Tuple[str, str, str], asyncio.Future] = {}
+
+
+async def authenticate(db_path: str, username: str, password: str) -> Optional[Dict]:
+    """`db.authenticate_student`, agrupando los logins iguales que llegan a la vez."""
+    # La clave no guarda la contraseña en claro
+    key = (db_path, username, hashlib.sha256(password.encode()).hexdigest())
+    task = _inflight_logins.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_adb.authenticate_student(db_path, username, password))
+        _inflight_logins[key] = task
+        task.add_done_callback(lambda _: _inflight_logins.pop(key, None))
+    # shield: si se cancela una petición, las demás siguen esperando la misma consulta
+    student = await asyncio.shield(task)
+    return dict(student) if student else None
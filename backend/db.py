@@ -1,123 +1,487 @@
 import sqlite3
 import json
 import os
-from typing import Optional, List, Dict
+import queue
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Optional, List, Dict, Tuple
 from datetime import datetime
 
+import sqltrace as _sqltrace
 
-def init_db(db_path: str):
-    os.makedirs(os.path.dirname(db_path), exist_ok=True)
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-    
+
+# ===== Gestión de conexiones =====
+
+# Parámetros de SQLite aplicados a cada conexión nueva (configurables por entorno)
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SIMTS_SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SIMTS_SQLITE_CACHE_SIZE_KB", "20000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SIMTS_SQLITE_MMAP_SIZE", str(128 * 1024 * 1024)))
+
+
+class PooledConnection(sqlite3.Connection):
+    """Conexión reutilizada entre llamadas del mismo hilo.
+
+    `close()` no cierra el archivo: solo descarta una transacción pendiente para
+    que la próxima función reciba la conexión limpia. El cierre real lo hace
+    `shutdown()`: al terminar el hilo dueño o en `close_connections()` al apagar
+    la aplicación.
+    """
+
+    closed = False
+
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+
+    def shutdown(self):
+        self.closed = True
+        super().close()
+
+
+class TracedConnection(PooledConnection):
+    """Conexión con trazado de sentencias (`SIMTS_SQL_TRACE`, ver `sqltrace.py`)."""
+
+    vm_steps = 0
+
+    def _count_steps(self):
+        self.vm_steps += 1
+        return 0
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or _sqltrace.TracingCursor)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+# Una conexión por (hilo, db_path): `_local.connections` es db_path -> conexión del
+# hilo actual y `_open` reúne las de todos los hilos para cerrarlas al apagar
+_local = threading.local()
+_open: set = set()
+_connections_lock = threading.Lock()
+
+
+class _ThreadReaper:
+    """Vive en `_local` del hilo; al terminar el hilo se recolecta y su finalizador
+    cierra las conexiones que abrió (p. ej. hilos de `asyncio.to_thread` o de un
+    servidor de pruebas)."""
+
+    __slots__ = ("__weakref__",)
+
+
+def _release_thread(connections: Dict[str, PooledConnection]):
+    with _connections_lock:
+        conns = list(connections.values())
+        connections.clear()
+        _open.difference_update(conns)
+    for conn in conns:
+        try:
+            conn.shutdown()
+        except sqlite3.Error:
+            pass
+
+
+def _open_connection(db_path: str) -> PooledConnection:
+    conn = sqlite3.connect(
+        db_path,
+        timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+        factory=TracedConnection if _sqltrace.SQL_TRACE else PooledConnection,
+        check_same_thread=False,
+    )
+    if isinstance(conn, TracedConnection):
+        conn.set_progress_handler(conn._count_steps, _sqltrace.PROGRESS_STEPS)
+    # WAL: los lectores no bloquean al escritor ni viceversa
+    conn.execute("PRAGMA journal_mode=WAL")
+    # En WAL, NORMAL es seguro ante caídas del proceso y evita un fsync por commit
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def _connect(db_path: str) -> PooledConnection:
+    """Devuelve la conexión del hilo actual para `db_path`, abriéndola si no existe."""
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+        _local.reaper = _ThreadReaper()
+        weakref.finalize(_local.reaper, _release_thread, connections)
+    conn = connections.get(db_path)
+    if conn is None or conn.closed:
+        conn = _open_connection(db_path)
+        connections[db_path] = conn
+        with _connections_lock:
+            _open.add(conn)
+    elif conn.in_transaction:
+        # Una llamada anterior falló a mitad de transacción
+        conn.rollback()
+    return conn
+
+
+def close_connections():
+    """Detiene los escritores y cierra todas las conexiones abiertas (hook de apagado de la app)."""
+    stop_writers()
+    with _connections_lock:
+        conns = list(_open)
+        _open.clear()
+    for conn in conns:
+        try:
+            conn.shutdown()
+        except sqlite3.Error:
+            pass
+
+
+# ===== Migraciones de esquema =====
+
+def _add_column_if_missing(cur, table: str, column: str, definition: str):
+    cur.execute(f"PRAGMA table_info({table})")
+    if column not in {row[1] for row in cur.fetchall()}:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _migration_001_base_schema(cur):
+    """Esquema base. Completa las columnas de `cases` en bases creadas antes de
+    que existieran las migraciones versionadas."""
     # Tabla de casos
     cur.execute("""
-    CREATE TABLE IF NOT EXISTS cases (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        case_id TEXT,
-        title TEXT,
-        theme TEXT,
-        difficulty TEXT,
-        payload TEXT,
-        created_at TEXT,
-        updated_at TEXT,
-        status TEXT DEFAULT 'active',
-        rating INTEGER DEFAULT 0,
-        tags TEXT,
-        notes TEXT
-    )
+        CREATE TABLE IF NOT EXISTS cases (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            case_id TEXT,
+            title TEXT,
+            theme TEXT,
+            difficulty TEXT,
+            payload TEXT,
+            created_at TEXT,
+            updated_at TEXT,
+            status TEXT DEFAULT 'active',
+            rating INTEGER DEFAULT 0,
+            tags TEXT,
+            notes TEXT
+        )
     """)
-    
+
     # Tabla de colecciones
     cur.execute("""
-    CREATE TABLE IF NOT EXISTS collections (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        description TEXT,
-        created_at TEXT,
-        updated_at TEXT,
-        status TEXT DEFAULT 'active'
-    )
+        CREATE TABLE IF NOT EXISTS collections (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT,
+            created_at TEXT,
+            updated_at TEXT,
+            status TEXT DEFAULT 'active'
+        )
     """)
-    
+
     # Tabla de relación casos-colecciones (muchos a muchos)
     cur.execute("""
-    CREATE TABLE IF NOT EXISTS collection_cases (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        collection_id INTEGER NOT NULL,
-        case_id INTEGER NOT NULL,
-        added_at TEXT,
-        FOREIGN KEY (collection_id) REFERENCES collections(id),
-        FOREIGN KEY (case_id) REFERENCES cases(id),
-        UNIQUE(collection_id, case_id)
-    )
+        CREATE TABLE IF NOT EXISTS collection_cases (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            collection_id INTEGER NOT NULL,
+            case_id INTEGER NOT NULL,
+            added_at TEXT,
+            FOREIGN KEY (collection_id) REFERENCES collections(id),
+            FOREIGN KEY (case_id) REFERENCES cases(id),
+            UNIQUE(collection_id, case_id)
+        )
     """)
-    
+
     # Tabla de estudiantes
     cur.execute("""
-    CREATE TABLE IF NOT EXISTS students (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password_hash TEXT NOT NULL,
-        name TEXT,
-        email TEXT,
-        created_at TEXT,
-        status TEXT DEFAULT 'active'
-    )
+        CREATE TABLE IF NOT EXISTS students (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            name TEXT,
+            email TEXT,
+            created_at TEXT,
+            status TEXT DEFAULT 'active'
+        )
     """)
-    
+
     # Tabla de sesiones de estudiantes (cada vez que trabajan con un caso)
     cur.execute("""
-    CREATE TABLE IF NOT EXISTS student_sessions (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        student_id INTEGER NOT NULL,
-        case_id INTEGER NOT NULL,
-        created_at TEXT,
-        submitted_at TEXT,
-        duration_seconds INTEGER,
-        FOREIGN KEY (student_id) REFERENCES students(id),
-        FOREIGN KEY (case_id) REFERENCES cases(id)
-    )
+        CREATE TABLE IF NOT EXISTS student_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id INTEGER NOT NULL,
+            case_id INTEGER NOT NULL,
+            created_at TEXT,
+            submitted_at TEXT,
+            duration_seconds INTEGER,
+            FOREIGN KEY (student_id) REFERENCES students(id),
+            FOREIGN KEY (case_id) REFERENCES cases(id)
+        )
     """)
-    
+
     # Tabla de respuestas (alternativas y abiertas)
     cur.execute("""
-    CREATE TABLE IF NOT EXISTS student_answers (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        session_id INTEGER NOT NULL,
-        question_index INTEGER NOT NULL,
-        selected_option INTEGER,
-        open_answer TEXT,
-        is_correct INTEGER,
-        feedback TEXT,
-        score REAL,
-        created_at TEXT,
-        FOREIGN KEY (session_id) REFERENCES student_sessions(id)
-    )
+        CREATE TABLE IF NOT EXISTS student_answers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id INTEGER NOT NULL,
+            question_index INTEGER NOT NULL,
+            selected_option INTEGER,
+            open_answer TEXT,
+            is_correct INTEGER,
+            feedback TEXT,
+            score REAL,
+            created_at TEXT,
+            FOREIGN KEY (session_id) REFERENCES student_sessions(id)
+        )
     """)
-    
-    # Migración: agregar columnas si no existen
-    try:
-        cur.execute("ALTER TABLE cases ADD COLUMN updated_at TEXT")
-    except sqlite3.OperationalError:
-        pass
-    try:
-        cur.execute("ALTER TABLE cases ADD COLUMN status TEXT DEFAULT 'active'")
-    except sqlite3.OperationalError:
-        pass
-    try:
-        cur.execute("ALTER TABLE cases ADD COLUMN rating INTEGER DEFAULT 0")
-    except sqlite3.OperationalError:
-        pass
+
+    for column, definition in (
+        ("updated_at", "TEXT"),
+        ("status", "TEXT DEFAULT 'active'"),
+        ("rating", "INTEGER DEFAULT 0"),
+        ("tags", "TEXT"),
+        ("notes", "TEXT"),
+    ):
+        _add_column_if_missing(cur, "cases", column, definition)
+
+
+def _migration_002_cases_created_by(cur):
+    """Autor del caso (filtro `created_by` de `list_cases`)."""
+    _add_column_if_missing(cur, "cases", "created_by", "INTEGER")
+
+
+def _migration_003_indexes(cur):
+    """Índices para los filtros y ordenamientos de las consultas frecuentes."""
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_cases_theme_difficulty_status ON cases(theme, difficulty, status)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_cases_status ON cases(status)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_cases_created_by ON cases(created_by)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_collection_cases_case ON collection_cases(case_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_student_sessions_student ON student_sessions(student_id, created_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_student_sessions_case ON student_sessions(case_id, created_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_student_sessions_created ON student_sessions(created_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_student_answers_session ON student_answers(session_id, question_index)")
+
+
+def _migration_004_cases_generation_key(cur):
+    """Clave de los parámetros con que se generó el caso (reutilización de casos recientes)."""
+    _add_column_if_missing(cur, "cases", "generation_key", "TEXT")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_cases_generation_key ON cases(generation_key, id)")
+
+
+def _migration_005_case_pool(cur):
+    """Pool de casos pregenerados aún no entregados, por clave de generación."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS case_pool (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            generation_key TEXT NOT NULL,
+            params TEXT,
+            payload TEXT NOT NULL,
+            generation_seconds REAL,
+            created_at TEXT
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_case_pool_key ON case_pool(generation_key, id)")
+
+
+def _stats_delta_sql(row: str, sign: str) -> str:
+    """Sentencias de trigger que suman (`sign="+"`) o restan la contribución de
+    la fila `row` (NEW u OLD) a las tablas de estadísticas."""
+    rating_sum = f"{sign}(CASE WHEN {row}.rating > 0 THEN {row}.rating ELSE 0 END)"
+    rating_count = f"{sign}(CASE WHEN {row}.rating > 0 THEN 1 ELSE 0 END)"
+    statements = []
+    for dimension, value in (("total", "''"), ("theme", f"IFNULL({row}.theme, '')"), ("difficulty", f"IFNULL({row}.difficulty, '')")):
+        statements.append(f"""
+            INSERT INTO case_stats (dimension, value, case_count, rating_sum, rating_count)
+            VALUES ('{dimension}', {value}, {sign}1, {rating_sum}, {rating_count})
+            ON CONFLICT(dimension, value) DO UPDATE SET
+                case_count = case_count + excluded.case_count,
+                rating_sum = rating_sum + excluded.rating_sum,
+                rating_count = rating_count + excluded.rating_count;""")
+    statements.append(f"""
+            INSERT INTO case_daily_counts (day, case_count)
+            VALUES (IFNULL(substr({row}.created_at, 1, 10), ''), {sign}1)
+            ON CONFLICT(day) DO UPDATE SET case_count = case_count + excluded.case_count;""")
+    return "".join(statements)
+
+
+def _migration_006_case_statistics(cur):
+    """Estadísticas de casos mantenidas por triggers: conteos por tema y dificultad,
+    sumas de rating y casos creados por día. Solo cuentan casos no eliminados."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS case_stats (
+            dimension TEXT NOT NULL,
+            value TEXT NOT NULL,
+            case_count INTEGER NOT NULL DEFAULT 0,
+            rating_sum INTEGER NOT NULL DEFAULT 0,
+            rating_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (dimension, value)
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS case_daily_counts (
+            day TEXT PRIMARY KEY,
+            case_count INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS cases_stats_insert AFTER INSERT ON cases
+        WHEN NEW.status != 'deleted'
+        BEGIN{_stats_delta_sql("NEW", "+")}
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS cases_stats_delete AFTER DELETE ON cases
+        WHEN OLD.status != 'deleted'
+        BEGIN{_stats_delta_sql("OLD", "-")}
+        END
+    """)
+    # Una actualización resta la contribución anterior y suma la nueva (el soft
+    # delete solo resta)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS cases_stats_update_old AFTER UPDATE OF status, theme, difficulty, rating, created_at ON cases
+        WHEN OLD.status != 'deleted'
+        BEGIN{_stats_delta_sql("OLD", "-")}
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS cases_stats_update_new AFTER UPDATE OF status, theme, difficulty, rating, created_at ON cases
+        WHEN NEW.status != 'deleted'
+        BEGIN{_stats_delta_sql("NEW", "+")}
+        END
+    """)
+
+    # Carga inicial desde los casos existentes
+    cur.execute("DELETE FROM case_stats")
+    cur.execute("DELETE FROM case_daily_counts")
+    for dimension, expression in (("total", "''"), ("theme", "IFNULL(theme, '')"), ("difficulty", "IFNULL(difficulty, '')")):
+        cur.execute(f"""
+            INSERT INTO case_stats (dimension, value, case_count, rating_sum, rating_count)
+            SELECT '{dimension}', {expression}, COUNT(*),
+                   SUM(CASE WHEN rating > 0 THEN rating ELSE 0 END),
+                   SUM(CASE WHEN rating > 0 THEN 1 ELSE 0 END)
+            FROM cases WHERE status != 'deleted'
+            GROUP BY {expression}
+        """)
+    cur.execute("""
+        INSERT INTO case_daily_counts (day, case_count)
+        SELECT IFNULL(substr(created_at, 1, 10), ''), COUNT(*)
+        FROM cases WHERE status != 'deleted'
+        GROUP BY IFNULL(substr(created_at, 1, 10), '')
+    """)
+
+
+# Casos por bloque al llenar `cases_fts` con los casos existentes
+FTS_BACKFILL_BATCH = 500
+
+
+def _create_cases_fts(cur) -> bool:
+    """Crea `cases_fts` y la llena con los casos existentes, por bloques de
+    `FTS_BACKFILL_BATCH`. Devuelve False (sin crear nada) si el SQLite del sistema
+    no trae FTS5."""
     try:
-        cur.execute("ALTER TABLE cases ADD COLUMN tags TEXT")
+        cur.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS cases_fts USING fts5(
+                title, notes, tags, narrative,
+                tokenize = 'unicode61 remove_diacritics 2'
+            )
+        """)
     except sqlite3.OperationalError:
-        pass
+        return False
+    cur.execute("DELETE FROM cases_fts")
+    # Cursor aparte: `cur` se usa para insertar mientras se recorren los casos
+    read = cur.connection.cursor()
+    read.execute("SELECT id, title, notes, tags, payload FROM cases ORDER BY id")
+    while True:
+        rows = read.fetchmany(FTS_BACKFILL_BATCH)
+        if not rows:
+            break
+        cur.executemany(
+            "INSERT INTO cases_fts (rowid, title, notes, tags, narrative) VALUES (?,?,?,?,?)",
+            [_fts_row(row[0], row[1], row[2], row[3], row[4]) for row in rows]
+        )
+    read.close()
+    return True
+
+
+def _migration_007_cases_fts(cur):
+    """Índice de texto completo (FTS5) sobre título, notas, tags y relato del caso.
+
+    Si el SQLite del sistema no trae FTS5 la migración no crea nada y la búsqueda
+    queda deshabilitada; `migrate` vuelve a intentarlo en cada arranque, así que la
+    tabla se crea cuando la base se abra con un SQLite que sí lo traiga.
+    """
+    _create_cases_fts(cur)
+
+
+def _migration_008_cases_case_id_index(cur):
+    """Índice por `case_id` para deduplicar importaciones."""
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_cases_case_id ON cases(case_id)")
+
+
+# (versión, migración, ejecutar ANALYZE al terminar). Nunca reordenar ni editar
+# una migración ya publicada: agregar una nueva con el siguiente número.
+MIGRATIONS = [
+    (1, _migration_001_base_schema, False),
+    (2, _migration_002_cases_created_by, False),
+    (3, _migration_003_indexes, True),
+    (4, _migration_004_cases_generation_key, False),
+    (5, _migration_005_case_pool, False),
+    (6, _migration_006_case_statistics, False),
+    (7, _migration_007_cases_fts, False),
+    (8, _migration_008_cases_case_id_index, True),
+]
+
+
+def migrate(db_path: str) -> int:
+    """Aplica las migraciones pendientes según `PRAGMA user_version` y devuelve la versión final."""
+    conn = _connect(db_path)
+    cur = conn.cursor()
+    needs_analyze = False
+    for version, migration, analyze in MIGRATIONS:
+        # BEGIN IMMEDIATE toma el lock de escritura antes de leer la versión, así
+        # dos procesos que arrancan a la vez no aplican la misma migración
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            current = cur.execute("PRAGMA user_version").fetchone()[0]
+            if version <= current:
+                conn.rollback()
+                continue
+            migration(cur)
+            cur.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        needs_analyze = needs_analyze or analyze
+    if needs_analyze:
+        cur.execute("ANALYZE")
+        conn.commit()
+    # cases_fts es opcional: si la migración 7 corrió con un SQLite sin FTS5, la
+    # versión quedó registrada igual y la tabla se crea aquí en cuanto se pueda
+    cur.execute("BEGIN IMMEDIATE")
     try:
-        cur.execute("ALTER TABLE cases ADD COLUMN notes TEXT")
-    except sqlite3.OperationalError:
-        pass
-    conn.commit()
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'cases_fts'")
+        if cur.fetchone() is None:
+            _create_cases_fts(cur)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    # Las migraciones pueden crear tablas opcionales (p. ej. cases_fts)
+    _fts_tables.pop(db_path, None)
+    version = cur.execute("PRAGMA user_version").fetchone()[0]
+    conn.close()
+    return version
+
+
+def init_db(db_path: str):
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    migrate(db_path)
+    conn = _connect(db_path)
+    cur = conn.cursor()
     
     # Insertar estudiante de prueba si no existe
     cur.execute("SELECT COUNT(*) FROM students WHERE username = ?", ("estudiante1",))
@@ -134,32 +498,15 @@ def init_db(db_path: str):
     conn.close()
 
 
-def _connect(db_path: str):
-    return sqlite3.connect(db_path)
+# ===== Caché de casos decodificados =====
 
+CASE_CACHE_SIZE = int(os.getenv("SIMTS_CASE_CACHE_SIZE", "256"))
 
-def save_case(db_path: str, case_obj: Dict) -> Dict:
-    """Guarda el case_obj (dict) como JSON en la DB y devuelve el registro guardado."""
-    conn = _connect(db_path)
-    cur = conn.cursor()
-    case_id = case_obj.get("case_id") or case_obj.get("id") or case_obj.get("title")
-    title = case_obj.get("title") or case_obj.get("case_id") or None
-    theme = case_obj.get("eje") or case_obj.get("theme") or None
-    difficulty = case_obj.get("nivel") or case_obj.get("difficulty") or None
-    payload = json.dumps(case_obj, ensure_ascii=False)
-    created_at = datetime.utcnow().isoformat()
-    updated_at = created_at
-    cur.execute(
-        "INSERT INTO cases (case_id, title, theme, difficulty, payload, created_at, updated_at, status, rating) VALUES (?,?,?,?,?,?,?,?,?)",
-        (case_id, title, theme, difficulty, payload, created_at, updated_at, "active", 0),
-    )
-    conn.commit()
-    rowid = cur.lastrowid
-    cur.execute("SELECT id, case_id, title, theme, difficulty, payload, created_at, updated_at, status, rating, tags, notes FROM cases WHERE id = ?", (rowid,))
-    row = cur.fetchone()
-    conn.close()
-    if not row:
-        return {}
+_CASE_COLUMNS = "id, case_id, title, theme, difficulty, payload, created_at, updated_at, status, rating, tags, notes"
+
+
+def _case_from_row(row) -> Dict:
+    """Convierte una fila con las columnas de `_CASE_COLUMNS` en el dict de caso."""
     return {
         "id": row[0],
         "case_id": row[1],
@@ -169,17 +516,392 @@ def save_case(db_path: str, case_obj: Dict) -> Dict:
         "payload": json.loads(row[5]) if row[5] else None,
         "created_at": row[6],
         "updated_at": row[7],
-        "status": row[8],
-        "rating": row[9],
+        "status": row[8] or "active",
+        "rating": row[9] or 0,
         "tags": json.loads(row[10]) if row[10] else [],
         "notes": row[11],
     }
 
 
-def list_cases(db_path: str, theme: Optional[str] = None, difficulty: Optional[str] = None, limit: int = 50, status: Optional[str] = None, created_by: Optional[int] = None) -> List[Dict]:
+class CaseCache:
+    """LRU acotado de casos ya decodificados.
+
+    Las entradas se indexan por (db_path, id) y solo son válidas si `updated_at`
+    coincide con el de la fila actual. Los casos devueltos comparten el `payload`
+    con la caché: tratarlos como solo lectura.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Tuple[str, int], Tuple[Optional[str], Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, db_path: str, case_id: int, updated_at: Optional[str]) -> Optional[Dict]:
+        key = (db_path, case_id)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] != updated_at:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return dict(entry[1])
+
+    def put(self, db_path: str, case: Dict):
+        if self.maxsize <= 0:
+            return
+        key = (db_path, case["id"])
+        with self._lock:
+            self._data[key] = (case["updated_at"], case)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, db_path: str, case_id: int):
+        with self._lock:
+            self._data.pop((db_path, case_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+_case_cache = CaseCache(CASE_CACHE_SIZE)
+
+
+def case_cache_stats() -> Dict:
+    """Contadores de la caché de casos (hits, misses, evictions, tamaño)."""
+    return _case_cache.stats()
+
+
+def _get_cases_cached(cur, db_path: str, case_ids: List[int]) -> Dict[int, Dict]:
+    """Obtiene varios casos usando la caché; solo lee y decodifica el payload de los que no están vigentes."""
+    found: Dict[int, Dict] = {}
+    missing: List[int] = []
+    for chunk in _chunks(case_ids):
+        placeholders = ",".join("?" * len(chunk))
+        cur.execute(f"SELECT id, updated_at FROM cases WHERE id IN ({placeholders})", chunk)
+        for cid, updated_at in cur.fetchall():
+            cached = _case_cache.get(db_path, cid, updated_at)
+            if cached is None:
+                missing.append(cid)
+            else:
+                found[cid] = cached
+    for chunk in _chunks(missing):
+        placeholders = ",".join("?" * len(chunk))
+        cur.execute(f"SELECT {_CASE_COLUMNS} FROM cases WHERE id IN ({placeholders})", chunk)
+        for row in cur.fetchall():
+            case = _case_from_row(row)
+            _case_cache.put(db_path, case)
+            found[case["id"]] = dict(case)
+    return found
+
+
+# ===== Búsqueda de texto completo =====
+
+# Claves del payload que contienen el relato del caso
+_NARRATIVE_KEYS = ("text", "description", "meta")
+
+# db_path -> existe la tabla cases_fts
+_fts_tables: Dict[str, bool] = {}
+
+
+def _fts_row(case_id: int, title: Optional[str], notes: Optional[str], tags, payload) -> Tuple:
+    """Fila de `cases_fts` para un caso; `tags` y `payload` pueden venir como JSON o ya decodificados."""
+    if isinstance(tags, str):
+        tags = json.loads(tags) if tags else []
+    if isinstance(payload, str):
+        payload = json.loads(payload) if payload else None
+    narrative = ""
+    if isinstance(payload, dict):
+        narrative = "\n".join(payload[k] for k in _NARRATIVE_KEYS if isinstance(payload.get(k), str))
+    return (case_id, title or "", notes or "", " ".join(str(t) for t in tags or []), narrative)
+
+
+def _fts_enabled(cur, db_path: str) -> bool:
+    enabled = _fts_tables.get(db_path)
+    if enabled is None:
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'cases_fts'")
+        enabled = _fts_tables[db_path] = cur.fetchone() is not None
+    return enabled
+
+
+def _fts_index(cur, db_path: str, rows: List[Tuple]):
+    """(Re)indexa filas de `_fts_row` dentro de la transacción del llamador."""
+    if not rows or not _fts_enabled(cur, db_path):
+        return
+    cur.executemany("DELETE FROM cases_fts WHERE rowid = ?", [(row[0],) for row in rows])
+    cur.executemany("INSERT INTO cases_fts (rowid, title, notes, tags, narrative) VALUES (?,?,?,?,?)", rows)
+
+
+def _fts_query(q: str) -> str:
+    """Convierte texto libre en una consulta FTS5 segura: todas las palabras, por prefijo."""
+    return " ".join(f'"{token}"*' for token in re.findall(r"\w+", q))
+
+
+def search_cases(db_path: str, q: str, limit: int = 20, offset: int = 0, status: Optional[str] = "active") -> List[Dict]:
+    """Busca casos por texto completo, ordenados por relevancia (bm25), con un
+    fragmento resaltado con <mark>. Devuelve resúmenes sin payload."""
+    match = _fts_query(q)
+    if not match:
+        return []
+    conn = _connect(db_path)
+    cur = conn.cursor()
+    if not _fts_enabled(cur, db_path):
+        conn.close()
+        raise RuntimeError("La búsqueda de texto completo no está disponible (SQLite sin FTS5)")
+    query = """
+        SELECT c.id, c.case_id, c.title, c.theme, c.difficulty, c.created_at, c.updated_at, c.status, c.rating, c.tags, c.notes,
+               snippet(cases_fts, -1, '<mark>', '</mark>', '…', 24),
+               bm25(cases_fts, 10.0, 2.0, 4.0, 1.0) AS score
+        FROM cases_fts
+        JOIN cases c ON c.id = cases_fts.rowid
+        WHERE cases_fts MATCH ?
+    """
+    params: List = [match]
+    if status:
+        query += " AND c.status = ?"
+        params.append(status)
+    query += " ORDER BY score LIMIT ? OFFSET ?"
+    params.extend([limit, offset])
+    cur.execute(query, params)
+    rows = cur.fetchall()
+    conn.close()
+    return [
+        {
+            "id": r[0],
+            "case_id": r[1],
+            "title": r[2],
+            "theme": r[3],
+            "difficulty": r[4],
+            "created_at": r[5],
+            "updated_at": r[6],
+            "status": r[7] or "active",
+            "rating": r[8] or 0,
+            "tags": json.loads(r[9]) if r[9] else [],
+            "notes": r[10],
+            "snippet": r[11],
+            "score": round(-r[12], 4),
+        }
+        for r in rows
+    ]
+
+
+_CASE_INSERT_SQL = "INSERT INTO cases (case_id, title, theme, difficulty, payload, created_at, updated_at, status, rating, created_by, generation_key) VALUES (?,?,?,?,?,?,?,?,?,?,?)"
+
+
+def _case_insert_params(case_obj: Dict, created_at: str, created_by: Optional[int] = None, generation_key: Optional[str] = None) -> Tuple:
+    """Parámetros de `_CASE_INSERT_SQL` derivados del case_obj."""
+    case_id = case_obj.get("case_id") or case_obj.get("id") or case_obj.get("title")
+    title = case_obj.get("title") or case_obj.get("case_id") or None
+    theme = case_obj.get("eje") or case_obj.get("theme") or None
+    difficulty = case_obj.get("nivel") or case_obj.get("difficulty") or None
+    payload = json.dumps(case_obj, ensure_ascii=False)
+    return (case_id, title, theme, difficulty, payload, created_at, created_at, "active", 0, created_by, generation_key)
+
+
+def save_case(db_path: str, case_obj: Dict, created_by: Optional[int] = None, generation_key: Optional[str] = None) -> Dict:
+    """Guarda el case_obj (dict) como JSON en la DB y devuelve el registro guardado."""
     conn = _connect(db_path)
     cur = conn.cursor()
-    query = "SELECT id, case_id, title, theme, difficulty, payload, created_at, updated_at, status, rating, tags, notes FROM cases"
+    created_at = datetime.utcnow().isoformat()
+    params = _case_insert_params(case_obj, created_at, created_by, generation_key)
+    cur.execute(_CASE_INSERT_SQL, params)
+    rowid = cur.lastrowid
+    _fts_index(cur, db_path, [_fts_row(rowid, params[1], None, None, case_obj)])
+    conn.commit()
+    _case_cache.invalidate(db_path, rowid)
+    cur.execute(f"SELECT {_CASE_COLUMNS} FROM cases WHERE id = ?", (rowid,))
+    row = cur.fetchone()
+    conn.close()
+    return _case_from_row(row) if row else {}
+
+
+def save_cases_bulk(db_path: str, case_objs: List[Dict], generation_keys: Optional[List[Optional[str]]] = None, collection_id: Optional[int] = None) -> List[Dict]:
+    """Guarda varios casos (y opcionalmente los agrega a una colección) en una sola
+    transacción. Devuelve el resumen de cada caso guardado, sin payload."""
+    if not case_objs:
+        return []
+    keys = generation_keys or [None] * len(case_objs)
+    conn = _connect(db_path)
+    cur = conn.cursor()
+    created_at = datetime.utcnow().isoformat()
+    saved = []
+    fts_rows = []
+    try:
+        for case_obj, key in zip(case_objs, keys):
+            params = _case_insert_params(case_obj, created_at, generation_key=key)
+            cur.execute(_CASE_INSERT_SQL, params)
+            fts_rows.append(_fts_row(cur.lastrowid, params[1], None, None, case_obj))
+            saved.append({
+                "id": cur.lastrowid,
+                "case_id": params[0],
+                "title": params[1],
+                "theme": params[2],
+                "difficulty": params[3],
+                "created_at": created_at,
+                "updated_at": created_at,
+                "status": "active",
+                "rating": 0,
+                "tags": [],
+                "notes": None,
+            })
+        _fts_index(cur, db_path, fts_rows)
+        if collection_id is not None:
+            cur.executemany(
+                "INSERT OR IGNORE INTO collection_cases (collection_id, case_id, added_at) VALUES (?,?,?)",
+                [(collection_id, item["id"], created_at) for item in saved]
+            )
+            cur.execute("UPDATE collections SET updated_at = ? WHERE id = ?", (created_at, collection_id))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    conn.close()
+    return saved
+
+
+# Columnas exportadas, en orden; `payload` va al final y se copia tal cual está guardado
+_EXPORT_COLUMNS = ("id", "case_id", "title", "theme", "difficulty", "created_at", "updated_at", "status", "rating", "tags", "notes", "created_by")
+EXPORT_BATCH_SIZE = 500
+IMPORT_BATCH_SIZE = int(os.getenv("SIMTS_IMPORT_BATCH_SIZE", "1000"))
+
+
+def iter_cases_export(db_path: str, status: Optional[str] = None, batch_size: int = EXPORT_BATCH_SIZE):
+    """Genera bloques de líneas NDJSON con todos los casos, en orden de id.
+
+    Usa una conexión propia (no la del hilo) porque el generador se consume a
+    lo largo de varias llamadas, posiblemente desde hilos distintos; la consulta
+    se lee con `fetchmany`, así la memoria no depende del tamaño de la biblioteca.
+    """
+    conn = _open_connection(db_path)
+    try:
+        cur = conn.cursor()
+        query = f"SELECT {', '.join(_EXPORT_COLUMNS)}, payload FROM cases"
+        params = []
+        if status:
+            query += " WHERE status = ?"
+            params.append(status)
+        cur.execute(query + " ORDER BY id", params)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            lines = []
+            for row in rows:
+                item = dict(zip(_EXPORT_COLUMNS, row))
+                item["tags"] = json.loads(item["tags"]) if item["tags"] else []
+                # El payload ya es JSON: se inserta sin decodificarlo ni volver a serializarlo
+                lines.append(f'{json.dumps(item, ensure_ascii=False)[:-1]}, "payload": {row[-1] or "null"}}}\n')
+            yield "".join(lines)
+    finally:
+        conn.shutdown()
+
+
+def _import_params(record: Dict, case_id_value: int, now: str) -> Tuple:
+    """Parámetros de inserción para un registro exportado o un case_obj suelto."""
+    if isinstance(record.get("payload"), dict):
+        case_obj = record["payload"]
+        meta = record
+    else:
+        case_obj, meta = record, {}
+    base = _case_insert_params(case_obj, meta.get("created_at") or now, meta.get("created_by"))
+    tags = meta.get("tags")
+    return (
+        case_id_value,
+        meta.get("case_id") or base[0],
+        meta.get("title") or base[1],
+        meta.get("theme") or base[2],
+        meta.get("difficulty") or base[3],
+        base[4],
+        base[5],
+        meta.get("updated_at") or base[5],
+        meta.get("status") or "active",
+        meta.get("rating") or 0,
+        json.dumps(tags, ensure_ascii=False) if tags else None,
+        meta.get("notes"),
+        base[9],
+    )
+
+
+def import_cases(db_path: str, records: List[Dict], dedupe: bool = True) -> Dict:
+    """Inserta un bloque de casos (formato de `iter_cases_export` o case_obj sueltos)
+    con `executemany` en una sola transacción.
+
+    Con `dedupe`, se omiten los casos cuyo `case_id` ya existe o se repite en el bloque.
+    Devuelve {"inserted", "skipped"}.
+    """
+    if not records:
+        return {"inserted": 0, "skipped": 0}
+    conn = _connect(db_path)
+    cur = conn.cursor()
+    now = datetime.utcnow().isoformat()
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        # Ids explícitos y contiguos: con el lock tomado nadie más inserta, y así
+        # el índice FTS recibe los rowid sin consultar caso por caso
+        cur.execute("SELECT MAX(COALESCE((SELECT MAX(id) FROM cases), 0), COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'cases'), 0))")
+        next_id = cur.fetchone()[0] + 1
+        rows = []
+        for record in records:
+            rows.append(_import_params(record, next_id + len(rows), now))
+        skipped = 0
+        if dedupe:
+            existing = set()
+            for chunk in _chunks([r[1] for r in rows if r[1] is not None]):
+                cur.execute(f"SELECT case_id FROM cases WHERE case_id IN ({','.join('?' * len(chunk))})", chunk)
+                existing.update(r[0] for r in cur.fetchall())
+            kept = []
+            for row in rows:
+                if row[1] is not None and row[1] in existing:
+                    continue
+                if row[1] is not None:
+                    existing.add(row[1])
+                kept.append((next_id + len(kept),) + row[1:])
+            skipped = len(rows) - len(kept)
+            rows = kept
+        cur.executemany(
+            "INSERT INTO cases (id, case_id, title, theme, difficulty, payload, created_at, updated_at, status, rating, tags, notes, created_by) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)",
+            rows
+        )
+        _fts_index(cur, db_path, [_fts_row(r[0], r[2], r[11], r[10], r[5]) for r in rows])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    conn.close()
+    return {"inserted": len(rows), "skipped": skipped}
+
+
+def list_cases(db_path: str, theme: Optional[str] = None, difficulty: Optional[str] = None, limit: int = 50, status: Optional[str] = None, created_by: Optional[int] = None, fields: str = "full", after_id: Optional[int] = None) -> List[Dict]:
+    """Lista casos ordenados por id descendente.
+
+    `fields="summary"` omite el `payload` (no se lee ni se decodifica).
+    `after_id` pagina por keyset: devuelve solo casos con id menor al indicado.
+    """
+    full = fields != "summary"
+    conn = _connect(db_path)
+    cur = conn.cursor()
+    columns = "id, case_id, title, theme, difficulty, created_at, updated_at, status, rating, tags, notes"
+    if full:
+        columns += ", payload"
+    query = f"SELECT {columns} FROM cases"
     params = []
     where = []
     if theme:
@@ -194,6 +916,9 @@ def list_cases(db_path: str, theme: Optional[str] = None, difficulty: Optional[s
     if created_by:
         where.append("created_by = ?")
         params.append(created_by)
+    if after_id is not None:
+        where.append("id < ?")
+        params.append(after_id)
     if where:
         query += " WHERE " + " AND ".join(where)
     query += " ORDER BY id DESC LIMIT ?"
@@ -203,48 +928,45 @@ def list_cases(db_path: str, theme: Optional[str] = None, difficulty: Optional[s
     conn.close()
     results = []
     for row in rows:
-        results.append(
-            {
-                "id": row[0],
-                "case_id": row[1],
-                "title": row[2],
-                "theme": row[3],
-                "difficulty": row[4],
-                "payload": json.loads(row[5]) if row[5] else None,
-                "created_at": row[6],
-                "updated_at": row[7],
-                "status": row[8] or "active",
-                "rating": row[9] or 0,
-                "tags": json.loads(row[10]) if row[10] else [],
-                "notes": row[11],
-            }
-        )
+        item = {
+            "id": row[0],
+            "case_id": row[1],
+            "title": row[2],
+            "theme": row[3],
+            "difficulty": row[4],
+            "created_at": row[5],
+            "updated_at": row[6],
+            "status": row[7] or "active",
+            "rating": row[8] or 0,
+            "tags": json.loads(row[9]) if row[9] else [],
+            "notes": row[10],
+        }
+        if full:
+            item["payload"] = json.loads(row[11]) if row[11] else None
+        results.append(item)
     return results
 
 
 def get_case(db_path: str, case_id: int) -> Optional[Dict]:
-    """Obtiene un caso específico por ID."""
+    """Obtiene un caso específico por ID (servido desde la caché si no cambió)."""
     conn = _connect(db_path)
     cur = conn.cursor()
-    cur.execute("SELECT id, case_id, title, theme, difficulty, payload, created_at, updated_at, status, rating, tags, notes FROM cases WHERE id = ?", (case_id,))
-    row = cur.fetchone()
+    case = _get_cases_cached(cur, db_path, [case_id]).get(case_id)
     conn.close()
-    if not row:
-        return None
-    return {
-        "id": row[0],
-        "case_id": row[1],
-        "title": row[2],
-        "theme": row[3],
-        "difficulty": row[4],
-        "payload": json.loads(row[5]) if row[5] else None,
-        "created_at": row[6],
-        "updated_at": row[7],
-        "status": row[8] or "active",
-        "rating": row[9] or 0,
-        "tags": json.loads(row[10]) if row[10] else [],
-        "notes": row[11],
-    }
+    return case
+
+
+def recent_generated_case_ids(db_path: str, generation_key: str, since: str, limit: int = 20) -> List[int]:
+    """Ids de casos activos generados con `generation_key` desde `since` (ISO), más recientes primero."""
+    conn = _connect(db_path)
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT id FROM cases WHERE generation_key = ? AND status = 'active' AND created_at >= ? ORDER BY id DESC LIMIT ?",
+        (generation_key, since, limit)
+    )
+    ids = [row[0] for row in cur.fetchall()]
+    conn.close()
+    return ids
 
 
 def update_case(db_path: str, case_id: int, updates: Dict) -> Optional[Dict]:
@@ -293,8 +1015,13 @@ def update_case(db_path: str, case_id: int, updates: Dict) -> Optional[Dict]:
     
     query = f"UPDATE cases SET {', '.join(set_clauses)} WHERE id = ?"
     cur.execute(query, params)
+    if cur.rowcount and any(field in updates for field in ("payload", "tags", "notes")):
+        cur.execute("SELECT id, title, notes, tags, payload FROM cases WHERE id = ?", (case_id,))
+        row = cur.fetchone()
+        _fts_index(cur, db_path, [_fts_row(*row)])
     conn.commit()
     conn.close()
+    _case_cache.invalidate(db_path, case_id)
     
     return get_case(db_path, case_id)
 
@@ -308,32 +1035,33 @@ def delete_case(db_path: str, case_id: int) -> bool:
     affected = cur.rowcount
     conn.commit()
     conn.close()
+    _case_cache.invalidate(db_path, case_id)
     return affected > 0
 
 
 def get_statistics(db_path: str) -> Dict:
-    """Obtiene estadísticas de los casos."""
+    """Obtiene estadísticas de los casos desde las tablas mantenidas por triggers."""
     conn = _connect(db_path)
     cur = conn.cursor()
     
-    # Total de casos
-    cur.execute("SELECT COUNT(*) FROM cases WHERE status != 'deleted'")
-    total = cur.fetchone()[0]
-    
-    # Por tema
-    cur.execute("SELECT theme, COUNT(*) FROM cases WHERE status != 'deleted' GROUP BY theme")
-    by_theme = {row[0]: row[1] for row in cur.fetchall()}
-    
-    # Por dificultad
-    cur.execute("SELECT difficulty, COUNT(*) FROM cases WHERE status != 'deleted' GROUP BY difficulty")
-    by_difficulty = {row[0]: row[1] for row in cur.fetchall()}
+    total = 0
+    by_theme = {}
+    by_difficulty = {}
+    rating_sum = rating_count = 0
+    cur.execute("SELECT dimension, value, case_count, rating_sum, rating_count FROM case_stats WHERE case_count > 0")
+    for dimension, value, count, r_sum, r_count in cur.fetchall():
+        if dimension == "total":
+            total, rating_sum, rating_count = count, r_sum, r_count
+        elif dimension == "theme":
+            by_theme[value or None] = count
+        elif dimension == "difficulty":
+            by_difficulty[value or None] = count
     
-    # Por rating promedio
-    cur.execute("SELECT AVG(rating) FROM cases WHERE status != 'deleted' AND rating > 0")
-    avg_rating = cur.fetchone()[0] or 0
+    # Por rating promedio (solo casos calificados)
+    avg_rating = rating_sum / rating_count if rating_count else 0
     
-    # Casos recientes (últimos 7 días)
-    cur.execute("SELECT COUNT(*) FROM cases WHERE status != 'deleted' AND created_at >= date('now', '-7 days')")
+    # Casos recientes (últimos 7 días), por fecha de creación (día UTC)
+    cur.execute("SELECT COALESCE(SUM(case_count), 0) FROM case_daily_counts WHERE day >= date('now', '-7 days')")
     recent = cur.fetchone()[0]
     
     conn.close()
@@ -347,6 +1075,62 @@ def get_statistics(db_path: str) -> Dict:
     }
 
 
+# ===== Pool de casos pregenerados =====
+
+def pool_add(db_path: str, generation_key: str, params: Dict, case_obj: Dict, generation_seconds: Optional[float] = None) -> int:
+    """Agrega un caso pregenerado al pool."""
+    conn = _connect(db_path)
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO case_pool (generation_key, params, payload, generation_seconds, created_at) VALUES (?,?,?,?,?)",
+        (generation_key, json.dumps(params, ensure_ascii=False), json.dumps(case_obj, ensure_ascii=False), generation_seconds, datetime.utcnow().isoformat())
+    )
+    conn.commit()
+    pool_id = cur.lastrowid
+    conn.close()
+    return pool_id
+
+
+def pool_take(db_path: str, generation_key: str) -> Optional[Dict]:
+    """Retira del pool el caso más antiguo para la clave y lo devuelve (None si no hay)."""
+    conn = _connect(db_path)
+    cur = conn.cursor()
+    # BEGIN IMMEDIATE: dos workers no pueden retirar el mismo caso
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        cur.execute(
+            "SELECT id, params, payload, generation_seconds, created_at FROM case_pool WHERE generation_key = ? ORDER BY id LIMIT 1",
+            (generation_key,)
+        )
+        row = cur.fetchone()
+        if row:
+            cur.execute("DELETE FROM case_pool WHERE id = ?", (row[0],))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    conn.close()
+    if not row:
+        return None
+    return {
+        "id": row[0],
+        "params": json.loads(row[1]) if row[1] else {},
+        "case": json.loads(row[2]),
+        "generation_seconds": row[3],
+        "created_at": row[4],
+    }
+
+
+def pool_depths(db_path: str) -> Dict[str, int]:
+    """Cantidad de casos disponibles en el pool por clave de generación."""
+    conn = _connect(db_path)
+    cur = conn.cursor()
+    cur.execute("SELECT generation_key, COUNT(*) FROM case_pool GROUP BY generation_key")
+    depths = {row[0]: row[1] for row in cur.fetchall()}
+    conn.close()
+    return depths
+
+
 # ===== Funciones de Colecciones =====
 
 def create_collection(db_path: str, name: str, description: str = "") -> Dict:
@@ -454,6 +1238,16 @@ def get_collection(db_path: str, collection_id: int) -> Optional[Dict]:
     return collection
 
 
+def collection_exists(db_path: str, collection_id: int) -> bool:
+    """Indica si existe una colección activa con ese id."""
+    conn = _connect(db_path)
+    cur = conn.cursor()
+    cur.execute("SELECT 1 FROM collections WHERE id = ? AND status = 'active'", (collection_id,))
+    exists = cur.fetchone() is not None
+    conn.close()
+    return exists
+
+
 def add_case_to_collection(db_path: str, collection_id: int, case_id: int) -> bool:
     """Agrega un caso a una colección."""
     conn = _connect(db_path)
@@ -568,47 +1362,102 @@ def authenticate_student(db_path: str, username: str, password: str) -> Optional
     }
 
 
-def create_session(db_path: str, student_id: int, case_id: int) -> int:
-    """Crea una sesión de estudiante para un caso y devuelve el session_id."""
-    conn = _connect(db_path)
-    cur = conn.cursor()
-    created_at = datetime.utcnow().isoformat()
+def _create_session_op(cur, student_id: int, case_id: int) -> int:
     cur.execute(
         "INSERT INTO student_sessions (student_id, case_id, created_at) VALUES (?,?,?)",
-        (student_id, case_id, created_at)
+        (student_id, case_id, datetime.utcnow().isoformat())
     )
-    conn.commit()
-    session_id = cur.lastrowid
-    conn.close()
-    return session_id
+    return cur.lastrowid
 
 
-def submit_session(db_path: str, session_id: int, duration_seconds: Optional[int] = None):
-    """Marca una sesión como enviada."""
-    conn = _connect(db_path)
-    cur = conn.cursor()
-    submitted_at = datetime.utcnow().isoformat()
+def _submit_session_op(cur, session_id: int, duration_seconds: Optional[int] = None) -> None:
     cur.execute(
         "UPDATE student_sessions SET submitted_at = ?, duration_seconds = ? WHERE id = ?",
-        (submitted_at, duration_seconds, session_id)
+        (datetime.utcnow().isoformat(), duration_seconds, session_id)
     )
-    conn.commit()
-    conn.close()
+
+
+def _save_answer_op(cur, session_id: int, question_index: int, selected_option: Optional[int], open_answer: Optional[str], is_correct: Optional[int] = None) -> int:
+    cur.execute(
+        "INSERT INTO student_answers (session_id, question_index, selected_option, open_answer, is_correct, created_at) VALUES (?,?,?,?,?,?)",
+        (session_id, question_index, selected_option, open_answer, is_correct, datetime.utcnow().isoformat())
+    )
+    return cur.lastrowid
+
+
+def create_session(db_path: str, student_id: int, case_id: int) -> int:
+    """Crea una sesión de estudiante para un caso y devuelve el session_id."""
+    return write(db_path, "create_session", student_id, case_id)
+
+
+def submit_session(db_path: str, session_id: int, duration_seconds: Optional[int] = None):
+    """Marca una sesión como enviada."""
+    write(db_path, "submit_session", session_id, duration_seconds)
 
 
 def save_answer(db_path: str, session_id: int, question_index: int, selected_option: Optional[int], open_answer: Optional[str], is_correct: Optional[int] = None) -> int:
     """Guarda una respuesta de estudiante."""
+    return write(db_path, "save_answer", session_id, question_index, selected_option, open_answer, is_correct)
+
+
+def _grade_answers(questions: List[Dict], answers: List[Dict]) -> Tuple[List[Tuple], int, int]:
+    """Corrige las respuestas de alternativas contra `questions`.
+
+    Devuelve las filas (question_index, selected_option, open_answer, is_correct),
+    el puntaje y el total de preguntas corregibles.
+    """
+    rows = []
+    score = 0
+    total = 0
+    for ans in answers:
+        q_idx = ans.get("question_index")
+        selected = ans.get("selected_option")
+        open_ans = ans.get("open_answer")
+
+        is_correct = None
+        if selected is not None and q_idx < len(questions):
+            q = questions[q_idx]
+            correct_idx = q.get("correct_index") or q.get("correctIndex")
+            if correct_idx is not None:
+                total += 1
+                is_correct = 1 if selected == correct_idx else 0
+                if is_correct:
+                    score += 1
+
+        rows.append((q_idx, selected, open_ans, is_correct))
+    return rows, score, total
+
+
+def grade_session(db_path: str, case_id: int, answers: List[Dict]) -> Tuple[List[Tuple], int, int]:
+    """Corrige `answers` contra las preguntas del caso (lectura, fuera del escritor)."""
     conn = _connect(db_path)
-    cur = conn.cursor()
-    created_at = datetime.utcnow().isoformat()
+    case = _get_cases_cached(conn.cursor(), db_path, [case_id]).get(case_id)
+    conn.close()
+    payload = case.get("payload") if case else None
+    questions = payload.get("questions", []) if isinstance(payload, dict) else []
+    return _grade_answers(questions, answers)
+
+
+def _insert_graded_session_op(cur, student_id: int, case_id: int, rows: List[Tuple], duration_seconds: Optional[int] = None) -> int:
+    now = datetime.utcnow().isoformat()
     cur.execute(
+        "INSERT INTO student_sessions (student_id, case_id, created_at, submitted_at, duration_seconds) VALUES (?,?,?,?,?)",
+        (student_id, case_id, now, now, duration_seconds)
+    )
+    session_id = cur.lastrowid
+    cur.executemany(
         "INSERT INTO student_answers (session_id, question_index, selected_option, open_answer, is_correct, created_at) VALUES (?,?,?,?,?,?)",
-        (session_id, question_index, selected_option, open_answer, is_correct, created_at)
+        [(session_id, q_idx, selected, open_ans, is_correct, now) for q_idx, selected, open_ans, is_correct in rows]
     )
-    conn.commit()
-    answer_id = cur.lastrowid
-    conn.close()
-    return answer_id
+    return session_id
+
+
+def submit_session_bulk(db_path: str, student_id: int, case_id: int, answers: List[Dict], duration_seconds: Optional[int] = None) -> Dict:
+    """Crea la sesión, guarda todas las respuestas corregidas y la marca como
+    enviada en una sola operación de escritura (un solo commit por envío)."""
+    rows, score, total = grade_session(db_path, case_id, answers)
+    session_id = write(db_path, "insert_graded_session", student_id, case_id, rows, duration_seconds)
+    return {"session_id": session_id, "score": score, "total": total}
 
 
 def get_session_answers(db_path: str, session_id: int) -> List[Dict]:
@@ -636,8 +1485,61 @@ def get_session_answers(db_path: str, session_id: int) -> List[Dict]:
     ]
 
 
-def get_student_sessions(db_path: str, student_id: Optional[int] = None, case_id: Optional[int] = None, limit: int = 100) -> List[Dict]:
-    """Obtiene sesiones filtradas por estudiante o caso."""
+# Máximo de parámetros por consulta `IN (...)` (límite de variables de SQLite)
+_IN_CHUNK_SIZE = 500
+
+
+def _chunks(items: List, size: int = _IN_CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def get_answers_for_sessions(db_path: str, session_ids: List[int]) -> Dict[int, List[Dict]]:
+    """Obtiene las respuestas de varias sesiones en una consulta, agrupadas por session_id."""
+    result: Dict[int, List[Dict]] = {sid: [] for sid in session_ids}
+    if not session_ids:
+        return result
+    conn = _connect(db_path)
+    cur = conn.cursor()
+    for chunk in _chunks(list(result)):
+        placeholders = ",".join("?" * len(chunk))
+        cur.execute(
+            f"SELECT session_id, id, question_index, selected_option, open_answer, is_correct, feedback, score, created_at FROM student_answers WHERE session_id IN ({placeholders}) ORDER BY session_id, question_index",
+            chunk
+        )
+        for r in cur.fetchall():
+            result[r[0]].append({
+                "id": r[1],
+                "question_index": r[2],
+                "selected_option": r[3],
+                "open_answer": r[4],
+                "is_correct": r[5],
+                "feedback": r[6],
+                "score": r[7],
+                "created_at": r[8]
+            })
+    conn.close()
+    return result
+
+
+def get_cases_questions(db_path: str, case_ids: List[int]) -> Dict[int, List[Dict]]:
+    """Devuelve las preguntas de cada caso distinto, decodificando cada payload a lo más una vez."""
+    ids = list(dict.fromkeys(cid for cid in case_ids if cid))
+    if not ids:
+        return {}
+    conn = _connect(db_path)
+    cur = conn.cursor()
+    cases = _get_cases_cached(cur, db_path, ids)
+    conn.close()
+    result: Dict[int, List[Dict]] = {}
+    for cid, case in cases.items():
+        payload = case.get("payload")
+        result[cid] = payload.get("questions", []) if isinstance(payload, dict) else []
+    return result
+
+
+def get_student_sessions(db_path: str, student_id: Optional[int] = None, case_id: Optional[int] = None, limit: int = 100, session_id: Optional[int] = None) -> List[Dict]:
+    """Obtiene sesiones filtradas por estudiante, caso o id de sesión."""
     conn = _connect(db_path)
     cur = conn.cursor()
     query = """
@@ -654,6 +1556,9 @@ def get_student_sessions(db_path: str, student_id: Optional[int] = None, case_id
     if case_id:
         query += " AND s.case_id = ?"
         params.append(case_id)
+    if session_id:
+        query += " AND s.id = ?"
+        params.append(session_id)
     query += " ORDER BY s.created_at DESC LIMIT ?"
     params.append(limit)
     cur.execute(query, params)
@@ -675,18 +1580,119 @@ def get_student_sessions(db_path: str, student_id: Optional[int] = None, case_id
     ]
 
 
-def update_answer_feedback(db_path: str, answer_id: int, feedback: str, score: Optional[float] = None) -> bool:
-    """Actualiza el feedback y score de una respuesta."""
-    conn = _connect(db_path)
-    cur = conn.cursor()
+# Columnas de la exportación de respuestas, una fila por respuesta
+ANSWER_EXPORT_COLUMNS = (
+    "session_id", "student_id", "student_username", "student_name", "case_id", "case_title",
+    "session_created_at", "submitted_at", "duration_seconds",
+    "answer_id", "question_index", "question_text", "answer_type", "selected_option",
+    "student_answer", "correct_answer", "open_answer", "is_correct", "feedback", "score",
+)
+
+
+def describe_answer(questions: List[Dict], q_idx: Optional[int], selected: Optional[int], open_answer: Optional[str]) -> Optional[Dict]:
+    """Texto y tipo de la pregunta de una respuesta, la respuesta del estudiante
+    (la alternativa elegida o el texto de la pregunta abierta), la correcta y las
+    alternativas. None si la pregunta no existe en el caso.
+
+    La usan `GET /api/answers` y la exportación, que deben coincidir.
+    """
+    if q_idx is None or not 0 <= q_idx < len(questions) or not isinstance(questions[q_idx], dict):
+        return None
+    question = questions[q_idx]
+    text = question.get("question") or question.get("text", f"Pregunta {q_idx + 1}")
+    options = question.get("options") or []
+    if not options:
+        return {"question_text": text, "answer_type": "open", "student_answer": open_answer, "correct_answer": None}
+    student_answer = options[selected] if selected is not None and 0 <= selected < len(options) else None
+    correct_idx = question.get("correct_index") or question.get("correctIndex")
+    correct_answer = options[correct_idx] if correct_idx is not None and 0 <= correct_idx < len(options) else None
+    return {
+        "question_text": text,
+        "answer_type": "multiple_choice",
+        "student_answer": student_answer,
+        "correct_answer": correct_answer,
+        "options": options,
+    }
+
+
+def iter_answers_export(db_path: str, student_id: Optional[int] = None, case_id: Optional[int] = None, collection_id: Optional[int] = None, date_from: Optional[str] = None, date_to: Optional[str] = None, batch_size: int = EXPORT_BATCH_SIZE):
+    """Genera bloques de filas (tuplas en el orden de `ANSWER_EXPORT_COLUMNS`) con
+    cada respuesta y los datos de su sesión, en orden de sesión y pregunta.
+
+    Recorre el JOIN con un cursor (`fetchmany`) sobre una conexión propia; las
+    preguntas de cada caso se decodifican una sola vez por exportación y solo se
+    guarda la lista de preguntas, así la memoria depende de los casos distintos y
+    no de la cantidad de respuestas. Las fechas filtran `created_at` de la sesión
+    (ISO, `date_to` inclusive si es solo fecha).
+    """
+    conn = _open_connection(db_path)
+    try:
+        cur = conn.cursor()
+        query = """
+            SELECT s.id, s.student_id, st.username, st.name, s.case_id, c.title,
+                   s.created_at, s.submitted_at, s.duration_seconds,
+                   a.id, a.question_index, a.selected_option, a.open_answer, a.is_correct, a.feedback, a.score
+            FROM student_sessions s
+            JOIN students st ON s.student_id = st.id
+            LEFT JOIN cases c ON s.case_id = c.id
+            LEFT JOIN student_answers a ON a.session_id = s.id
+            WHERE 1=1
+        """
+        params = []
+        if student_id:
+            query += " AND s.student_id = ?"
+            params.append(student_id)
+        if case_id:
+            query += " AND s.case_id = ?"
+            params.append(case_id)
+        if collection_id:
+            query += " AND s.case_id IN (SELECT case_id FROM collection_cases WHERE collection_id = ?)"
+            params.append(collection_id)
+        if date_from:
+            query += " AND s.created_at >= ?"
+            params.append(date_from)
+        if date_to:
+            # "2025-06-30" incluye todo ese día
+            query += " AND s.created_at < ?"
+            params.append(date_to + "\uffff" if len(date_to) == 10 else date_to)
+        cur.execute(query + " ORDER BY s.id, a.question_index", params)
+
+        questions_by_case: Dict[int, List[Dict]] = {}
+        case_cur = conn.cursor()
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            out = []
+            for r in rows:
+                questions = questions_by_case.get(r[4])
+                if questions is None:
+                    case_cur.execute("SELECT payload FROM cases WHERE id = ?", (r[4],))
+                    found = case_cur.fetchone()
+                    payload = json.loads(found[0]) if found and found[0] else None
+                    questions = payload.get("questions") or [] if isinstance(payload, dict) else []
+                    questions_by_case[r[4]] = questions
+                described = describe_answer(questions, r[10], r[11], r[12]) or {}
+                out.append(r[:11] + (
+                    described.get("question_text"), described.get("answer_type"), r[11],
+                    described.get("student_answer"), described.get("correct_answer"),
+                ) + r[12:])
+            yield out
+    finally:
+        conn.shutdown()
+
+
+def _update_answer_feedback_op(cur, answer_id: int, feedback: str, score: Optional[float] = None) -> bool:
     cur.execute(
         "UPDATE student_answers SET feedback = ?, score = ? WHERE id = ?",
         (feedback, score, answer_id)
     )
-    conn.commit()
-    affected = cur.rowcount
-    conn.close()
-    return affected > 0
+    return cur.rowcount > 0
+
+
+def update_answer_feedback(db_path: str, answer_id: int, feedback: str, score: Optional[float] = None) -> bool:
+    """Actualiza el feedback y score de una respuesta."""
+    return write(db_path, "update_answer_feedback", answer_id, feedback, score)
 
 
 def list_students(db_path: str, status: str = 'active') -> List[Dict]:
@@ -710,3 +1716,166 @@ def list_students(db_path: str, status: str = 'active') -> List[Dict]:
         }
         for r in rows
     ]
+
+
+# ===== Escritor único con commits agrupados =====
+
+# Operaciones por commit y espera máxima (ms) para juntar más operaciones en el mismo commit
+WRITE_BATCH_MAX = int(os.getenv("SIMTS_WRITE_BATCH_MAX", "64"))
+WRITE_BATCH_DELAY_MS = float(os.getenv("SIMTS_WRITE_BATCH_DELAY_MS", "2"))
+
+# Escrituras de estudiantes que pasan por el escritor: nombre -> op(cur, *args)
+_WRITE_OPS = {
+    "create_session": _create_session_op,
+    "submit_session": _submit_session_op,
+    "save_answer": _save_answer_op,
+    "insert_graded_session": _insert_graded_session_op,
+    "update_answer_feedback": _update_answer_feedback_op,
+}
+
+
+class GroupCommitWriter:
+    """Hilo único que aplica las escrituras de un `db_path`.
+
+    SQLite admite un solo escritor: en vez de que cada petición compita por el
+    lock y haga su propio commit, las operaciones se encolan y el hilo las
+    agrupa en una transacción (hasta `max_batch` operaciones o `max_delay_ms`
+    de espera). Cada operación corre en su propio SAVEPOINT, así un error solo
+    descarta esa operación; los futures se resuelven recién tras el COMMIT.
+    """
+
+    def __init__(self, db_path: str, max_batch: int = WRITE_BATCH_MAX, max_delay_ms: float = WRITE_BATCH_DELAY_MS):
+        self.db_path = db_path
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max_delay_ms / 1000
+        self._queue: "queue.Queue" = queue.Queue()
+        self.commits = 0
+        self.ops = 0
+        self.errors = 0
+        self.max_batch_seen = 0
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, op: str, *args) -> Future:
+        """Encola `op` y devuelve un Future con su resultado (p. ej. el id de la fila)."""
+        future: Future = Future()
+        self._queue.put((_WRITE_OPS[op], args, future))
+        return future
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _next_batch(self) -> Optional[List[Tuple]]:
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is None:
+                # Aplicar lo ya recibido y terminar después
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            # Las operaciones cuyo llamador ya se rindió (future cancelado) se descartan
+            batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+            if batch:
+                self._apply(batch)
+
+    def _apply(self, batch: List[Tuple]):
+        results = []
+        conn = None
+        try:
+            conn = _connect(self.db_path)
+            cur = conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            for op, args, future in batch:
+                cur.execute("SAVEPOINT write_op")
+                try:
+                    results.append((future, op(cur, *args), None))
+                    cur.execute("RELEASE write_op")
+                except Exception as e:
+                    cur.execute("ROLLBACK TO write_op")
+                    cur.execute("RELEASE write_op")
+                    results.append((future, None, e))
+            conn.commit()
+        except Exception as e:
+            if conn is not None:
+                try:
+                    conn.rollback()
+                except sqlite3.Error:
+                    pass
+            self.errors += len(batch)
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.commits += 1
+        self.ops += len(batch)
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        for future, result, error in results:
+            if error is not None:
+                self.errors += 1
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> Dict:
+        return {
+            "queued": self._queue.qsize(),
+            "commits": self.commits,
+            "ops": self.ops,
+            "errors": self.errors,
+            "avg_batch": round(self.ops / self.commits, 2) if self.commits else 0.0,
+            "max_batch": self.max_batch_seen,
+        }
+
+
+_writers: Dict[str, GroupCommitWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def writer_for(db_path: str) -> GroupCommitWriter:
+    """Escritor único de `db_path`, creado en el primer uso."""
+    writer = _writers.get(db_path)
+    if writer is None:
+        with _writers_lock:
+            writer = _writers.get(db_path)
+            if writer is None:
+                writer = _writers[db_path] = GroupCommitWriter(db_path)
+    return writer
+
+
+def submit_write(db_path: str, op: str, *args) -> Future:
+    """Encola una escritura en el escritor de `db_path` sin esperar el commit."""
+    return writer_for(db_path).submit(op, *args)
+
+
+def write(db_path: str, op: str, *args):
+    """Encola una escritura y espera su commit; devuelve el resultado de la operación."""
+    return submit_write(db_path, op, *args).result()
+
+
+def writer_stats() -> Dict[str, Dict]:
+    return {path: writer.stats() for path, writer in list(_writers.items())}
+
+
+def stop_writers():
+    """Aplica las escrituras pendientes y detiene los hilos escritores."""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.stop()
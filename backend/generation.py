@@ -0,0 +1,249 @@
+"""Caché y pool de generaciones de casos.
+
+Agrupa las peticiones de generación idénticas (mismos parámetros normalizados)
+para que una clase completa pidiendo "un caso básico de salud mental" dispare
+una sola llamada al modelo, y mantiene un pool de casos pregenerados para las
+combinaciones de parámetros configuradas.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import adb as _adb
+
+logger = logging.getLogger("simts.backend")
+
+# Segundos que un resultado generado se reutiliza para parámetros idénticos (0 desactiva)
+GENERATION_CACHE_TTL = float(os.getenv("SIMTS_GENERATION_CACHE_TTL", "60"))
+GENERATION_CACHE_SIZE = int(os.getenv("SIMTS_GENERATION_CACHE_SIZE", "128"))
+# Antigüedad máxima de los casos entregados en el modo `reuse_recent`
+RECENT_CASE_WINDOW_HOURS = float(os.getenv("SIMTS_RECENT_CASE_WINDOW_HOURS", "24"))
+
+# Pool de casos pregenerados: lista JSON de parámetros, p. ej.
+# [{"theme": "Salud mental", "difficulty": "basico"}]
+POOL_SPECS = os.getenv("SIMTS_POOL_SPECS", "")
+# Casos sin entregar que se mantienen por combinación de parámetros
+POOL_DEPTH = int(os.getenv("SIMTS_POOL_DEPTH", "3"))
+# Segundos entre revisiones del pool (también se revisa cada vez que se entrega un caso)
+POOL_REFILL_INTERVAL = float(os.getenv("SIMTS_POOL_REFILL_INTERVAL", "30"))
+
+# Parámetros de SimulateRequest que determinan el caso generado
+GENERATION_PARAMS = ("theme", "difficulty", "age_group", "context", "case_length", "focus_area", "competency")
+
+# Valores que `build_generation_prompt` usa cuando el parámetro no viene
+_PARAM_DEFAULTS = {"difficulty": "basico", "case_length": "medio"}
+
+
+def normalize_params(params: Dict) -> Dict:
+    """Normaliza los parámetros de generación (minúsculas, sin espacios, defaults aplicados)."""
+    normalized = {}
+    for name in GENERATION_PARAMS:
+        value = params.get(name)
+        if isinstance(value, str):
+            value = " ".join(value.split()).lower() or None
+        normalized[name] = value if value is not None else _PARAM_DEFAULTS.get(name)
+    return normalized
+
+
+def generation_key(params: Dict) -> str:
+    """Clave estable para un conjunto de parámetros de generación."""
+    canonical = json.dumps(normalize_params(params), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """Single-flight + caché TTL de resultados de generación.
+
+    Las peticiones concurrentes con la misma clave esperan la misma tarea; la
+    tarea no se cancela si el cliente que la inició se desconecta. Solo se
+    cachean resultados con un caso parseado.
+    """
+
+    def __init__(self, ttl: float = GENERATION_CACHE_TTL, maxsize: int = GENERATION_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._results: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Rotación por clave para el modo "caso reciente distinto"
+        self._rotation: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.recent_served = 0
+
+    def _cached(self, key: str) -> Optional[Dict]:
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] >= self.ttl:
+            self._results.pop(key, None)
+            return None
+        self._results.move_to_end(key)
+        return entry[1]
+
+    def _finish(self, key: str, task: asyncio.Future, store: bool):
+        if store:
+            self._inflight.pop(key, None)
+        # Consultar la excepción la marca como recuperada aunque nadie espere ya la tarea
+        if task.cancelled() or task.exception() is not None:
+            return
+        result = task.result()
+        if store and self.ttl > 0 and result.get("case"):
+            self._results[key] = (time.monotonic(), result)
+            self._results.move_to_end(key)
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+
+    async def get_or_generate(self, key: str, produce: Callable[[], Awaitable[Dict]], use_cache: bool = True) -> Tuple[Dict, str]:
+        """Devuelve (resultado, origen), con origen "cache", "coalesced" o "generated"."""
+        if use_cache:
+            cached = self._cached(key)
+            if cached is not None:
+                self.hits += 1
+                return cached, "cache"
+            task = self._inflight.get(key)
+            if task is not None:
+                self.coalesced += 1
+                return await asyncio.shield(task), "coalesced"
+
+        self.misses += 1
+        task = asyncio.ensure_future(produce())
+        if use_cache:
+            self._inflight[key] = task
+        task.add_done_callback(lambda t: self._finish(key, t, use_cache))
+        return await asyncio.shield(task), "generated"
+
+    def next_rotation(self, key: str) -> int:
+        """Índice creciente por clave, para repartir casos recientes distintos."""
+        index = self._rotation.get(key, 0)
+        self._rotation[key] = index + 1
+        if len(self._rotation) > self.maxsize * 4:
+            self._rotation.clear()
+        return index
+
+    def stats(self) -> Dict:
+        return {
+            "ttl_seconds": self.ttl,
+            "size": len(self._results),
+            "in_flight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "recent_served": self.recent_served,
+        }
+
+
+def parse_pool_specs(raw: str) -> List[Dict]:
+    """Parsea `SIMTS_POOL_SPECS` (lista JSON de parámetros de generación)."""
+    if not raw or not raw.strip():
+        return []
+    specs = json.loads(raw)
+    if not isinstance(specs, list):
+        raise ValueError("SIMTS_POOL_SPECS debe ser una lista JSON de parámetros")
+    # La clave se calcula normalizada; el prompt usa los valores tal como se configuraron
+    return [{name: spec[name] for name in GENERATION_PARAMS if spec.get(name) is not None} for spec in specs]
+
+
+class CasePool:
+    """Pool de casos pregenerados en la tabla `case_pool`, rellenado en segundo plano.
+
+    `take()` entrega de inmediato un caso para una clave configurada; `run()` es
+    la tarea de fondo que mantiene `depth` casos por combinación.
+    """
+
+    def __init__(self, db_path: str, specs: List[Dict], depth: int = POOL_DEPTH, refill_interval: float = POOL_REFILL_INTERVAL):
+        self.db_path = db_path
+        self.specs = {generation_key(spec): spec for spec in specs}
+        self.depth = depth
+        self.refill_interval = refill_interval
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+        self.refill_errors = 0
+        self.refill_seconds_total = 0.0
+        self.refill_seconds_max = 0.0
+        self.last_refill_seconds: Optional[float] = None
+        self._wake: Optional[asyncio.Event] = None
+
+    def handles(self, key: str) -> bool:
+        return key in self.specs
+
+    async def take(self, key: str) -> Optional[Dict]:
+        """Retira un caso del pool para `key`, o None si la clave no está configurada o está vacía."""
+        if not self.handles(key):
+            return None
+        entry = await _adb.pool_take(self.db_path, key)
+        if entry:
+            self.hits += 1
+        else:
+            self.misses += 1
+        if self._wake is not None:
+            self._wake.set()
+        return entry
+
+    async def give_back(self, key: str, entry: Dict):
+        """Devuelve al pool un caso retirado con `take()` que no llegó a entregarse."""
+        await _adb.pool_add(self.db_path, key, entry.get("params") or {}, entry["case"], entry.get("generation_seconds"))
+
+    async def refill(self, generate: Callable[[Dict], Awaitable[Optional[Dict]]]):
+        """Genera los casos que faltan para llegar a `depth` en cada combinación."""
+        depths = await _adb.pool_depths(self.db_path)
+        for key, params in self.specs.items():
+            for _ in range(self.depth - depths.get(key, 0)):
+                start = time.monotonic()
+                try:
+                    case_obj = await generate(params)
+                except Exception:
+                    logger.exception("Error rellenando el pool de casos")
+                    case_obj = None
+                if not case_obj:
+                    # No insistir con esta combinación hasta la próxima revisión
+                    self.refill_errors += 1
+                    break
+                elapsed = time.monotonic() - start
+                await _adb.pool_add(self.db_path, key, params, case_obj, elapsed)
+                self.refills += 1
+                self.refill_seconds_total += elapsed
+                self.refill_seconds_max = max(self.refill_seconds_max, elapsed)
+                self.last_refill_seconds = elapsed
+
+    async def run(self, generate: Callable[[Dict], Awaitable[Optional[Dict]]]):
+        """Tarea de fondo: rellena el pool y espera el intervalo o a que se entregue un caso."""
+        self._wake = asyncio.Event()
+        while True:
+            try:
+                await self.refill(generate)
+            except Exception:
+                # Un error de la base (p. ej. "database is locked") no debe matar la tarea:
+                # se reintenta en la próxima revisión
+                self.refill_errors += 1
+                logger.exception("Error revisando el pool de casos")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.refill_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def stats(self) -> Dict:
+        depths = await _adb.pool_depths(self.db_path) if self.specs else {}
+        lookups = self.hits + self.misses
+        return {
+            "target_depth": self.depth,
+            "combinations": [
+                {"params": params, "depth": depths.get(key, 0)}
+                for key, params in self.specs.items()
+            ],
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "refills": self.refills,
+            "refill_errors": self.refill_errors,
+            "refill_seconds_avg": round(self.refill_seconds_total / self.refills, 2) if self.refills else None,
+            "refill_seconds_max": round(self.refill_seconds_max, 2),
+            "refill_seconds_last": round(self.last_refill_seconds, 2) if self.last_refill_seconds is not None else None,
+        }
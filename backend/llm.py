@@ -0,0 +1,314 @@
+"""Proveedores del LLM detrás de `client.responses.create`.
+
+`ClientWrapper` (main.py) solo necesita un objeto con `create(**kwargs)` al
+estilo de la Responses API de OpenAI: con `stream=True` devuelve un iterable de
+eventos `response.output_text.delta`; si no, una respuesta con `output_text` y
+`to_dict()`. El proveedor se elige con `SIMTS_LLM_PROVIDER`:
+
+  - `openai`: la API real (por defecto si hay `OPENAI_API_KEY`)
+  - `record`: la API real, guardando cada respuesta en `SIMTS_LLM_RECORD_DIR`
+  - `replay`: responde con las grabaciones, sin red
+  - `synthetic`: casos JSON válidos generados localmente, con latencia, jitter,
+    velocidad de tokens y tasa de fallas configurables (pruebas de carga offline)
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterator, List, Optional
+
+LLM_PROVIDER = os.getenv("SIMTS_LLM_PROVIDER", "").lower()
+LLM_RECORD_DIR = os.getenv("SIMTS_LLM_RECORD_DIR") or os.path.join(os.path.dirname(__file__), "llm_recordings")
+# Con 1, una petición sin grabación idéntica falla en vez de usar otra grabación
+LLM_REPLAY_STRICT = os.getenv("SIMTS_LLM_REPLAY_STRICT", "").lower() in ("1", "true", "yes")
+
+# Proveedor sintético
+SYNTHETIC_LATENCY = float(os.getenv("SIMTS_LLM_SYNTHETIC_LATENCY", "1.0"))  # segundos hasta el primer token
+SYNTHETIC_JITTER = float(os.getenv("SIMTS_LLM_SYNTHETIC_JITTER", "0.3"))
+SYNTHETIC_TOKENS_PER_S = float(os.getenv("SIMTS_LLM_SYNTHETIC_TOKENS_PER_S", "0"))  # 0: el texto llega de una vez
+SYNTHETIC_FAILURE_RATE = float(os.getenv("SIMTS_LLM_SYNTHETIC_FAILURE_RATE", "0"))
+SYNTHETIC_SEED = os.getenv("SIMTS_LLM_SYNTHETIC_SEED")
+
+# Aproximación usada para convertir texto en tokens
+CHARS_PER_TOKEN = 4
+STREAM_CHUNK_TOKENS = 8
+
+
+class ProviderError(RuntimeError):
+    """Falla del proveedor; `transient` indica si tiene sentido reintentar."""
+
+    def __init__(self, message: str, transient: bool = True):
+        super().__init__(message)
+        self.transient = transient
+
+
+class DeadlineExceeded(TimeoutError):
+    """Se agotó el plazo total de la petición (incluidos reintentos)."""
+
+
+# Errores del SDK de OpenAI que vale la pena reintentar
+_TRANSIENT_ERRORS = {"APITimeoutError", "APIConnectionError", "RateLimitError", "InternalServerError"}
+
+
+def is_transient(exc: BaseException) -> bool:
+    """True si el error es pasajero (timeout, conexión, 429, 5xx) y conviene reintentar."""
+    if isinstance(exc, DeadlineExceeded):
+        return False
+    if isinstance(exc, ProviderError):
+        return exc.transient
+    if isinstance(exc, (TimeoutError, ConnectionError)) or type(exc).__name__ in _TRANSIENT_ERRORS:
+        return True
+    status = getattr(exc, "status_code", None)
+    return isinstance(status, int) and (status in (408, 409, 429) or status >= 500)
+
+
+class LatencyTracker:
+    """Latencias recientes de llamadas exitosas, para decidir cuándo cubrir una petición."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Cuantil `q` de la ventana, o None si aún no hay suficientes muestras."""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Response:
+    """Respuesta mínima compatible con la que devuelve la Responses API."""
+
+    def __init__(self, output_text: str, raw: Optional[Dict] = None):
+        self.output_text = output_text
+        self._raw = raw
+
+    def to_dict(self) -> Dict:
+        if self._raw is not None:
+            return self._raw
+        return {"output": [{"content": [{"type": "output_text", "text": self.output_text}]}]}
+
+
+def _delta(text: str) -> Dict:
+    return {"type": "response.output_text.delta", "delta": text}
+
+
+def _chunks(text: str, size: int = STREAM_CHUNK_TOKENS * CHARS_PER_TOKEN) -> List[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+def _response_text(response) -> str:
+    text = getattr(response, "output_text", None)
+    if isinstance(text, str):
+        return text
+    try:
+        raw = response.to_dict()
+    except Exception:
+        return ""
+    return "\n".join(
+        content.get("text", "")
+        for item in raw.get("output", []) if isinstance(item, dict)
+        for content in item.get("content", []) if isinstance(content, dict)
+    )
+
+
+# ===== OpenAI =====
+
+def openai_responses(api_key: str, timeout: Optional[float] = None):
+    """`responses` del SDK de OpenAI (import tardío: los tests no necesitan el SDK).
+
+    Los reintentos del SDK se desactivan: los hace `ClientWrapper` dentro del
+    plazo de la petición.
+    """
+    from openai import OpenAI as OpenAILib
+
+    options = {"max_retries": 0}
+    if timeout:
+        options["timeout"] = timeout
+    return getattr(OpenAILib(api_key=api_key, **options), "responses", None)
+
+
+# ===== Grabación y reproducción =====
+
+def request_key(kwargs: Dict) -> str:
+    """Huella de una petición: prompt e input, sin opciones de transporte como `stream`."""
+    request = {k: v for k, v in kwargs.items() if k not in ("stream", "timeout")}
+    canonical = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:24]
+
+
+class RecordingResponses:
+    """Envuelve a otro proveedor y guarda cada respuesta completa en `directory`."""
+
+    def __init__(self, inner, directory: str = LLM_RECORD_DIR):
+        self.inner = inner
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _save(self, kwargs: Dict, text: str, raw: Optional[Dict]):
+        request = {k: v for k, v in kwargs.items() if k not in ("stream", "timeout")}
+        record = {"request": request, "output_text": text, "raw": raw, "recorded_at": time.time()}
+        path = os.path.join(self.directory, request_key(kwargs) + ".json")
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(record, fh, ensure_ascii=False, default=str)
+        os.replace(tmp, path)
+
+    def create(self, **kwargs):
+        response = self.inner.create(**kwargs)
+        if not kwargs.get("stream") or hasattr(response, "to_dict") or not hasattr(response, "__iter__"):
+            try:
+                raw = response.to_dict()
+            except Exception:
+                raw = None
+            self._save(kwargs, _response_text(response), raw)
+            return response
+        return self._record_stream(kwargs, response)
+
+    def _record_stream(self, kwargs: Dict, events) -> Iterator:
+        parts = []
+        try:
+            for event in events:
+                if isinstance(event, dict):
+                    event_type, delta = event.get("type"), event.get("delta")
+                else:
+                    event_type, delta = getattr(event, "type", None), getattr(event, "delta", None)
+                if event_type == "response.output_text.delta" and isinstance(delta, str):
+                    parts.append(delta)
+                yield event
+        finally:
+            if hasattr(events, "close"):
+                events.close()
+        # Solo streams completos: uno cortado por el cliente no se graba
+        self._save(kwargs, "".join(parts), None)
+
+
+class ReplayResponses:
+    """Responde con las grabaciones de `directory`.
+
+    Una petición sin grabación idéntica recibe una grabación elegida de forma
+    determinista por su huella (o falla con `SIMTS_LLM_REPLAY_STRICT`).
+    """
+
+    def __init__(self, directory: str = LLM_RECORD_DIR, strict: bool = LLM_REPLAY_STRICT):
+        self.directory = directory
+        self.strict = strict
+        self._records: Dict[str, Dict] = {}
+        if os.path.isdir(directory):
+            for name in sorted(os.listdir(directory)):
+                if name.endswith(".json"):
+                    with open(os.path.join(directory, name), encoding="utf-8") as fh:
+                        self._records[name[:-5]] = json.load(fh)
+        self._keys = sorted(self._records)
+
+    def create(self, **kwargs):
+        key = request_key(kwargs)
+        record = self._records.get(key)
+        if record is None:
+            if self.strict or not self._keys:
+                raise ProviderError(f"Sin grabación para la petición {key} en {self.directory}", transient=False)
+            record = self._records[self._keys[int(key, 16) % len(self._keys)]]
+        if kwargs.get("stream"):
+            return iter([_delta(chunk) for chunk in _chunks(record["output_text"])])
+        return Response(record["output_text"], record.get("raw"))
+
+
+# ===== Sintético =====
+
+_WORDS = [
+    "familia", "red", "apoyo", "derechos", "barrio", "escuela", "vivienda", "salud", "trabajo",
+    "comunidad", "vínculo", "riesgo", "protección", "intervención", "diagnóstico", "territorio",
+]
+_PARAM = re.compile(r"^- (\w+): (.+)$", re.MULTILINE)
+_PARAGRAPHS = re.compile(r"Usa (\d+) párrafos")
+_LEVELS = {"bajo": "basico", "medio": "intermedio", "alto": "avanzado"}
+
+
+def synthetic_case(rnd: random.Random, prompt_input: str = "") -> Dict:
+    """Caso con la forma que produce el modelo, respetando eje, nivel y extensión pedidos."""
+    params = dict(_PARAM.findall(prompt_input or ""))
+    match = _PARAGRAPHS.search(prompt_input or "")
+    paragraphs = int(match.group(1)) if match else 5
+    words = lambda n: " ".join(rnd.choice(_WORDS) for _ in range(n))  # noqa: E731
+    questions = [
+        {"text": f"Pregunta {q + 1}: {words(8)}", "options": [words(4) for _ in range(4)], "correct_index": rnd.randrange(4)}
+        for q in range(4)
+    ]
+    questions.append({"text": "Pregunta 5: fundamente su plan de intervención", "options": []})
+    return {
+        "case_id": f"synthetic-{rnd.randrange(16 ** 8):08x}",
+        "title": "Caso " + words(3),
+        "eje": params.get("eje", rnd.choice(_WORDS)),
+        "nivel": _LEVELS.get(params.get("nivel", ""), "basico"),
+        "description": "\n\n".join(words(rnd.randint(60, 90)) for _ in range(paragraphs)),
+        "questions": questions,
+    }
+
+
+class SyntheticResponses:
+    """LLM local: casos válidos con latencia y fallas configurables, sin red."""
+
+    def __init__(self, latency: float = SYNTHETIC_LATENCY, jitter: float = SYNTHETIC_JITTER, tokens_per_s: float = SYNTHETIC_TOKENS_PER_S,
+                 failure_rate: float = SYNTHETIC_FAILURE_RATE, seed: Optional[int] = None, sleep=time.sleep):
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_s = tokens_per_s
+        self.failure_rate = failure_rate
+        self.sleep = sleep
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self, prompt_input: str):
+        # Un solo sorteo por llamada bajo lock: con semilla, la secuencia es reproducible
+        with self._lock:
+            delay = max(0.0, self.latency + self._rnd.uniform(-self.jitter, self.jitter))
+            fails = self._rnd.random() < self.failure_rate
+            text = json.dumps(synthetic_case(self._rnd, prompt_input), ensure_ascii=False)
+        return delay, fails, text
+
+    def _token_delay(self, text: str) -> float:
+        return len(text) / CHARS_PER_TOKEN / self.tokens_per_s if self.tokens_per_s > 0 else 0.0
+
+    def create(self, stream: bool = False, **kwargs):
+        delay, fails, text = self._draw(str(kwargs.get("input") or ""))
+        self.sleep(delay)
+        if fails:
+            raise ProviderError("Falla simulada del proveedor sintético")
+        if stream:
+            return self._stream(text)
+        self.sleep(self._token_delay(text))
+        return Response(text)
+
+    def _stream(self, text: str) -> Iterator[Dict]:
+        chunks = _chunks(text)
+        per_chunk = self._token_delay(text) / len(chunks)
+        for chunk in chunks:
+            self.sleep(per_chunk)
+            yield _delta(chunk)
+
+
+def build_responses(provider: str = LLM_PROVIDER, api_key: Optional[str] = None, timeout: Optional[float] = None):
+    """Proveedor según `provider` (o, si está vacío, OpenAI cuando hay clave); None si no hay ninguno."""
+    provider = provider or ("openai" if api_key else "")
+    if provider == "synthetic":
+        return SyntheticResponses(seed=int(SYNTHETIC_SEED) if SYNTHETIC_SEED else None)
+    if provider == "replay":
+        return ReplayResponses()
+    if provider in ("openai", "record"):
+        if not api_key:
+            raise ValueError(f"SIMTS_LLM_PROVIDER={provider} requiere OPENAI_API_KEY")
+        responses = openai_responses(api_key, timeout)
+        if responses is not None and provider == "record":
+            responses = RecordingResponses(responses)
+        return responses
+    if provider:
+        raise ValueError(f"SIMTS_LLM_PROVIDER desconocido: {provider}")
+    return None
@@ -2,13 +2,35 @@ import os
 import logging
 import json
 import time
-from typing import Optional
-
-from fastapi import FastAPI, HTTPException
+from datetime import datetime, timedelta
+import asyncio
+import csv
+import functools
+import io
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Callable, List, Optional
+
+from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 import db as _db
+import adb as _adb
+import auth as _auth
+import metrics as _metrics
+import sqltrace as _sqltrace
+import generation as _gen
+import llm as _llm
+
+try:
+    import orjson
+except ImportError:  # opcional: sin orjson se usa el serializador estándar
+    orjson = None
 
 # Carga variables de entorno desde .env en desarrollo
 load_dotenv()
@@ -22,27 +44,271 @@ class DummyResponses:
         raise RuntimeError("OPENAI_API_KEY no configurada. Establece la variable de entorno OPENAI_API_KEY o mokea 'client.responses.create' en tests.")
 
 
+# Máximo de llamadas al LLM ejecutándose a la vez por worker; el resto espera en cola
+LLM_MAX_CONCURRENCY = int(os.getenv("SIMTS_LLM_MAX_CONCURRENCY", "8"))
+# Plazo total de una llamada al LLM (incluidos reintentos), reintentos ante
+# errores pasajeros y espera base del backoff exponencial con jitter
+LLM_DEADLINE_S = float(os.getenv("SIMTS_LLM_DEADLINE_S", "90"))
+LLM_MAX_RETRIES = int(os.getenv("SIMTS_LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_S = float(os.getenv("SIMTS_LLM_RETRY_BASE_S", "0.5"))
+# Cobertura (hedging): si la llamada no respondió al llegar al cuantil indicado
+# de las latencias recientes, se lanza una segunda y se usa la primera que termine
+LLM_HEDGE = os.getenv("SIMTS_LLM_HEDGE", "").lower() in ("1", "true", "yes")
+LLM_HEDGE_QUANTILE = float(os.getenv("SIMTS_LLM_HEDGE_QUANTILE", "0.9"))
+# Límites de /api/simulate/batch: casos por petición y generaciones en paralelo
+BATCH_MAX_ITEMS = int(os.getenv("SIMTS_BATCH_MAX_ITEMS", "50"))
+BATCH_MAX_PARALLELISM = int(os.getenv("SIMTS_BATCH_MAX_PARALLELISM", "5"))
+# Tamaño mínimo (bytes) a partir del cual las respuestas se comprimen con gzip
+GZIP_MIN_SIZE = int(os.getenv("SIMTS_GZIP_MIN_SIZE", "1024"))
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse serializada con orjson cuando está instalado."""
+
+    def render(self, content) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        # Las estadísticas usan None como clave (casos sin tema/dificultad)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
 class ClientWrapper:
-    def __init__(self, api_key: Optional[str] = None):
-        self._client = None
-        if api_key:
-            # Import tardío para evitar errores en imports de test cuando no hay clave
-            from openai import OpenAI as OpenAILib
-
-            self._client = OpenAILib(api_key=api_key)
-            # La API moderna de openai presenta un atributo `responses`
-            self.responses = getattr(self._client, "responses", None)
-            if self.responses is None:
-                # Fallback a objeto con create para compatibilidad
-                self.responses = DummyResponses()
-        else:
-            self.responses = DummyResponses()
+    def __init__(self, api_key: Optional[str] = None, max_concurrency: int = LLM_MAX_CONCURRENCY, provider: str = _llm.LLM_PROVIDER,
+                 deadline: float = LLM_DEADLINE_S, max_retries: int = LLM_MAX_RETRIES, retry_base: float = LLM_RETRY_BASE_S,
+                 hedge: bool = LLM_HEDGE, hedge_quantile: float = LLM_HEDGE_QUANTILE):
+        # El SDK es síncrono: las llamadas se ejecutan en un pool acotado para no
+        # bloquear el event loop mientras se espera la respuesta del modelo
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm")
+        # Llamadas enviadas al pool cuyo hilo no terminó (ver `_submit`)
+        self.in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.latency = _llm.LatencyTracker()
+        # OpenAI, grabación/reproducción o sintético según SIMTS_LLM_PROVIDER (ver llm.py)
+        self.provider = provider or ("openai" if api_key else "none")
+        self.responses = _llm.build_responses(provider, api_key, timeout=deadline) or DummyResponses()
+
+    async def _retry_delay(self, op: str, attempt: int, error: Exception, deadline: float) -> bool:
+        """Espera el backoff del reintento `attempt`; False si no corresponde reintentar."""
+        if attempt > self.max_retries or not _llm.is_transient(error):
+            return False
+        # Backoff exponencial con jitter completo, sin pasarse del plazo
+        delay = random.uniform(0, self.retry_base * 2 ** (attempt - 1))
+        if asyncio.get_running_loop().time() + delay >= deadline:
+            return False
+        _metrics.llm_retries.inc(op)
+        logger.warning(f"Reintentando llamada al LLM ({attempt}/{self.max_retries}) en {delay:.2f}s: {error!r}")
+        await asyncio.sleep(delay)
+        return True
+
+    def _deadline_exceeded(self, op: str) -> _llm.DeadlineExceeded:
+        _metrics.llm_deadline_exceeded.inc(op)
+        return _llm.DeadlineExceeded(f"El modelo no respondió dentro del plazo de {self.deadline:.0f}s")
+
+    def _submit(self, fn: Callable):
+        """Envía `fn` al pool. `in_flight` baja cuando el hilo termina de verdad, no
+        cuando el llamador deja de esperar (plazo vencido o cobertura perdedora): el
+        SDK no se puede interrumpir y ese hilo sigue ocupado."""
+        with self._in_flight_lock:
+            self.in_flight += 1
+        try:
+            future = self._executor.submit(fn)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _future):
+        with self._in_flight_lock:
+            self.in_flight -= 1
+
+    async def acreate(self, **kwargs):
+        """Ejecuta `responses.create` en el pool del cliente sin bloquear el event loop,
+        dentro del plazo `deadline`, con reintentos ante errores pasajeros y cobertura opcional."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        attempt = 0
+        while True:
+            try:
+                return await asyncio.wait_for(self._hedged_create(kwargs), deadline - loop.time())
+            except Exception as e:
+                if loop.time() >= deadline:
+                    raise self._deadline_exceeded("create") from e
+                attempt += 1
+                if not await self._retry_delay("create", attempt, e, deadline):
+                    raise
+
+    async def _hedged_create(self, kwargs: dict):
+        """Una llamada; si no terminó al llegar al cuantil `hedge_quantile`, lanza una segunda
+        y devuelve la primera que termine bien."""
+        primary = asyncio.ensure_future(self._create_once(kwargs))
+        delay = self.latency.quantile(self.hedge_quantile) if self.hedge else None
+        if delay is None:
+            return await primary
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        # Con el pool lleno la segunda llamada solo esperaría en cola
+        if done or self.in_flight >= self.max_concurrency:
+            return await primary
+        _metrics.llm_hedged.inc("create")
+        hedge = asyncio.ensure_future(self._create_once(kwargs))
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            _metrics.llm_hedge_wins.inc("create")
+                        return task.result()
+            # Fallaron ambas: se informa el error de la original
+            return primary.result()
+        finally:
+            # El hilo de la perdedora termina por su cuenta (el SDK no se puede interrumpir)
+            for task in (primary, hedge):
+                if not task.done():
+                    task.cancel()
+
+    async def _create_once(self, kwargs: dict):
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wrap_future(self._submit(functools.partial(self.responses.create, **kwargs)))
+        except Exception as e:
+            _metrics.llm_errors.inc("create", type(e).__name__)
+            raise
+        finally:
+            _metrics.llm_duration.observe(time.perf_counter() - start, "create")
+        self.latency.add(time.perf_counter() - start)
+        return result
+
+    async def astream(self, **kwargs):
+        """Llama a `responses.create(stream=True)` en el pool y entrega los
+        fragmentos de texto a medida que el modelo los produce.
+
+        El stream completo debe terminar dentro del plazo `deadline`; los errores
+        pasajeros se reintentan solo antes del primer fragmento (después el
+        cliente ya recibió texto). Si el backend no soporta streaming y devuelve
+        una respuesta completa, se entrega su texto como un único fragmento.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        attempt = 0
+        while True:
+            started = False
+            chunks = self._stream_once(kwargs)
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), deadline - loop.time())
+                    except StopAsyncIteration:
+                        return
+                    started = True
+                    yield chunk
+            except Exception as e:
+                if loop.time() >= deadline:
+                    raise self._deadline_exceeded("stream") from e
+                attempt += 1
+                if started or not await self._retry_delay("stream", attempt, e, deadline):
+                    raise
+            finally:
+                await chunks.aclose()
+
+    async def _stream_once(self, kwargs: dict):
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+        cancelled = threading.Event()
+
+        def emit(item):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                # El event loop ya se cerró: no hay a quién entregar
+                cancelled.set()
+
+        def produce():
+            try:
+                resp = self.responses.create(stream=True, **kwargs)
+                if hasattr(resp, "to_dict") or not hasattr(resp, "__iter__"):
+                    emit(extract_text_from_response(resp) or "")
+                else:
+                    for event in resp:
+                        if cancelled.is_set():
+                            if hasattr(resp, "close"):
+                                resp.close()
+                            break
+                        delta = _stream_event_delta(event)
+                        if delta:
+                            emit(delta)
+                emit(done)
+            except Exception as e:
+                emit(e)
+
+        start = time.perf_counter()
+        self._submit(produce)
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    _metrics.llm_errors.inc("stream", type(item).__name__)
+                    raise item
+                yield item
+        finally:
+            # Si el consumidor se desconecta, el hilo deja de leer el stream
+            cancelled.set()
+            _metrics.llm_duration.observe(time.perf_counter() - start, "stream")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _stream_event_delta(event) -> Optional[str]:
+    """Extrae el fragmento de texto de un evento de streaming de Responses API."""
+    if isinstance(event, dict):
+        event_type, delta = event.get("type"), event.get("delta")
+    else:
+        event_type, delta = getattr(event, "type", None), getattr(event, "delta", None)
+    if event_type == "response.output_text.delta" and isinstance(delta, str):
+        return delta
+    return None
 
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 client = ClientWrapper(api_key=OPENAI_API_KEY)
 
-app = FastAPI(title="Simulador Trabajo Social - Backend")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        _db.init_db(DB_PATH)
+        logger.info(f"DB inicializada en {DB_PATH}")
+    except Exception:
+        logger.exception("No se pudo inicializar la base de datos")
+    # Secreto persistente: los tokens emitidos siguen valiendo tras un reinicio
+    _auth.init_secret(DB_PATH)
+    pool_task = None
+    if case_pool.specs:
+        pool_task = asyncio.create_task(case_pool.run(_generate_for_pool))
+        logger.info(f"Pool de casos activo: {len(case_pool.specs)} combinaciones, profundidad {case_pool.depth}")
+    yield
+    if pool_task:
+        pool_task.cancel()
+    client.shutdown()
+    _adb.shutdown()
+    # Cierra las conexiones SQLite reutilizadas por los hilos del worker
+    _db.close_connections()
+
+
+app = FastAPI(title="Simulador Trabajo Social - Backend", lifespan=lifespan, default_response_class=FastJSONResponse)
+
+# Comprimir respuestas grandes (listados de casos, casos generados)
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_SIZE, compresslevel=5)
 
 # Configurar CORS para permitir peticiones desde el frontend
 app.add_middleware(
@@ -53,13 +319,12 @@ app.add_middleware(
     allow_headers=["*"],  # Permite todos los headers
 )
 
-# Inicializar DB de persistencia
+# Latencia por ruta y estado, peticiones en curso y tiempo de DB (/api/metrics);
+# se agrega al final para envolver a los demás middlewares
+app.add_middleware(_metrics.MetricsMiddleware)
+
+# DB de persistencia; se crea o migra en `lifespan`, no al importar el módulo
 DB_PATH = os.getenv("SIMTS_DB_PATH") or os.path.join(os.path.dirname(__file__), "cases.db")
-try:
-    _db.init_db(DB_PATH)
-    logger.info(f"DB inicializada en {DB_PATH}")
-except Exception:
-    logger.exception("No se pudo inicializar la base de datos")
 
 
 @app.get("/")
@@ -73,6 +338,7 @@ async def root():
         "endpoints": {
             "health_check": "/api/health",
             "simulate": "/api/simulate",
+            "simulate_stream": "/api/simulate/stream",
             "list_cases": "/api/cases",
             "save_case": "/api/cases"
         }
@@ -86,10 +352,18 @@ async def health_check():
         "status": "healthy",
         "service": "simts-backend",
         "db_connected": os.path.exists(DB_PATH),
-        "openai_configured": bool(OPENAI_API_KEY)
+        "openai_configured": bool(OPENAI_API_KEY),
+        "llm_provider": client.provider,
+        "llm_in_flight": client.in_flight,
+        "llm_max_concurrency": client.max_concurrency
     }
 
 
+# Prompt preconfigurado en OpenAI que recibe los parámetros del caso
+PROMPT_ID = "pmpt_692bbe09d0b481968c7281d521eb16760a51d9f0c77edf52"
+PROMPT = {"id": PROMPT_ID, "version": "3"}
+
+
 class SimulateRequest(BaseModel):
     # Si `generate` es True, se generará un caso nuevo según tema y dificultad.
     generate: Optional[bool] = False
@@ -103,6 +377,13 @@ class SimulateRequest(BaseModel):
     focus_area: Optional[str] = None  # 'derechos_humanos'|'enfoque_genero'|'determinantes_sociales'|'comunitario'|'sistemico_familiar'
     competency: Optional[str] = None  # 'diagnostico_social'|'diseño_intervencion'|'articulacion_redes'|'entrevista_vinculacion'|'evaluacion'
 
+    # Caché de generación: con False se fuerza un caso nuevo aunque haya uno idéntico reciente
+    cache: Optional[bool] = True
+    # Entrega un caso reciente distinto ya generado con los mismos parámetros, si existe
+    reuse_recent: Optional[bool] = False
+    # Incluye la respuesta cruda del modelo, el texto y el registro guardado completo
+    debug: Optional[bool] = False
+
     # Alternativamente, si se provee `case_text`, se puede usar para analizar/consultar.
     case_id: Optional[str] = None
     case_text: Optional[str] = None
@@ -144,6 +425,194 @@ def extract_text_from_response(response) -> Optional[str]:
     return None
 
 
+def build_generation_prompt(req: SimulateRequest) -> str:
+    """Construye la instrucción de generación a partir de los parámetros del frontend."""
+    theme = req.theme or "temas de trabajo social general"
+    difficulty = (req.difficulty or "basico").lower()
+    
+    # MAPEO DE PARÁMETROS FRONTEND -> PROMPT
+    # Mapeo de grupo etario
+    age_group_map = {
+        'primera_infancia': 'primera infancia',
+        'niñez': 'niñez',
+        'adolescencia': 'adolescencia',
+        'adultez': 'adultez',
+        'adulto_mayor': 'adulto mayor'
+    }
+    age_group_str = age_group_map.get(req.age_group, req.age_group) if req.age_group else None
+    
+    # Mapeo de contexto territorial
+    context_map = {
+        'urbano': 'urbano',
+        'rural': 'rural',
+        'rural_extremo': 'rural extremo'
+    }
+    context_str = context_map.get(req.context, req.context) if req.context else None
+    
+    # Mapeo de enfoque principal
+    focus_map = {
+        'derechos_humanos': 'derechos humanos',
+        'enfoque_genero': 'enfoque de género',
+        'determinantes_sociales': 'determinantes sociales',
+        'comunitario': 'comunitario',
+        'sistemico_familiar': 'sistémico familiar'
+    }
+    focus_str = focus_map.get(req.focus_area, req.focus_area) if req.focus_area else None
+    
+    # Mapeo de competencia objetivo
+    competency_map = {
+        'diagnostico_social': 'diagnóstico social',
+        'diseño_intervencion': 'diseño de intervención',
+        'articulacion_redes': 'articulación de redes',
+        'entrevista_vinculacion': 'entrevista/vinculación',
+        'evaluacion': 'evaluación'
+    }
+    competency_str = competency_map.get(req.competency, req.competency) if req.competency else None
+    
+    # Mapeo de nivel de dificultad
+    difficulty_map = {
+        'basico': 'bajo',
+        'intermedio': 'medio',
+        'avanzado': 'alto'
+    }
+    difficulty_prompt = difficulty_map.get(difficulty, difficulty)
+    
+    # Construir instrucción para el prompt con los parámetros
+    prompt_input = f"Genera un caso con los siguientes parámetros:\n\n"
+    prompt_input += f"- eje: {theme}\n"
+    prompt_input += f"- nivel: {difficulty_prompt}\n"
+    
+    if age_group_str:
+        prompt_input += f"- grupoEtario: {age_group_str}\n"
+    
+    if context_str:
+        prompt_input += f"- tipoTerritorio: {context_str}\n"
+    
+    if focus_str:
+        prompt_input += f"- enfoquePrincipal: {focus_str}\n"
+    
+    if competency_str:
+        prompt_input += f"- competenciaObjetivo: {competency_str}\n"
+    
+    # Extensión del caso
+    case_length = req.case_length or 'medio'
+    length_map = {
+        'corto': '4 párrafos',
+        'medio': '5 párrafos',
+        'extenso': '6 párrafos'
+    }
+    prompt_input += f"\nUsa {length_map.get(case_length, '5 párrafos')} para el relato.\n"
+    prompt_input += "\nResponde únicamente con el JSON especificado en tu configuración, sin texto adicional."
+    return prompt_input
+
+
+def parse_case_json(text: str) -> Optional[dict]:
+    """Intenta parsear el caso JSON del texto retornado por el modelo."""
+    try:
+        return json.loads(text)
+    except Exception:
+        # si no está en formato JSON exacto, intentamos buscar el primer bloque JSON
+        try:
+            start = text.index('{')
+            end = text.rindex('}')
+            candidate = text[start:end+1]
+            return json.loads(candidate)
+        except Exception:
+            return None
+
+
+# Single-flight y caché de generaciones idénticas
+generation_cache = _gen.GenerationCache()
+
+
+def _generation_params(req: SimulateRequest) -> dict:
+    return {name: getattr(req, name) for name in _gen.GENERATION_PARAMS}
+
+
+async def _request_case(prompt_input: str) -> dict:
+    """Llama al modelo y parsea el caso, sin guardarlo."""
+    api_start = time.time()
+    try:
+        resp = await client.acreate(
+            prompt=PROMPT,
+            input=prompt_input,
+        )
+    except _llm.DeadlineExceeded as e:
+        logger.warning(f"Generación de caso cancelada: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        logger.exception("Error llamando a OpenAI para generar caso")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    api_time = time.time() - api_start
+    logger.info(f"OpenAI API call took {api_time:.2f}s")
+
+    text = extract_text_from_response(resp) or ""
+    case_obj = parse_case_json(text)
+
+    try:
+        raw = resp.to_dict() if hasattr(resp, "to_dict") else getattr(resp, "__dict__", repr(resp))
+    except Exception:
+        raw = repr(resp)
+
+    return {"case": case_obj, "text": text, "raw": raw, "api_time": api_time}
+
+
+async def _generate_case(prompt_input: str, key: str) -> dict:
+    """Llama al modelo, parsea el caso y lo guarda. Compartido por las peticiones agrupadas."""
+    result = await _request_case(prompt_input)
+
+    # Guardar automáticamente el caso si pudimos parsear un objeto
+    result["saved"] = None
+    if result["case"]:
+        try:
+            result["saved"] = await _adb.save_case(DB_PATH, result["case"], generation_key=key)
+        except Exception:
+            logger.exception("Error guardando caso en DB")
+
+    return result
+
+
+# Pool de casos pregenerados (SIMTS_POOL_SPECS); la tarea de relleno arranca en `lifespan`
+case_pool = _gen.CasePool(DB_PATH, _gen.parse_pool_specs(_gen.POOL_SPECS))
+
+
+async def _generate_for_pool(params: dict) -> Optional[dict]:
+    """Genera un caso para el pool; se guarda en `cases` recién al entregarlo."""
+    req = SimulateRequest(generate=True, **params)
+    return (await _request_case(build_generation_prompt(req)))["case"]
+
+
+def _lean_saved(saved: Optional[dict], debug: bool = False) -> Optional[dict]:
+    """Registro guardado sin el payload, que ya viaja como `case` (salvo en modo debug)."""
+    if not saved or debug:
+        return saved
+    return {k: v for k, v in saved.items() if k != "payload"}
+
+
+def _served_case_response(case_obj: dict, saved: Optional[dict], source: str, start_time: float, debug: bool = False) -> dict:
+    """Respuesta de /api/simulate para casos entregados sin llamar al modelo."""
+    return {
+        "ok": True,
+        "case": case_obj,
+        "saved": _lean_saved(saved, debug),
+        "source": source,
+        "metrics": {"total_time": round(time.time() - start_time, 2), "api_time": 0, "processing_time": 0}
+    }
+
+
+async def _recent_generated_case(key: str) -> Optional[dict]:
+    """Elige, rotando, uno de los casos recientes generados con la misma clave."""
+    since = (datetime.utcnow() - timedelta(hours=_gen.RECENT_CASE_WINDOW_HOURS)).isoformat()
+    ids = await _adb.recent_generated_case_ids(DB_PATH, key, since)
+    if not ids:
+        return None
+    case = await _adb.get_case(DB_PATH, ids[generation_cache.next_rotation(key) % len(ids)])
+    if case:
+        generation_cache.recent_served += 1
+    return case
+
+
 @app.post("/api/simulate")
 async def simulate(req: SimulateRequest):
     """Recibe el texto del caso y llama al prompt ID preconfigurado en el servidor.
@@ -152,173 +621,296 @@ async def simulate(req: SimulateRequest):
     diferentes prompts por caso, pasalos en `options`.
     """
 
-    PROMPT_ID = "pmpt_692bbe09d0b481968c7281d521eb16760a51d9f0c77edf52"
-
     # Si solicita generar un caso nuevo, construimos una instrucción clara para el prompt
     if req.generate:
         start_time = time.time()
-        
-        theme = req.theme or "temas de trabajo social general"
-        difficulty = (req.difficulty or "basico").lower()
-        
-        # MAPEO DE PARÁMETROS FRONTEND -> PROMPT
-        # Mapeo de grupo etario
-        age_group_map = {
-            'primera_infancia': 'primera infancia',
-            'niñez': 'niñez',
-            'adolescencia': 'adolescencia',
-            'adultez': 'adultez',
-            'adulto_mayor': 'adulto mayor'
-        }
-        age_group_str = age_group_map.get(req.age_group, req.age_group) if req.age_group else None
-        
-        # Mapeo de contexto territorial
-        context_map = {
-            'urbano': 'urbano',
-            'rural': 'rural',
-            'rural_extremo': 'rural extremo'
-        }
-        context_str = context_map.get(req.context, req.context) if req.context else None
-        
-        # Mapeo de enfoque principal
-        focus_map = {
-            'derechos_humanos': 'derechos humanos',
-            'enfoque_genero': 'enfoque de género',
-            'determinantes_sociales': 'determinantes sociales',
-            'comunitario': 'comunitario',
-            'sistemico_familiar': 'sistémico familiar'
-        }
-        focus_str = focus_map.get(req.focus_area, req.focus_area) if req.focus_area else None
-        
-        # Mapeo de competencia objetivo
-        competency_map = {
-            'diagnostico_social': 'diagnóstico social',
-            'diseño_intervencion': 'diseño de intervención',
-            'articulacion_redes': 'articulación de redes',
-            'entrevista_vinculacion': 'entrevista/vinculación',
-            'evaluacion': 'evaluación'
-        }
-        competency_str = competency_map.get(req.competency, req.competency) if req.competency else None
-        
-        # Mapeo de nivel de dificultad
-        difficulty_map = {
-            'basico': 'bajo',
-            'intermedio': 'medio',
-            'avanzado': 'alto'
-        }
-        difficulty_prompt = difficulty_map.get(difficulty, difficulty)
-        
-        # Construir instrucción para el prompt con los parámetros
-        prompt_input = f"Genera un caso con los siguientes parámetros:\n\n"
-        prompt_input += f"- eje: {theme}\n"
-        prompt_input += f"- nivel: {difficulty_prompt}\n"
-        
-        if age_group_str:
-            prompt_input += f"- grupoEtario: {age_group_str}\n"
-        
-        if context_str:
-            prompt_input += f"- tipoTerritorio: {context_str}\n"
-        
-        if focus_str:
-            prompt_input += f"- enfoquePrincipal: {focus_str}\n"
-        
-        if competency_str:
-            prompt_input += f"- competenciaObjetivo: {competency_str}\n"
-        
-        # Extensión del caso
-        case_length = req.case_length or 'medio'
-        length_map = {
-            'corto': '4 párrafos',
-            'medio': '5 párrafos',
-            'extenso': '6 párrafos'
-        }
-        prompt_input += f"\nUsa {length_map.get(case_length, '5 párrafos')} para el relato.\n"
-        prompt_input += "\nResponde únicamente con el JSON especificado en tu configuración, sin texto adicional."
-        
-        api_start = time.time()
-        try:
-            resp = client.responses.create(
-                prompt={"id": PROMPT_ID, "version": "3"},
-                input=prompt_input,
-            )
-        except Exception as e:
-            logger.exception("Error llamando a OpenAI para generar caso")
-            raise HTTPException(status_code=500, detail=str(e))
-        
-        api_time = time.time() - api_start
-        logger.info(f"OpenAI API call took {api_time:.2f}s")
+        key = _gen.generation_key(_generation_params(req))
 
-        text = extract_text_from_response(resp) or ""
-        # Intentamos parsear JSON del texto retornado
-        case_obj = None
-        try:
-            case_obj = json.loads(text)
-        except Exception:
-            # si no está en formato JSON exacto, intentamos buscar el primer bloque JSON
-            try:
-                start = text.index('{')
-                end = text.rindex('}')
-                candidate = text[start:end+1]
-                case_obj = json.loads(candidate)
-            except Exception:
-                case_obj = None
+        if req.reuse_recent:
+            recent = await _recent_generated_case(key)
+            if recent:
+                return _served_case_response(recent["payload"], recent, "recent", start_time, req.debug)
 
-        try:
-            raw = resp.to_dict() if hasattr(resp, "to_dict") else getattr(resp, "__dict__", repr(resp))
-        except Exception:
-            raw = repr(resp)
+        # Caso pregenerado del pool, si la combinación está configurada y hay stock
+        pooled = await case_pool.take(key)
+        if pooled:
+            saved = await _adb.save_case(DB_PATH, pooled["case"], generation_key=key)
+            return _served_case_response(pooled["case"], saved, "pool", start_time, req.debug)
 
-        # Guardar automáticamente el caso si pudimos parsear un objeto
-        saved = None
-        if case_obj:
-            try:
-                saved = _db.save_case(DB_PATH, case_obj)
-            except Exception:
-                logger.exception("Error guardando caso en DB")
+        prompt_input = build_generation_prompt(req)
+        result, source = await generation_cache.get_or_generate(
+            key, lambda: _generate_case(prompt_input, key), use_cache=req.cache is not False
+        )
 
         total_time = time.time() - start_time
-        logger.info(f"Total generation time: {total_time:.2f}s (API: {api_time:.2f}s, Processing: {total_time - api_time:.2f}s)")
+        api_time = result["api_time"] if source == "generated" else 0
+        logger.info(f"Total generation time: {total_time:.2f}s (API: {api_time:.2f}s, source: {source})")
         
-        return {
-            "ok": True, 
-            "case": case_obj, 
-            "saved": saved, 
-            "text": text, 
-            "raw_response": raw,
+        response = {
+            "ok": True,
+            "case": result["case"],
+            "saved": _lean_saved(result["saved"], req.debug),
+            "source": source,
             "metrics": {
                 "total_time": round(total_time, 2),
                 "api_time": round(api_time, 2),
                 "processing_time": round(total_time - api_time, 2)
             }
         }
+        # El texto solo aporta si no se pudo parsear el caso; la respuesta cruda solo en debug
+        if req.debug or not result["case"]:
+            response["text"] = result["text"]
+        if req.debug:
+            response["raw_response"] = result["raw"]
+        return response
 
     # Si llega texto libre para analizar
     if req.case_text:
         try:
-            resp = client.responses.create(
-                prompt={"id": PROMPT_ID, "version": "3"},
+            resp = await client.acreate(
+                prompt=PROMPT,
                 input=req.case_text,
             )
+        except _llm.DeadlineExceeded as e:
+            logger.warning(f"Consulta al modelo cancelada: {e}")
+            raise HTTPException(status_code=504, detail=str(e))
         except Exception as e:
             logger.exception("Error llamando a OpenAI")
             raise HTTPException(status_code=500, detail=str(e))
 
-        text = extract_text_from_response(resp)
+        response = {"ok": True, "text": extract_text_from_response(resp)}
+        if req.debug:
+            try:
+                response["raw_response"] = resp.to_dict() if hasattr(resp, "to_dict") else getattr(resp, "__dict__", repr(resp))
+            except Exception:
+                response["raw_response"] = repr(resp)
+        return response
+
+    raise HTTPException(status_code=400, detail="Petición inválida: enviar 'generate' o 'case_text'.")
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _generation_events(prompt_input: str, key: str):
+    start_time = time.time()
+    # Evento inicial inmediato: el cliente recibe el primer byte sin esperar al modelo
+    yield _sse("start", {})
+    parts = []
+    try:
+        async for chunk in client.astream(prompt=PROMPT, input=prompt_input):
+            parts.append(chunk)
+            yield _sse("delta", {"text": chunk})
+    except Exception as e:
+        logger.exception("Error llamando a OpenAI para generar caso (stream)")
+        yield _sse("error", {"detail": str(e)})
+        return
+    api_time = time.time() - start_time
+
+    text = "".join(parts)
+    case_obj = parse_case_json(text)
+    saved = None
+    if case_obj:
         try:
-            raw = resp.to_dict() if hasattr(resp, "to_dict") else getattr(resp, "__dict__", repr(resp))
+            saved = await _adb.save_case(DB_PATH, case_obj, generation_key=key)
         except Exception:
-            raw = repr(resp)
+            logger.exception("Error guardando caso en DB")
+
+    total_time = time.time() - start_time
+    yield _sse("case", {
+        "case": case_obj,
+        "saved": _lean_saved(saved),
+        # El texto ya llegó en los eventos `delta`; solo se repite si no se pudo parsear
+        "text": None if case_obj else text,
+        "metrics": {
+            "total_time": round(total_time, 2),
+            "api_time": round(api_time, 2),
+            "processing_time": round(total_time - api_time, 2)
+        }
+    })
 
-        return {"ok": True, "text": text, "raw_response": raw}
 
-    raise HTTPException(status_code=400, detail="Petición inválida: enviar 'generate' o 'case_text'.")
+@app.post("/api/simulate/stream")
+async def simulate_stream(req: SimulateRequest):
+    """Genera un caso y retransmite la salida del modelo como Server-Sent Events.
+
+    Eventos: `start` al aceptar la petición, `delta` ({"text"}) por cada fragmento
+    generado, y al final `case` ({"case", "saved", "text", "metrics"}) o `error` ({"detail"}).
+    """
+    prompt_input = build_generation_prompt(req)
+    key = _gen.generation_key(_generation_params(req))
+    return StreamingResponse(
+        _generation_events(prompt_input, key),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+class BatchSimulateRequest(BaseModel):
+    # Una lista de conjuntos de parámetros, o bien `count` casos con los mismos `params`
+    items: Optional[List[SimulateRequest]] = None
+    count: Optional[int] = None
+    params: Optional[SimulateRequest] = None
+    # Colección a la que se agregan los casos generados
+    collection_id: Optional[int] = None
+    # Generaciones simultáneas (acotado por SIMTS_BATCH_MAX_PARALLELISM)
+    parallelism: Optional[int] = None
+
+
+def _ndjson(data: dict) -> str:
+    return json.dumps(data, ensure_ascii=False) + "\n"
+
+
+# Tareas lanzadas sin esperar; se guarda la referencia para que no las recolecte el GC
+_background_tasks = set()
+
+
+def _spawn(coro) -> asyncio.Task:
+    task = asyncio.ensure_future(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+async def _give_back_pooled(generated: list):
+    """Devuelve al pool los casos del lote que salieron de él (entradas de `_batch_events`)."""
+    for _, key, _, pooled in generated:
+        if pooled is not None:
+            await case_pool.give_back(key, pooled)
+
+
+async def _salvage_batch(generated: list, collection_id: Optional[int]):
+    """Lote interrumpido: guarda los casos generados y devuelve al pool los que salieron de él."""
+    generated = sorted(generated, key=lambda entry: entry[0])
+    fresh = [(key, case_obj) for _, key, case_obj, pooled in generated if pooled is None]
+    try:
+        await _give_back_pooled(generated)
+        if fresh:
+            await _adb.save_cases_bulk(
+                DB_PATH, [case_obj for _, case_obj in fresh], generation_keys=[key for key, _ in fresh], collection_id=collection_id,
+            )
+        logger.info(f"Lote interrumpido: {len(fresh)} casos guardados, {len(generated) - len(fresh)} devueltos al pool")
+    except Exception:
+        logger.exception("Error guardando casos de un lote interrumpido")
+
+
+async def _batch_events(requests: List[SimulateRequest], parallelism: int, collection_id: Optional[int]):
+    start_time = time.time()
+    semaphore = asyncio.Semaphore(parallelism)
+
+    async def run_one(index: int, item: SimulateRequest):
+        async with semaphore:
+            item_start = time.time()
+            key = _gen.generation_key(_generation_params(item))
+            pooled = None
+            try:
+                pooled = await case_pool.take(key)
+                if pooled:
+                    case_obj, source = pooled["case"], "pool"
+                else:
+                    case_obj, source = (await _request_case(build_generation_prompt(item)))["case"], "generated"
+                error = None if case_obj else "La respuesta del modelo no contiene un caso JSON válido"
+            except HTTPException as e:
+                case_obj, source, error = None, "generated", e.detail
+            except Exception as e:
+                logger.exception("Error generando caso en lote")
+                case_obj, source, error = None, "generated", str(e)
+            return index, key, case_obj, source, error, time.time() - item_start, pooled
+
+    # Los casos se generan sin guardar (y sin agrupar: cada ítem debe ser distinto)
+    # y se insertan todos juntos al final en una sola transacción
+    tasks = [asyncio.ensure_future(run_one(i, item)) for i, item in enumerate(requests)]
+    generated = []
+    completed = False
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            index, key, case_obj, source, error, elapsed, pooled = await next_done
+            line = {"type": "item", "index": index, "ok": error is None, "source": source, "elapsed": round(elapsed, 2)}
+            if error is None:
+                line["case"] = case_obj
+                generated.append((index, key, case_obj, pooled))
+            else:
+                line["error"] = error
+            yield _ndjson(line)
+        completed = True
+    finally:
+        if not completed:
+            # El cliente se desconectó: los ítems terminados (ya pagados) no se pierden
+            seen = {entry[0] for entry in generated}
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled() and task.exception() is None:
+                    index, key, case_obj, _, error, _, pooled = task.result()
+                    if error is None and index not in seen:
+                        generated.append((index, key, case_obj, pooled))
+            # En una tarea aparte: la tarea de la respuesta ya está cancelada
+            _spawn(_salvage_batch(generated, collection_id))
+
+    generated.sort(key=lambda entry: entry[0])
+    saved = []
+    error = None
+    try:
+        saved = await _adb.save_cases_bulk(
+            DB_PATH,
+            [case_obj for _, _, case_obj, _ in generated],
+            generation_keys=[key for _, key, _, _ in generated],
+            collection_id=collection_id,
+        )
+    except Exception as e:
+        logger.exception("Error guardando casos del lote")
+        error = str(e)
+        # Los pregenerados no se pierden: vuelven al pool para la próxima petición
+        try:
+            await _give_back_pooled(generated)
+        except Exception:
+            logger.exception("Error devolviendo al pool los casos de un lote fallido")
+
+    yield _ndjson({
+        "type": "done",
+        "ok": error is None,
+        "error": error,
+        "requested": len(requests),
+        "succeeded": len(generated),
+        "failed": len(requests) - len(generated),
+        "saved": [{**record, "index": index} for record, (index, _, _, _) in zip(saved, generated)],
+        "collection_id": collection_id,
+        "total_time": round(time.time() - start_time, 2),
+    })
+
+
+@app.post("/api/simulate/batch")
+async def simulate_batch(req: BatchSimulateRequest):
+    """Genera varios casos en paralelo y los guarda en una sola transacción.
+
+    Responde NDJSON: una línea `{"type": "item", ...}` por caso en el orden en que
+    terminan, y una línea final `{"type": "done", "saved": [...]}` con los registros
+    guardados (y agregados a `collection_id`, si se indicó).
+    """
+    if req.items:
+        requests = list(req.items)
+    elif req.count:
+        requests = [req.params or SimulateRequest()] * req.count
+    else:
+        raise HTTPException(status_code=400, detail="Enviar 'items' o 'count' (con 'params')")
+    if len(requests) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Máximo {BATCH_MAX_ITEMS} casos por lote")
+    if req.collection_id is not None and not await _adb.collection_exists(DB_PATH, req.collection_id):
+        raise HTTPException(status_code=404, detail="Colección no encontrada")
+
+    parallelism = max(1, min(req.parallelism or BATCH_MAX_PARALLELISM, BATCH_MAX_PARALLELISM))
+    return StreamingResponse(
+        _batch_events(requests, parallelism, req.collection_id),
+        media_type="application/x-ndjson",
+    )
 
 
 @app.post("/api/cases")
 async def save_case_endpoint(case: dict):
     """Guarda un case object JSON enviado por el cliente."""
     try:
-        saved = _db.save_case(DB_PATH, case)
+        saved = await _adb.save_case(DB_PATH, case)
     except Exception as e:
         logger.exception("Error guardando caso desde endpoint")
         raise HTTPException(status_code=500, detail=str(e))
@@ -326,20 +918,102 @@ async def save_case_endpoint(case: dict):
 
 
 @app.get("/api/cases")
-async def list_cases_endpoint(theme: Optional[str] = None, difficulty: Optional[str] = None, limit: int = 50, status: Optional[str] = None, created_by: Optional[int] = None):
+async def list_cases_endpoint(theme: Optional[str] = None, difficulty: Optional[str] = None, limit: int = 50, status: Optional[str] = None, created_by: Optional[int] = None, fields: str = "full", after_id: Optional[int] = None):
+    """Lista casos. `fields=summary` omite el payload; para la página siguiente
+    enviar `after_id` con el `next_cursor` de la respuesta anterior."""
+    if fields not in ("summary", "full"):
+        raise HTTPException(status_code=400, detail="'fields' debe ser 'summary' o 'full'")
     try:
-        items = _db.list_cases(DB_PATH, theme=theme, difficulty=difficulty, limit=limit, status=status, created_by=created_by)
+        items = await _adb.list_cases(DB_PATH, theme=theme, difficulty=difficulty, limit=limit, status=status, created_by=created_by, fields=fields, after_id=after_id)
     except Exception as e:
         logger.exception("Error leyendo casos de DB")
         raise HTTPException(status_code=500, detail=str(e))
-    return {"ok": True, "cases": items}
+    next_cursor = items[-1]["id"] if items and len(items) == limit else None
+    # Respuesta ya serializada: evita recorrer cientos de payloads con jsonable_encoder en el event loop
+    return FastJSONResponse({"ok": True, "cases": items, "next_cursor": next_cursor})
+
+
+@app.get("/api/cases/search")
+async def search_cases_endpoint(q: str, limit: int = 20, offset: int = 0, status: Optional[str] = "active"):
+    """Búsqueda de texto completo en título, notas, tags y relato. Resultados por
+    relevancia con un `snippet` resaltado; para la página siguiente enviar `offset=next_offset`."""
+    try:
+        results = await _adb.search_cases(DB_PATH, q, limit=limit, offset=offset, status=status or None)
+    except Exception as e:
+        logger.exception("Error buscando casos")
+        raise HTTPException(status_code=500, detail=str(e))
+    next_offset = offset + len(results) if len(results) == limit else None
+    return {"ok": True, "results": results, "next_offset": next_offset}
+
+
+@app.get("/api/cases/export")
+async def export_cases_endpoint(status: Optional[str] = None):
+    """Exporta la biblioteca de casos como NDJSON (un caso por línea, en orden de id),
+    en streaming y con memoria constante. Se reimporta con `POST /api/cases/import`."""
+    return StreamingResponse(
+        _adb.iterate(_db.iter_cases_export(DB_PATH, status=status)),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="cases.ndjson"'},
+    )
+
+
+@app.post("/api/cases/import")
+async def import_cases_endpoint(request: Request, dedupe: bool = True):
+    """Importa casos desde un cuerpo NDJSON (formato de `/api/cases/export` o un
+    case_obj por línea). El cuerpo se lee por partes y se inserta en lotes de
+    `SIMTS_IMPORT_BATCH_SIZE` casos por transacción; con `dedupe` se omiten los
+    `case_id` ya existentes. Las líneas inválidas se informan en `errors`."""
+    inserted = skipped = 0
+    errors = []
+    batch = []
+    line_no = 0
+    buffer = b""
+
+    async def flush():
+        nonlocal inserted, skipped, batch
+        if batch:
+            result = await _adb.import_cases(DB_PATH, batch, dedupe=dedupe)
+            inserted += result["inserted"]
+            skipped += result["skipped"]
+            batch = []
+
+    def parse(line: bytes):
+        nonlocal line_no
+        line_no += 1
+        if not line.strip():
+            return
+        try:
+            record = orjson.loads(line) if orjson is not None else json.loads(line)
+        except ValueError as e:
+            errors.append({"line": line_no, "detail": str(e)})
+            return
+        if not isinstance(record, dict):
+            errors.append({"line": line_no, "detail": "se esperaba un objeto JSON"})
+            return
+        batch.append(record)
+
+    try:
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                parse(line)
+            if len(batch) >= _db.IMPORT_BATCH_SIZE:
+                await flush()
+        parse(buffer)
+        await flush()
+    except Exception as e:
+        logger.exception("Error importando casos")
+        raise HTTPException(status_code=500, detail=f"{e} (importados hasta ahora: {inserted})")
+
+    return {"ok": True, "inserted": inserted, "skipped": skipped, "errors": errors[:20], "error_count": len(errors)}
 
 
 @app.get("/api/cases/{case_id}")
 async def get_case_endpoint(case_id: int):
     """Obtiene un caso específico por ID."""
     try:
-        case = _db.get_case(DB_PATH, case_id)
+        case = await _adb.get_case(DB_PATH, case_id)
         if not case:
             raise HTTPException(status_code=404, detail="Caso no encontrado")
         return {"ok": True, "case": case}
@@ -354,7 +1028,7 @@ async def get_case_endpoint(case_id: int):
 async def update_case_endpoint(case_id: int, updates: dict):
     """Actualiza un caso existente."""
     try:
-        updated = _db.update_case(DB_PATH, case_id, updates)
+        updated = await _adb.update_case(DB_PATH, case_id, updates)
         if not updated:
             raise HTTPException(status_code=404, detail="Caso no encontrado")
         return {"ok": True, "case": updated}
@@ -369,7 +1043,7 @@ async def update_case_endpoint(case_id: int, updates: dict):
 async def delete_case_endpoint(case_id: int):
     """Elimina un caso (soft delete)."""
     try:
-        deleted = _db.delete_case(DB_PATH, case_id)
+        deleted = await _adb.delete_case(DB_PATH, case_id)
         if not deleted:
             raise HTTPException(status_code=404, detail="Caso no encontrado")
         return {"ok": True, "message": "Caso eliminado exitosamente"}
@@ -384,13 +1058,62 @@ async def delete_case_endpoint(case_id: int):
 async def get_statistics_endpoint():
     """Obtiene estadísticas de los casos para el panel de docentes."""
     try:
-        stats = _db.get_statistics(DB_PATH)
+        stats = await _adb.get_statistics(DB_PATH)
         return {"ok": True, "statistics": stats}
     except Exception as e:
         logger.exception("Error obteniendo estadísticas")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/admin/cache")
+async def get_cache_stats_endpoint():
+    """Contadores de las cachés en memoria (casos decodificados y generaciones)."""
+    return {"ok": True, "case_cache": _db.case_cache_stats(), "generation_cache": generation_cache.stats()}
+
+
+@app.get("/api/admin/pool")
+async def get_pool_stats_endpoint():
+    """Estado del pool de casos pregenerados: profundidad por combinación, tasa de aciertos y latencia de relleno."""
+    try:
+        return {"ok": True, "pool": await case_pool.stats()}
+    except Exception as e:
+        logger.exception("Error obteniendo estado del pool")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/admin/writer")
+async def get_writer_stats_endpoint():
+    """Escritor único de respuestas y sesiones: commits, operaciones y tamaño medio de grupo."""
+    return {"ok": True, "writer": _db.writer_stats().get(DB_PATH)}
+
+
+@app.get("/api/admin/sql-trace")
+async def get_sql_trace_endpoint(limit: int = 50, order: str = "total"):
+    """Sentencias SQL agregadas por huella (requiere `SIMTS_SQL_TRACE=1`), con su plan si fueron lentas."""
+    return {
+        "ok": True,
+        "enabled": _sqltrace.SQL_TRACE,
+        "slow_ms": _sqltrace.tracer.slow_ms,
+        "statements": _sqltrace.tracer.report(limit=limit, order=order),
+    }
+
+
+@app.delete("/api/admin/sql-trace")
+async def reset_sql_trace_endpoint():
+    _sqltrace.tracer.reset()
+    return {"ok": True}
+
+
+_metrics.registry.gauge("simts_llm_in_flight", "Llamadas al LLM en curso en este worker", fn=lambda: client.in_flight)
+_metrics.registry.gauge("simts_db_write_queue", "Escrituras en cola del escritor agrupado", fn=lambda: (_db.writer_stats().get(DB_PATH) or {}).get("queued", 0))
+
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Métricas del worker en formato de texto de Prometheus."""
+    return PlainTextResponse(_metrics.registry.render(), media_type=_metrics.CONTENT_TYPE)
+
+
 # ===== Endpoints de Colecciones =====
 
 @app.post("/api/collections")
@@ -401,7 +1124,7 @@ async def create_collection_endpoint(data: dict):
         description = data.get("description", "")
         if not name:
             raise HTTPException(status_code=400, detail="El nombre es requerido")
-        collection = _db.create_collection(DB_PATH, name, description)
+        collection = await _adb.create_collection(DB_PATH, name, description)
         return {"ok": True, "collection": collection}
     except HTTPException:
         raise
@@ -414,7 +1137,7 @@ async def create_collection_endpoint(data: dict):
 async def list_collections_endpoint():
     """Lista todas las colecciones."""
     try:
-        collections = _db.list_collections(DB_PATH)
+        collections = await _adb.list_collections(DB_PATH)
         return {"ok": True, "collections": collections}
     except Exception as e:
         logger.exception("Error listando colecciones")
@@ -425,7 +1148,7 @@ async def list_collections_endpoint():
 async def get_collection_endpoint(collection_id: int):
     """Obtiene una colección con sus casos."""
     try:
-        collection = _db.get_collection(DB_PATH, collection_id)
+        collection = await _adb.get_collection(DB_PATH, collection_id)
         if not collection:
             raise HTTPException(status_code=404, detail="Colección no encontrada")
         return {"ok": True, "collection": collection}
@@ -442,7 +1165,7 @@ async def update_collection_endpoint(collection_id: int, data: dict):
     try:
         name = data.get("name")
         description = data.get("description")
-        collection = _db.update_collection(DB_PATH, collection_id, name, description)
+        collection = await _adb.update_collection(DB_PATH, collection_id, name, description)
         if not collection:
             raise HTTPException(status_code=404, detail="Colección no encontrada")
         return {"ok": True, "collection": collection}
@@ -457,7 +1180,7 @@ async def update_collection_endpoint(collection_id: int, data: dict):
 async def delete_collection_endpoint(collection_id: int):
     """Elimina una colección."""
     try:
-        deleted = _db.delete_collection(DB_PATH, collection_id)
+        deleted = await _adb.delete_collection(DB_PATH, collection_id)
         if not deleted:
             raise HTTPException(status_code=404, detail="Colección no encontrada")
         return {"ok": True, "message": "Colección eliminada exitosamente"}
@@ -472,7 +1195,7 @@ async def delete_collection_endpoint(collection_id: int):
 async def add_case_to_collection_endpoint(collection_id: int, case_id: int):
     """Agrega un caso a una colección."""
     try:
-        added = _db.add_case_to_collection(DB_PATH, collection_id, case_id)
+        added = await _adb.add_case_to_collection(DB_PATH, collection_id, case_id)
         if not added:
             raise HTTPException(status_code=400, detail="El caso ya está en la colección o no existe")
         return {"ok": True, "message": "Caso agregado a la colección"}
@@ -487,7 +1210,7 @@ async def add_case_to_collection_endpoint(collection_id: int, case_id: int):
 async def remove_case_from_collection_endpoint(collection_id: int, case_id: int):
     """Remueve un caso de una colección."""
     try:
-        removed = _db.remove_case_from_collection(DB_PATH, collection_id, case_id)
+        removed = await _adb.remove_case_from_collection(DB_PATH, collection_id, case_id)
         if not removed:
             raise HTTPException(status_code=404, detail="Caso no encontrado en la colección")
         return {"ok": True, "message": "Caso removido de la colección"}
@@ -521,10 +1244,10 @@ class FeedbackRequest(BaseModel):
 async def student_login(req: LoginRequest):
     """Login para estudiantes."""
     try:
-        student = _db.authenticate_student(DB_PATH, req.username, req.password)
+        student = await _auth.authenticate(DB_PATH, req.username, req.password)
         if not student:
             raise HTTPException(status_code=401, detail="Usuario o contraseña incorrectos")
-        return {"ok": True, "student": student, "token": f"student-{student['id']}"}
+        return {"ok": True, "student": student, "token": _auth.issue_token(student)}
     except HTTPException:
         raise
     except Exception as e:
@@ -533,42 +1256,16 @@ async def student_login(req: LoginRequest):
 
 
 @app.post("/api/answers")
-async def submit_answers(req: SubmitAnswersRequest):
+async def submit_answers(req: SubmitAnswersRequest, student_id: int = Depends(_auth.current_student)):
     """Estudiante envía sus respuestas para un caso. Requiere autenticación."""
     try:
-        student_id = 1  # TODO: extraer de token
-        session_id = _db.create_session(DB_PATH, student_id, req.case_id)
-        
-        case = _db.get_case(DB_PATH, req.case_id)
-        questions = case.get("payload", {}).get("questions", []) if case else []
-        
-        score = 0
-        total = 0
-        
-        for ans in req.answers:
-            q_idx = ans.get("question_index")
-            selected = ans.get("selected_option")
-            open_ans = ans.get("open_answer")
-            
-            is_correct = None
-            if selected is not None and q_idx < len(questions):
-                q = questions[q_idx]
-                correct_idx = q.get("correct_index") or q.get("correctIndex")
-                if correct_idx is not None:
-                    total += 1
-                    is_correct = 1 if selected == correct_idx else 0
-                    if is_correct:
-                        score += 1
-            
-            _db.save_answer(DB_PATH, session_id, q_idx, selected, open_ans, is_correct)
-        
-        _db.submit_session(DB_PATH, session_id, req.duration_seconds)
+        result = await _adb.submit_session_bulk(DB_PATH, student_id, req.case_id, req.answers, req.duration_seconds)
         
         return {
             "ok": True, 
-            "session_id": session_id, 
-            "score": score,
-            "total": total,
+            "session_id": result["session_id"], 
+            "score": result["score"],
+            "total": result["total"],
             "message": "Respuestas enviadas exitosamente"
         }
     except Exception as e:
@@ -576,76 +1273,96 @@ async def submit_answers(req: SubmitAnswersRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _enrich_answers(answers: list, questions: list) -> list:
+    """Agrega a cada respuesta el texto de la pregunta, su tipo y las alternativas."""
+    enriched_answers = []
+    for answer in answers:
+        described = _db.describe_answer(questions, answer["question_index"], answer.get("selected_option"), answer.get("open_answer"))
+        if described is not None:
+            enriched_answers.append({**answer, **described})
+    return enriched_answers
+
+
+def _load_answers(student_id: Optional[int], case_id: Optional[int], session_id: Optional[int], limit: int) -> List[dict]:
+    """Sesiones con sus respuestas enriquecidas; tres consultas en total."""
+    sessions = _db.get_student_sessions(DB_PATH, student_id=student_id, case_id=case_id, limit=limit, session_id=session_id)
+    answers_by_session = _db.get_answers_for_sessions(DB_PATH, [s["session_id"] for s in sessions])
+    questions_by_case = _db.get_cases_questions(DB_PATH, [s["case_id"] for s in sessions])
+
+    for sess in sessions:
+        questions = questions_by_case.get(sess.get("case_id"), [])
+        sess["answers"] = _enrich_answers(answers_by_session.get(sess["session_id"], []), questions)
+    return sessions
+
+
 @app.get("/api/answers")
-async def get_answers(student_id: Optional[int] = None, case_id: Optional[int] = None, session_id: Optional[int] = None, limit: int = 100):
-    """Obtiene respuestas (para docentes o estudiante propio)."""
+async def get_answers(student_id: Optional[int] = None, case_id: Optional[int] = None, session_id: Optional[int] = None, limit: int = 100, token_student_id: Optional[int] = Depends(_auth.optional_student)):
+    """Obtiene respuestas (para docentes o estudiante propio).
+
+    Con un token de estudiante solo se devuelven las sesiones de ese estudiante.
+    """
+    if token_student_id is not None:
+        student_id = token_student_id
     try:
-        # Obtener todas las sesiones con filtros básicos
-        sessions = _db.get_student_sessions(DB_PATH, student_id=student_id, case_id=case_id, limit=limit)
-        
-        # Si se solicita una sesión específica, filtrar
-        if session_id:
-            sessions = [s for s in sessions if s.get("session_id") == session_id]
-        
-        for sess in sessions:
-            # Obtener respuestas de la sesión
-            answers = _db.get_session_answers(DB_PATH, sess["session_id"])
-            
-            # Enriquecer respuestas con información del caso
-            case = _db.get_case(DB_PATH, sess["case_id"]) if sess.get("case_id") else None
-            questions = case.get("payload", {}).get("questions", []) if case else []
-            
-            enriched_answers = []
-            for answer in answers:
-                q_idx = answer["question_index"]
-                if q_idx < len(questions):
-                    question = questions[q_idx]
-                    
-                    # Determinar tipo de pregunta
-                    is_open = not question.get("options") or len(question.get("options", [])) == 0
-                    
-                    enriched = {
-                        **answer,
-                        "question_text": question.get("question") or question.get("text", f"Pregunta {q_idx + 1}"),
-                        "answer_type": "open" if is_open else "multiple_choice"
-                    }
-                    
-                    # Si es múltiple opción, agregar la opción seleccionada y la correcta
-                    if not is_open:
-                        options = question.get("options", [])
-                        selected_idx = answer.get("selected_option")
-                        
-                        if selected_idx is not None and selected_idx < len(options):
-                            enriched["student_answer"] = options[selected_idx]
-                        else:
-                            enriched["student_answer"] = None
-                        
-                        # Obtener respuesta correcta
-                        correct_idx = question.get("correct_index") or question.get("correctIndex")
-                        if correct_idx is not None and correct_idx < len(options):
-                            enriched["correct_answer"] = options[correct_idx]
-                        
-                        # Agregar todas las opciones para referencia
-                        enriched["options"] = options
-                    else:
-                        # Para preguntas abiertas, usar el texto guardado
-                        enriched["student_answer"] = answer.get("open_answer")
-                    
-                    enriched_answers.append(enriched)
-            
-            sess["answers"] = enriched_answers
-            
-        return {"ok": True, "sessions": sessions}
+        sessions = await _adb.run(_load_answers, student_id, case_id, session_id, limit)
+        return FastJSONResponse({"ok": True, "sessions": sessions})
     except Exception as e:
         logger.exception("Error obteniendo respuestas")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _answer_rows_csv(rows: list, header: bool) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(_db.ANSWER_EXPORT_COLUMNS)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def _answer_rows_ndjson(rows: list) -> str:
+    return "".join(_ndjson(dict(zip(_db.ANSWER_EXPORT_COLUMNS, row))) for row in rows)
+
+
+async def _answer_export_chunks(fmt: str, filters: dict):
+    header = True
+    async for rows in _adb.iterate(_db.iter_answers_export(DB_PATH, **filters)):
+        if fmt == "csv":
+            yield _answer_rows_csv(rows, header)
+            header = False
+        else:
+            yield _answer_rows_ndjson(rows)
+    if header and fmt == "csv":
+        # Exportación vacía: al menos la fila de encabezados
+        yield _answer_rows_csv([], True)
+
+
+@app.get("/api/answers/export")
+async def export_answers(format: str = "csv", student_id: Optional[int] = None, case_id: Optional[int] = None, collection_id: Optional[int] = None, date_from: Optional[str] = None, date_to: Optional[str] = None, token_student_id: Optional[int] = Depends(_auth.optional_student)):
+    """Exporta sesiones y respuestas para corregir fuera de línea, una fila por
+    respuesta (CSV o NDJSON), en streaming y con memoria constante.
+
+    Filtros: estudiante, caso, colección y rango de fechas de la sesión
+    (`date_from`/`date_to`, ISO). Con un token de estudiante solo se exportan sus sesiones.
+    """
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="'format' debe ser 'csv' o 'ndjson'")
+    if token_student_id is not None:
+        student_id = token_student_id
+    filters = {"student_id": student_id, "case_id": case_id, "collection_id": collection_id, "date_from": date_from, "date_to": date_to}
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        _answer_export_chunks(format, filters),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="respuestas.{format}"'},
+    )
+
+
 @app.put("/api/answers/{answer_id}/feedback")
 async def update_feedback(answer_id: int, req: FeedbackRequest):
     """Docente agrega feedback y score a una respuesta."""
     try:
-        updated = _db.update_answer_feedback(DB_PATH, answer_id, req.feedback, req.score)
+        updated = await _adb.update_answer_feedback(DB_PATH, answer_id, req.feedback, req.score)
         if not updated:
             raise HTTPException(status_code=404, detail="Respuesta no encontrada")
         return {"ok": True, "message": "Feedback actualizado"}
@@ -660,7 +1377,7 @@ async def update_feedback(answer_id: int, req: FeedbackRequest):
 async def list_students():
     """Lista estudiantes (para panel docente)."""
     try:
-        students = _db.list_students(DB_PATH)
+        students = await _adb.list_students(DB_PATH)
         return {"ok": True, "students": students}
     except Exception as e:
         logger.exception("Error listando estudiantes")
@@ -0,0 +1,247 @@
+"""Métricas del proceso en el formato de texto de Prometheus (`/api/metrics`).
+
+Contadores, gauges e histogramas mínimos, sin dependencias: registrar una
+observación es una búsqueda binaria sobre los buckets y una suma bajo un lock.
+Cada worker de uvicorn tiene sus propias métricas; Prometheus debe consultar
+cada worker (o sumar por instancia).
+
+`MetricsMiddleware` mide cada petición por ruta (la plantilla, p. ej.
+`/api/cases/{case_id}`, no la URL concreta) y código de estado, y el tiempo
+que la petición pasó esperando a SQLite (ver `add_db_time`).
+"""
+import bisect
+import contextvars
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Segundos; cubren desde lecturas de caché hasta generaciones con el LLM
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LLM_BUCKETS = (0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def value(self, *label_values) -> float:
+        return self._values.get(label_values, 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(v)}" for key, v in items]
+
+
+class Gauge(_Metric):
+    """Gauge con valor propio (`inc`/`dec`/`set`) o leído al exportar (`fn`)."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Optional[Callable[[], float]] = None):
+        super().__init__(name, help)
+        self._fn = fn
+        self._value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def set(self, value: float):
+        self._value = value
+
+    def value(self) -> float:
+        return float(self._fn()) if self._fn is not None else self._value
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name} {_format_value(self.value())}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [conteo por bucket (sin acumular) + Inf, suma, total]
+        self._series: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *label_values) -> int:
+        series = self._series.get(label_values)
+        return series[2] if series else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+        lines = []
+        for key, (counts, total_sum, total) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total_sum)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {total}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, fn: Optional[Callable[[], float]] = None) -> Gauge:
+        return self.register(Gauge(name, help, fn))
+
+    def histogram(self, name: str, help: str, labels: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_duration = registry.histogram(
+    "simts_http_request_duration_seconds", "Duración de las peticiones HTTP (hasta enviar el último byte)",
+    ("method", "route", "status"),
+)
+http_in_flight = registry.gauge("simts_http_requests_in_flight", "Peticiones HTTP en curso en este worker")
+http_db_time = registry.histogram(
+    "simts_http_request_db_seconds", "Tiempo por petición en consultas y escrituras de SQLite",
+    ("method", "route"),
+)
+llm_duration = registry.histogram("simts_llm_request_duration_seconds", "Duración de las llamadas al LLM", ("op",), LLM_BUCKETS)
+llm_errors = registry.counter("simts_llm_errors_total", "Llamadas al LLM que terminaron en error", ("op", "error"))
+llm_retries = registry.counter("simts_llm_retries_total", "Reintentos de llamadas al LLM tras un error pasajero", ("op",))
+llm_hedged = registry.counter("simts_llm_hedged_total", "Llamadas al LLM cubiertas con una segunda petición", ("op",))
+llm_hedge_wins = registry.counter("simts_llm_hedge_wins_total", "Coberturas que terminaron antes que la petición original", ("op",))
+llm_deadline_exceeded = registry.counter("simts_llm_deadline_exceeded_total", "Llamadas al LLM que agotaron su plazo", ("op",))
+
+
+# ===== Tiempo de base de datos por petición =====
+
+class RequestStats:
+    __slots__ = ("db_seconds", "db_calls")
+
+    def __init__(self):
+        self.db_seconds = 0.0
+        self.db_calls = 0
+
+
+_request_stats: contextvars.ContextVar = contextvars.ContextVar("simts_request_stats", default=None)
+
+
+def add_db_time(seconds: float):
+    """Suma `seconds` al tiempo de DB de la petición en curso (si la hay).
+
+    Debe llamarse desde el event loop: el pool de `adb` no hereda el contexto.
+    """
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.db_seconds += seconds
+        stats.db_calls += 1
+
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    # Las URLs sin ruta (404) se agrupan para no crear una serie por URL
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: duración, estado y tiempo de DB de cada petición HTTP."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        http_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_in_flight.dec()
+            _request_stats.reset(token)
+            route = _route_label(scope)
+            http_duration.observe(elapsed, scope["method"], route, str(status[0]))
+            http_db_time.observe(stats.db_seconds, scope["method"], route)
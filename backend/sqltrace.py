@@ -0,0 +1,249 @@
+"""Trazado opcional de las sentencias SQLite (`SIMTS_SQL_TRACE=1`).
+
+Con el trazado activo, `db._open_connection` crea conexiones `TracedConnection`
+cuyos cursores miden cada sentencia desde `execute` hasta que se agotan sus
+filas (o empieza la siguiente sentencia del cursor), sumando solo el tiempo
+pasado dentro de SQLite. Un progress handler cuenta las instrucciones de la VM
+de SQLite, que reflejan el trabajo real (filas recorridas) aunque haya
+contención.
+
+Las sentencias se agregan por huella (el SQL sin literales y con las listas
+`IN (?, ?, ...)` colapsadas). Las que superan `SIMTS_SQL_SLOW_MS` se registran
+en el log con la forma de sus parámetros (tipos y largos, nunca valores) y, la
+primera vez, se guarda su `EXPLAIN QUERY PLAN`. El resumen se consulta en
+`GET /api/admin/sql-trace`.
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("simts.backend")
+
+SQL_TRACE = os.getenv("SIMTS_SQL_TRACE", "").lower() in ("1", "true", "yes")
+# Milisegundos a partir de los cuales una sentencia se considera lenta
+SQL_SLOW_MS = float(os.getenv("SIMTS_SQL_SLOW_MS", "50"))
+# Huellas distintas que se guardan como máximo (las nuevas se ignoran al llenarse)
+MAX_FINGERPRINTS = 500
+# Instrucciones de la VM entre llamadas al progress handler
+PROGRESS_STEPS = 1000
+# Parámetros cuya forma se detalla; del resto solo se informa la cantidad
+MAX_PARAM_SHAPES = 8
+
+_SPACE = re.compile(r"\s+")
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+def fingerprint(sql: str) -> str:
+    """SQL normalizado: espacios colapsados, literales como `?` y listas de `?` como `(?...)`."""
+    text = _LITERAL.sub("?", _SPACE.sub(" ", sql).strip())
+    return _PLACEHOLDER_LIST.sub("(?...)", text)
+
+
+def _value_shape(value) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, (bool, int)):
+        return "int"
+    if isinstance(value, float):
+        return "real"
+    if isinstance(value, str):
+        return f"text({len(value)})"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"blob({len(value)})"
+    return type(value).__name__
+
+
+def param_shape(params):
+    """Tipos y largos de los parámetros ligados, sin sus valores."""
+    if isinstance(params, dict):
+        return {key: _value_shape(value) for key, value in list(params.items())[:MAX_PARAM_SHAPES]}
+    params = list(params or ())
+    shape = [_value_shape(value) for value in params[:MAX_PARAM_SHAPES]]
+    if len(params) > MAX_PARAM_SHAPES:
+        shape.append(f"... ({len(params)} parámetros)")
+    return shape
+
+
+def explain(conn: sqlite3.Connection, sql: str, params) -> List[str]:
+    """`EXPLAIN QUERY PLAN` de `sql` como líneas indentadas según el árbol del plan."""
+    cur = sqlite3.Cursor(conn)
+    try:
+        rows = cur.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    except sqlite3.Error as e:
+        return [f"error: {e}"]
+    finally:
+        cur.close()
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node_id] + detail)
+    return lines
+
+
+class StatementStats:
+    __slots__ = ("fingerprint", "count", "total_seconds", "max_seconds", "vm_steps", "slow_count", "slow_params", "plan", "plan_pending")
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.vm_steps = 0
+        self.slow_count = 0
+        self.slow_params = None
+        self.plan: Optional[List[str]] = None
+        self.plan_pending = False
+
+    def to_dict(self) -> Dict:
+        return {
+            "fingerprint": self.fingerprint,
+            "count": self.count,
+            "total_ms": round(self.total_seconds * 1000, 3),
+            "mean_ms": round(self.total_seconds / self.count * 1000, 3) if self.count else 0.0,
+            "max_ms": round(self.max_seconds * 1000, 3),
+            "vm_steps": self.vm_steps,
+            "slow_count": self.slow_count,
+            "slow_params": self.slow_params,
+            "plan": self.plan,
+        }
+
+
+class SqlTrace:
+    """Agregado por huella de las sentencias medidas por los cursores trazados."""
+
+    def __init__(self, slow_ms: float = SQL_SLOW_MS, max_fingerprints: int = MAX_FINGERPRINTS):
+        self.slow_ms = slow_ms
+        self.max_fingerprints = max_fingerprints
+        self._stats: Dict[str, StatementStats] = {}
+        self._lock = threading.Lock()
+
+    def record(self, conn: sqlite3.Connection, sql: str, params, seconds: float, vm_steps: int):
+        key = fingerprint(sql)
+        slow = seconds * 1000 >= self.slow_ms
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                if len(self._stats) >= self.max_fingerprints:
+                    return
+                stats = self._stats[key] = StatementStats(key)
+            stats.count += 1
+            stats.total_seconds += seconds
+            stats.vm_steps += vm_steps
+            if seconds > stats.max_seconds:
+                stats.max_seconds = seconds
+            capture_plan = False
+            if slow:
+                stats.slow_count += 1
+                stats.slow_params = param_shape(params)
+                capture_plan = stats.plan is None and not stats.plan_pending and key.upper().startswith(_EXPLAINABLE)
+                stats.plan_pending = stats.plan_pending or capture_plan
+        if not slow:
+            return
+        logger.warning(f"SQL lenta ({seconds * 1000:.1f} ms, ~{vm_steps} instrucciones): {key} params={param_shape(params)}")
+        if capture_plan:
+            # Fuera del lock: el plan se obtiene con la misma conexión
+            stats.plan = explain(conn, sql, params)
+            stats.plan_pending = False
+
+    def report(self, limit: int = 50, order: str = "total") -> List[Dict]:
+        attr = {"total": "total_seconds", "max": "max_seconds", "count": "count", "slow": "slow_count", "steps": "vm_steps"}.get(order, "total_seconds")
+        with self._lock:
+            stats = sorted(self._stats.values(), key=lambda s: getattr(s, attr), reverse=True)
+        return [s.to_dict() for s in stats[:limit]]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+tracer = SqlTrace()
+
+
+class TracingCursor(sqlite3.Cursor):
+    """Cursor que mide el tiempo y las instrucciones de VM de cada sentencia."""
+
+    # [sql, parámetros, segundos, instrucciones de VM]
+    _pending = None
+
+    def _timed(self, method, *args):
+        pending = self._pending
+        conn = self.connection
+        steps = conn.vm_steps
+        start = time.perf_counter()
+        try:
+            result = method(*args)
+        except BaseException:
+            # También StopIteration al terminar de iterar
+            pending[2] += time.perf_counter() - start
+            pending[3] += conn.vm_steps - steps
+            self._finish()
+            raise
+        pending[2] += time.perf_counter() - start
+        pending[3] += conn.vm_steps - steps
+        return result
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            tracer.record(self.connection, pending[0], pending[1], pending[2], pending[3] * PROGRESS_STEPS)
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        self._pending = [sql, parameters, 0.0, 0]
+        return self._timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        rows = seq_of_parameters if isinstance(seq_of_parameters, (list, tuple)) else list(seq_of_parameters)
+        # La forma y el plan se toman de la primera fila
+        self._pending = [sql, rows[0] if rows else (), 0.0, 0]
+        try:
+            return self._timed(super().executemany, sql, rows)
+        finally:
+            self._finish()
+
+    def fetchone(self):
+        if self._pending is None:
+            return super().fetchone()
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        if self._pending is None:
+            return super().fetchmany(size)
+        rows = self._timed(super().fetchmany, size)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        if self._pending is None:
+            return super().fetchall()
+        rows = self._timed(super().fetchall)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        if self._pending is None:
+            return super().__next__()
+        return self._timed(super().__next__)
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
@@ -0,0 +1,24 @@
+import os
+import shutil
+import sys
+import tempfile
+
+# Asegura que el directorio padre (donde está main.py) esté en sys.path
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Los tests nunca abren la base versionada `backend/cases.db`: `main` toma
+# SIMTS_DB_PATH al importarse, así que se fija antes de que lo importe un test.
+_TMPDIR = tempfile.mkdtemp(prefix="simts-tests-")
+os.environ["SIMTS_DB_PATH"] = os.path.join(_TMPDIR, "tests.db")
+
+import db  # noqa: E402
+
+# TestClient sin `with` no ejecuta `lifespan`, que es donde se crea la base
+db.init_db(os.environ["SIMTS_DB_PATH"])
+
+
+def pytest_unconfigure(config):
+    db.close_connections()
+    shutil.rmtree(_TMPDIR, ignore_errors=True)
@@ -1,5 +1,7 @@
 import sys
 import os
+
+import pytest
 from fastapi.testclient import TestClient
 
 # Asegura que el directorio padre (donde está main.py) esté en sys.path
@@ -12,6 +14,15 @@ import main
 client = TestClient(main.app)
 
 
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """Base de datos temporal para los tests que escriben."""
+    path = str(tmp_path / "test.db")
+    main._db.init_db(path)
+    monkeypatch.setattr(main, "DB_PATH", path)
+    return path
+
+
 def test_simulate_mock(monkeypatch):
     class DummyResp:
         def to_dict(self):
@@ -28,3 +39,691 @@ def test_simulate_mock(monkeypatch):
     data = r.json()
     assert data.get("ok") is True
     assert "Respuesta simulada" in (data.get("text") or "")
+
+
+def test_list_cases_summary_keyset_pagination(db_path):
+    for i in range(5):
+        main._db.save_case(db_path, {"title": f"Caso {i}", "eje": "Salud mental", "questions": []})
+
+    r = client.get("/api/cases", params={"limit": 2, "fields": "summary"})
+    data = r.json()
+    assert [c["title"] for c in data["cases"]] == ["Caso 4", "Caso 3"]
+    assert "payload" not in data["cases"][0]
+
+    r = client.get("/api/cases", params={"limit": 2, "fields": "summary", "after_id": data["next_cursor"]})
+    data = r.json()
+    assert [c["title"] for c in data["cases"]] == ["Caso 2", "Caso 1"]
+
+    r = client.get("/api/cases", params={"limit": 2, "after_id": data["next_cursor"]})
+    data = r.json()
+    assert [c["title"] for c in data["cases"]] == ["Caso 0"]
+    assert data["cases"][0]["payload"]["title"] == "Caso 0"
+    assert data["next_cursor"] is None
+
+
+def _case_with_questions():
+    return {
+        "title": "Caso con preguntas",
+        "questions": [
+            {"text": "P1", "options": ["a", "b"], "correctIndex": 1},
+            {"text": "P2", "options": ["a", "b"], "correctIndex": 0},
+            {"text": "P3 abierta"},
+        ],
+    }
+
+
+def _student_headers():
+    """Login con el estudiante de prueba que crea `init_db`."""
+    r = client.post("/api/auth/login", json={"username": "estudiante1", "password": "pass"})
+    return {"Authorization": f"Bearer {r.json()['token']}"}
+
+
+def test_submit_answers_single_transaction(db_path):
+    case = main._db.save_case(db_path, _case_with_questions())
+    r = client.post("/api/answers", headers=_student_headers(), json={
+        "case_id": case["id"],
+        "duration_seconds": 30,
+        "answers": [
+            {"question_index": 0, "selected_option": 1},
+            {"question_index": 1, "selected_option": 1},
+            {"question_index": 2, "open_answer": "texto"},
+        ],
+    })
+    data = r.json()
+    assert data["ok"] is True
+    assert (data["score"], data["total"]) == (1, 2)
+
+    answers = main._db.get_session_answers(db_path, data["session_id"])
+    assert [a["is_correct"] for a in answers] == [1, 0, None]
+    assert answers[2]["open_answer"] == "texto"
+    session = main._db.get_student_sessions(db_path, case_id=case["id"])[0]
+    assert session["submitted_at"] and session["duration_seconds"] == 30
+
+
+def test_get_answers_batches_sessions_and_filters_by_session(db_path):
+    case = main._db.save_case(db_path, _case_with_questions())
+    headers = _student_headers()
+    ids = []
+    for selected in (1, 0):
+        r = client.post("/api/answers", headers=headers, json={
+            "case_id": case["id"],
+            "answers": [{"question_index": 0, "selected_option": selected}, {"question_index": 2, "open_answer": "x"}],
+        })
+        ids.append(r.json()["session_id"])
+
+    sessions = client.get("/api/answers", params={"case_id": case["id"]}).json()["sessions"]
+    assert {s["session_id"] for s in sessions} == set(ids)
+
+    sessions = client.get("/api/answers", params={"session_id": ids[0]}).json()["sessions"]
+    assert [s["session_id"] for s in sessions] == [ids[0]]
+    first, second = sessions[0]["answers"]
+    assert first["question_text"] == "P1"
+    assert first["student_answer"] == "b" and first["correct_answer"] == "b"
+    assert second["answer_type"] == "open" and second["student_answer"] == "x"
+
+
+def test_simulate_does_not_block_event_loop(monkeypatch):
+    import threading
+    import time as _time
+
+    class DummyResp:
+        def to_dict(self):
+            return {"output": [{"content": [{"text": "ok"}]}]}
+
+    calls = []
+
+    def slow_create(*args, **kwargs):
+        calls.append(threading.current_thread().name)
+        _time.sleep(0.05)
+        return DummyResp()
+
+    monkeypatch.setattr(main.client.responses, "create", slow_create)
+    r = client.post("/api/simulate", json={"case_text": "Caso"})
+    assert r.json()["text"] == "ok"
+    # La llamada se ejecutó en el pool del cliente, no en el hilo del event loop
+    assert calls and calls[0].startswith("llm")
+
+
+def test_simulate_stream_relays_deltas_and_final_case(db_path, monkeypatch):
+    import json as _json
+
+    chunks = ['{"title": "Caso ', 'streaming", "eje": "Salud mental"}']
+
+    def fake_create(*args, **kwargs):
+        assert kwargs.get("stream") is True
+        return iter([{"type": "response.output_text.delta", "delta": c} for c in chunks] + [{"type": "response.completed"}])
+
+    monkeypatch.setattr(main.client.responses, "create", fake_create)
+    with client.stream("POST", "/api/simulate/stream", json={"generate": True, "theme": "Salud mental"}) as r:
+        assert r.headers["content-type"].startswith("text/event-stream")
+        body = "".join(r.iter_text())
+
+    events = []
+    for block in body.strip().split("\n\n"):
+        name, data = block.split("\n", 1)
+        events.append((name[len("event: "):], _json.loads(data[len("data: "):])))
+
+    assert events[0][0] == "start"
+    assert [d["text"] for e, d in events if e == "delta"] == chunks
+    final = events[-1]
+    assert final[0] == "case"
+    assert final[1]["case"]["title"] == "Caso streaming"
+    assert main._db.get_case(db_path, final[1]["saved"]["id"])["title"] == "Caso streaming"
+
+
+def test_identical_generations_are_coalesced_and_recent_cases_rotate(db_path, monkeypatch):
+    import asyncio
+    import threading
+    import time as _time
+    import httpx
+
+    calls = []
+    lock = threading.Lock()
+
+    class CaseResp:
+        def __init__(self, n):
+            self.n = n
+
+        def to_dict(self):
+            return {"output": [{"content": [{"text": f'{{"title": "Caso {self.n}"}}'}]}]}
+
+    def slow_create(*args, **kwargs):
+        with lock:
+            calls.append(kwargs["input"])
+            n = len(calls)
+        _time.sleep(0.1)
+        return CaseResp(n)
+
+    monkeypatch.setattr(main.client.responses, "create", slow_create)
+    monkeypatch.setattr(main, "generation_cache", main._gen.GenerationCache(ttl=60))
+    params = {"generate": True, "theme": "Salud mental", "difficulty": "basico"}
+
+    async def burst():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            return await asyncio.gather(*[
+                ac.post("/api/simulate", json={**params, "theme": " salud  MENTAL "} if i % 2 else params)
+                for i in range(5)
+            ])
+
+    results = [r.json() for r in asyncio.run(burst())]
+    assert len(calls) == 1
+    assert {r["saved"]["id"] for r in results} == {results[0]["saved"]["id"]}
+    assert sorted(r["source"] for r in results) == ["coalesced"] * 4 + ["generated"]
+
+    # Dentro del TTL se sirve desde la caché; cache=False fuerza otra generación
+    assert client.post("/api/simulate", json=params).json()["source"] == "cache"
+    fresh = client.post("/api/simulate", json={**params, "cache": False}).json()
+    assert fresh["source"] == "generated" and len(calls) == 2
+
+    served = {client.post("/api/simulate", json={**params, "reuse_recent": True}).json()["saved"]["id"] for _ in range(2)}
+    assert served == {results[0]["saved"]["id"], fresh["saved"]["id"]}
+    assert len(calls) == 2
+
+
+def test_simulate_serves_from_warm_pool_and_refills(db_path, monkeypatch):
+    import asyncio
+
+    pool = main._gen.CasePool(db_path, [{"theme": "Salud mental", "difficulty": "basico"}], depth=2)
+    monkeypatch.setattr(main, "case_pool", pool)
+    monkeypatch.setattr(main, "generation_cache", main._gen.GenerationCache(ttl=0))
+
+    generated = []
+
+    async def fake_generate(params):
+        generated.append(params)
+        return {"title": f"Pregenerado {len(generated)}"}
+
+    asyncio.run(pool.refill(fake_generate))
+    assert asyncio.run(pool.stats())["combinations"][0]["depth"] == 2
+
+    data = client.post("/api/simulate", json={"generate": True, "theme": "salud mental"}).json()
+    assert data["source"] == "pool"
+    assert data["case"]["title"] == "Pregenerado 1"
+    assert main._db.get_case(db_path, data["saved"]["id"])["title"] == "Pregenerado 1"
+
+    asyncio.run(pool.refill(fake_generate))
+    stats = asyncio.run(pool.stats())
+    assert stats["combinations"][0]["depth"] == 2
+    assert (stats["hits"], stats["refills"]) == (1, 3)
+
+
+def test_pool_refill_task_survives_database_errors(db_path, monkeypatch):
+    import asyncio
+
+    pool = main._gen.CasePool(db_path, [{"theme": "Salud mental"}], depth=1, refill_interval=0.01)
+    calls = []
+
+    async def flaky_depths(path):
+        calls.append(path)
+        if len(calls) == 1:
+            raise main._db.sqlite3.OperationalError("database is locked")
+        return main._db.pool_depths(path)
+
+    monkeypatch.setattr(main._gen._adb, "pool_depths", flaky_depths, raising=False)
+
+    async def fake_generate(params):
+        return {"title": "Pregenerado"}
+
+    async def run_briefly():
+        task = asyncio.create_task(pool.run(fake_generate))
+        while pool.refills == 0 and not task.done():
+            await asyncio.sleep(0.01)
+        task.cancel()
+        return task
+
+    task = asyncio.run(run_briefly())
+    assert task.cancelled() and pool.refill_errors == 1 and pool.refills == 1
+
+
+def test_simulate_batch_generates_in_parallel_and_attaches_to_collection(db_path, monkeypatch):
+    import json as _json
+    import threading
+    import time as _time
+
+    lock = threading.Lock()
+    state = {"n": 0, "running": 0, "max_running": 0}
+
+    class CaseResp:
+        def __init__(self, text):
+            self.text = text
+
+        def to_dict(self):
+            return {"output": [{"content": [{"text": self.text}]}]}
+
+    def fake_create(*args, **kwargs):
+        with lock:
+            state["n"] += 1
+            n = state["n"]
+            state["running"] += 1
+            state["max_running"] = max(state["max_running"], state["running"])
+        _time.sleep(0.05)
+        with lock:
+            state["running"] -= 1
+        return CaseResp("sin json" if n == 2 else f'{{"title": "Lote {n}"}}')
+
+    monkeypatch.setattr(main.client.responses, "create", fake_create)
+    collection = main._db.create_collection(db_path, "Lote")
+
+    r = client.post("/api/simulate/batch", json={
+        "count": 4,
+        "params": {"theme": "Salud mental"},
+        "parallelism": 2,
+        "collection_id": collection["id"],
+    })
+    lines = [_json.loads(line) for line in r.text.strip().split("\n")]
+    items, done = lines[:-1], lines[-1]
+
+    assert sorted(item["index"] for item in items) == [0, 1, 2, 3]
+    assert sum(1 for item in items if not item["ok"]) == 1
+    assert state["max_running"] == 2
+    assert done["type"] == "done" and done["succeeded"] == 3 and done["failed"] == 1
+    in_collection = main._db.get_collection(db_path, collection["id"])["cases"]
+    assert {c["id"] for c in in_collection} == {s["id"] for s in done["saved"]}
+
+
+def test_simulate_batch_returns_pooled_cases_when_saving_fails(db_path, monkeypatch):
+    import asyncio
+    import json as _json
+
+    pool = main._gen.CasePool(db_path, [{"theme": "Salud mental", "difficulty": "basico"}], depth=1)
+    monkeypatch.setattr(main, "case_pool", pool)
+
+    async def fake_generate(params):
+        return {"title": "Pregenerado"}
+
+    def failing_save(*args, **kwargs):
+        raise main._db.sqlite3.OperationalError("database is locked")
+
+    asyncio.run(pool.refill(fake_generate))
+    monkeypatch.setattr(main._db, "save_cases_bulk", failing_save)
+
+    r = client.post("/api/simulate/batch", json={"count": 1, "params": {"theme": "Salud mental"}})
+    done = _json.loads(r.text.strip().split("\n")[-1])
+    assert done["ok"] is False and done["saved"] == []
+    assert asyncio.run(pool.stats())["combinations"][0]["depth"] == 1
+
+
+def test_simulate_batch_disconnect_keeps_finished_cases(db_path, monkeypatch):
+    import asyncio
+    import time as _time
+
+    pool = main._gen.CasePool(db_path, [{"theme": "Salud mental", "difficulty": "basico"}], depth=1)
+    monkeypatch.setattr(main, "case_pool", pool)
+    calls = []
+
+    class CaseResp:
+        def __init__(self, text):
+            self.text = text
+
+        def to_dict(self):
+            return {"output": [{"content": [{"text": self.text}]}]}
+
+    def fake_create(*args, **kwargs):
+        calls.append(1)
+        n = len(calls)
+        # La segunda generación sigue en curso cuando el cliente se desconecta
+        _time.sleep(0.01 if n == 1 else 0.5)
+        return CaseResp(f'{{"title": "Lote {n}"}}')
+
+    async def fake_generate(params):
+        return {"title": "Pregenerado"}
+
+    monkeypatch.setattr(main.client.responses, "create", fake_create)
+    collection = main._db.create_collection(db_path, "Lote")
+    requests = [main.SimulateRequest(theme="Salud mental") for _ in range(3)]
+
+    async def disconnect_after_first_item():
+        await pool.refill(fake_generate)
+        events = main._batch_events(requests, 3, collection["id"])
+        await events.__anext__()
+        await asyncio.sleep(0.2)
+        await events.aclose()
+        await asyncio.gather(*main._background_tasks)
+        return await pool.stats()
+
+    stats = asyncio.run(disconnect_after_first_item())
+    # El caso tomado del pool vuelve a él y el generado se guarda aunque no se haya enviado
+    assert stats["combinations"][0]["depth"] == 1
+    in_collection = main._db.get_collection(db_path, collection["id"])["cases"]
+    assert [c["title"] for c in in_collection] == ["Lote 1"]
+
+
+def test_search_cases_ranks_and_highlights(db_path):
+    main._db.save_case(db_path, {"title": "Absentismo escolar en Aysén", "text": "Luisa falta a clases por el invierno."})
+    other = main._db.save_case(db_path, {"title": "Cuidados de adulto mayor", "text": "Don Pedro vive solo."})
+    main._db.save_case(db_path, {"title": "Vivienda", "text": "Familia sin acceso a la escuela rural."})
+    main._db.update_case(db_path, other["id"], {"notes": "Derivar a la escuela de oficios"})
+
+    results = client.get("/api/cases/search", params={"q": "escuela"}).json()["results"]
+    assert {r["title"] for r in results} == {"Vivienda", "Cuidados de adulto mayor"}
+    assert all("<mark>" in r["snippet"] for r in results)
+
+    results = client.get("/api/cases/search", params={"q": "absentismo aysen"}).json()["results"]
+    assert [r["title"] for r in results] == ["Absentismo escolar en Aysén"]
+
+    main._db.delete_case(db_path, other["id"])
+    data = client.get("/api/cases/search", params={"q": "escuela", "limit": 1}).json()
+    assert [r["title"] for r in data["results"]] == ["Vivienda"]
+    assert data["next_offset"] == 1
+
+
+def test_simulate_lean_response_and_gzip(db_path, monkeypatch):
+    class CaseResp:
+        def to_dict(self):
+            return {"output": [{"content": [{"text": '{"title": "Caso liviano", "description": "' + "x" * 2000 + '"}'}]}]}
+
+    monkeypatch.setattr(main.client.responses, "create", lambda *a, **kw: CaseResp())
+    monkeypatch.setattr(main, "generation_cache", main._gen.GenerationCache(ttl=0))
+
+    r = client.post("/api/simulate", json={"generate": True}, headers={"Accept-Encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip"
+    data = r.json()
+    assert data["case"]["title"] == "Caso liviano"
+    assert data["saved"]["id"] and "payload" not in data["saved"]
+    assert "raw_response" not in data and "text" not in data
+
+    data = client.post("/api/simulate", json={"generate": True, "debug": True}).json()
+    assert data["saved"]["payload"]["title"] == "Caso liviano"
+    assert data["raw_response"]["output"] and data["text"]
+
+
+def test_slow_query_does_not_block_other_requests(db_path, monkeypatch):
+    import asyncio
+    import time as _time
+    import httpx
+
+    # En un host de un núcleo el modo por defecto es inline; aquí se prueba el pool
+    monkeypatch.setattr(main._adb, "DB_INLINE", False)
+    real_statistics = main._db.get_statistics
+
+    def slow_statistics(path):
+        _time.sleep(0.3)
+        return real_statistics(path)
+
+    monkeypatch.setattr(main._db, "get_statistics", slow_statistics)
+
+    async def mixed():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            start = _time.perf_counter()
+            slow = asyncio.ensure_future(ac.get("/api/admin/statistics"))
+            await asyncio.sleep(0.05)
+            health = await ac.get("/api/health")
+            elapsed = _time.perf_counter() - start
+            return (await slow).json(), health.status_code, elapsed
+
+    stats, health_status, elapsed = asyncio.run(mixed())
+    assert stats["ok"] is True and health_status == 200
+    assert elapsed < 0.25
+
+
+def test_signed_student_token_authenticates_without_db_lookup(db_path, monkeypatch):
+    case = main._db.save_case(db_path, _case_with_questions())
+    answers = {"case_id": case["id"], "answers": [{"question_index": 0, "selected_option": 1}]}
+
+    assert client.post("/api/answers", json=answers).status_code == 401
+    assert client.post("/api/answers", json=answers, headers={"Authorization": "Bearer student-1"}).status_code == 401
+
+    headers = _student_headers()
+
+    # Los logins iguales simultáneos comparten una sola consulta
+    import asyncio
+    import time as _time
+    import httpx
+
+    original, calls = main._db.authenticate_student, []
+
+    def slow_authenticate(*args):
+        calls.append(args)
+        _time.sleep(0.05)
+        return original(*args)
+
+    monkeypatch.setattr(main._db, "authenticate_student", slow_authenticate)
+    login = {"username": "estudiante1", "password": "pass"}
+
+    async def burst():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            return await asyncio.gather(*[ac.post("/api/auth/login", json=login) for _ in range(5)])
+
+    assert all(r.json()["ok"] for r in asyncio.run(burst()))
+    assert len(calls) == 1
+
+    # El login no se recuerda: desactivar al estudiante rige de inmediato
+    conn = main._db.sqlite3.connect(db_path)
+    conn.execute("UPDATE students SET status = 'inactive' WHERE id = 1")
+    conn.commit()
+    conn.close()
+    assert client.post("/api/auth/login", json=login).status_code == 401
+
+    # El token se verifica sin consultar `students`
+    monkeypatch.setattr(main._db, "authenticate_student", lambda *a: pytest.fail("consulta a students"))
+    session_id = client.post("/api/answers", json=answers, headers=headers).json()["session_id"]
+    main._db.create_session(db_path, 99, case["id"])
+    sessions = client.get("/api/answers", params={"student_id": 99}, headers=headers).json()["sessions"]
+    assert [(s["session_id"], s["student_id"]) for s in sessions] == [(session_id, 1)]
+
+    expired = main._auth.issue_token({"id": 1, "status": "active"}, ttl_hours=-1)
+    assert main._auth.verify_token(expired) is None
+    assert main._auth.verify_token(headers["Authorization"][7:] + "x") is None
+    for garbage in ("é.x", "x.é", "a.b.c", "."):
+        assert main._auth.verify_token(garbage) is None
+
+
+def test_generated_token_secret_survives_restarts(tmp_path, monkeypatch):
+    auth = main._auth
+    monkeypatch.setattr(auth, "TOKEN_SECRET", "")
+    monkeypatch.setattr(auth, "_secret", auth._secret)
+    db_path = str(tmp_path / "cases.db")
+
+    auth.init_secret(db_path)
+    token = auth.issue_token({"id": 1})
+    assert (tmp_path / auth.SECRET_FILENAME).exists()
+
+    # Un reinicio vuelve a leer el mismo secreto del disco
+    monkeypatch.setattr(auth, "_secret", b"otro proceso")
+    assert auth.verify_token(token) is None
+    auth.init_secret(db_path)
+    assert auth.verify_token(token)["sid"] == 1
+
+
+def test_export_and_import_cases_ndjson(db_path, tmp_path, monkeypatch):
+    import json as _json
+
+    main._db.save_case(db_path, {"case_id": "c-1", "title": "Familia Rojas", "description": "Relato de vivienda"})
+    second = main._db.save_case(db_path, {"case_id": "c-2", "title": "Adulto mayor"})
+    main._db.update_case(db_path, second["id"], {"tags": ["redes"], "notes": "Revisar"})
+
+    r = client.get("/api/cases/export")
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    lines = [_json.loads(line) for line in r.text.splitlines()]
+    assert [line["case_id"] for line in lines] == ["c-1", "c-2"]
+    assert lines[1]["tags"] == ["redes"] and lines[0]["payload"]["description"] == "Relato de vivienda"
+
+    target = str(tmp_path / "target.db")
+    main._db.init_db(target)
+    monkeypatch.setattr(main, "DB_PATH", target)
+    body = r.text + "no es json\n" + _json.dumps({"case_id": "c-3", "title": "Suelto"}) + "\n"
+    data = client.post("/api/cases/import", content=body).json()
+    assert (data["inserted"], data["skipped"], data["error_count"]) == (3, 0, 1)
+    assert data["errors"][0]["line"] == 3
+
+    data = client.post("/api/cases/import", content=r.text).json()
+    assert (data["inserted"], data["skipped"]) == (0, 2)
+
+    imported = main._db.list_cases(target)
+    assert {c["case_id"] for c in imported} == {"c-1", "c-2", "c-3"}
+    assert next(c for c in imported if c["case_id"] == "c-2")["notes"] == "Revisar"
+    assert [c["case_id"] for c in main._db.search_cases(target, "vivienda")] == ["c-1"]
+    assert main._db.get_statistics(target)["total_cases"] == 3
+
+
+def test_export_answers_streams_csv_and_ndjson_with_filters(db_path):
+    import csv as _csv
+    import io as _io
+    import json as _json
+
+    first = main._db.save_case(db_path, _case_with_questions())
+    second = main._db.save_case(db_path, _case_with_questions())
+    collection = main._db.create_collection(db_path, "Semestre")
+    main._db.add_case_to_collection(db_path, collection["id"], second["id"])
+    main._db.submit_session_bulk(db_path, 1, first["id"], [{"question_index": 0, "selected_option": 1}, {"question_index": 2, "open_answer": "x"}])
+    main._db.submit_session_bulk(db_path, 1, second["id"], [{"question_index": 0, "selected_option": 0}])
+
+    r = client.get("/api/answers/export")
+    assert r.headers["content-type"].startswith("text/csv")
+    rows = list(_csv.DictReader(_io.StringIO(r.text)))
+    assert [(int(row["case_id"]), row["question_index"]) for row in rows] == [(first["id"], "0"), (first["id"], "2"), (second["id"], "0")]
+    assert rows[0]["question_text"] == "P1" and rows[0]["student_answer"] == "b" and rows[0]["correct_answer"] == "b"
+    assert rows[1]["answer_type"] == "open" and rows[1]["open_answer"] == "x"
+
+    r = client.get("/api/answers/export", params={"format": "ndjson", "collection_id": collection["id"]})
+    lines = [_json.loads(line) for line in r.text.splitlines()]
+    assert [(line["case_id"], line["student_answer"]) for line in lines] == [(second["id"], "a")]
+
+    r = client.get("/api/answers/export", params={"date_to": "2000-01-01"})
+    assert r.text.strip() == ",".join(main._db.ANSWER_EXPORT_COLUMNS)
+
+
+def test_answers_api_and_export_describe_answers_alike(db_path):
+    import json as _json
+
+    case = main._db.save_case(db_path, _case_with_questions())
+    main._db.submit_session_bulk(db_path, 1, case["id"], [
+        {"question_index": 0, "selected_option": 1},
+        {"question_index": 1, "selected_option": -1},
+        {"question_index": 2, "open_answer": "Visita domiciliaria"},
+    ])
+
+    fields = ("question_index", "question_text", "answer_type", "student_answer", "correct_answer")
+    api = client.get("/api/answers").json()["sessions"][0]["answers"]
+    export = [_json.loads(line) for line in client.get("/api/answers/export", params={"format": "ndjson"}).text.splitlines()]
+    assert [tuple(a[f] for f in fields) for a in api] == [tuple(row[f] for f in fields) for row in export]
+    assert [a["student_answer"] for a in api] == ["b", None, "Visita domiciliaria"]
+
+
+def test_metrics_endpoint_reports_route_latency_db_time_and_llm_errors(db_path, monkeypatch):
+    saved = main._db.save_case(db_path, {"title": "Con métricas"})
+    metrics = main._metrics
+    route = ("GET", "/api/cases/{case_id}", "200")
+    before = metrics.http_duration.count(*route)
+    db_before = metrics.http_db_time.count("GET", "/api/cases/{case_id}")
+
+    assert client.get(f"/api/cases/{saved['id']}").status_code == 200
+    assert client.get("/api/no-existe").status_code == 404
+    assert metrics.http_duration.count(*route) == before + 1
+    assert metrics.http_db_time.count("GET", "/api/cases/{case_id}") == db_before + 1
+    assert metrics.http_duration.count("GET", "unmatched", "404") >= 1
+
+    def failing_create(*args, **kwargs):
+        raise TimeoutError("sin respuesta")
+
+    monkeypatch.setattr(main.client.responses, "create", failing_create)
+    monkeypatch.setattr(main.client, "max_retries", 0)
+    errors = metrics.llm_errors.value("create", "TimeoutError")
+    assert client.post("/api/simulate", json={"case_text": "Caso"}).status_code == 500
+    assert metrics.llm_errors.value("create", "TimeoutError") == errors + 1
+
+    r = client.get("/api/metrics")
+    assert r.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = r.text
+    assert "# TYPE simts_http_request_duration_seconds histogram" in text
+    assert 'simts_http_request_duration_seconds_bucket{method="GET",route="/api/cases/{case_id}",status="200",le="+Inf"}' in text
+    assert 'simts_http_request_db_seconds_count{method="GET",route="/api/cases/{case_id}"}' in text
+    assert 'simts_llm_errors_total{op="create",error="TimeoutError"}' in text
+    assert "simts_http_requests_in_flight 1" in text
+    assert "simts_llm_in_flight 0" in text
+
+
+def test_synthetic_and_replay_llm_providers_drive_the_generation_pipeline(db_path, tmp_path, monkeypatch):
+    llm = main._llm
+    synthetic = llm.SyntheticResponses(latency=0, jitter=0, seed=7)
+    monkeypatch.setattr(main, "generation_cache", main._gen.GenerationCache(ttl=0))
+    monkeypatch.setattr(main.client, "responses", llm.RecordingResponses(synthetic, str(tmp_path / "rec")))
+
+    data = client.post("/api/simulate", json={"generate": True, "theme": "Salud mental", "case_length": "corto"}).json()
+    assert data["case"]["eje"] == "Salud mental" and len(data["case"]["description"].split("\n\n")) == 4
+    assert main._db.get_case(db_path, data["saved"]["id"])["title"] == data["case"]["title"]
+
+    # La grabación se reproduce idéntica, también como stream
+    monkeypatch.setattr(main.client, "responses", llm.ReplayResponses(str(tmp_path / "rec"), strict=True))
+    replayed = client.post("/api/simulate", json={"generate": True, "theme": "Salud mental", "case_length": "corto"}).json()
+    assert replayed["case"] == data["case"]
+    r = client.post("/api/simulate/stream", json={"generate": True, "theme": "Salud mental", "case_length": "corto"})
+    assert data["case"]["title"] in r.text and "event: case" in r.text
+    assert client.post("/api/simulate", json={"generate": True, "theme": "Adicciones"}).status_code == 500
+
+    monkeypatch.setattr(main.client, "responses", llm.SyntheticResponses(latency=0, jitter=0, failure_rate=1.0))
+    assert client.post("/api/simulate", json={"generate": True}).status_code == 500
+
+
+async def _consume(agen):
+    return [chunk async for chunk in agen]
+
+
+@pytest.fixture
+def llm_wrapper():
+    """Crea `ClientWrapper` de prueba y apaga sus hilos al terminar el test."""
+    wrappers = []
+
+    def make(**kwargs):
+        wrapper = main.ClientWrapper(**kwargs)
+        wrappers.append(wrapper)
+        return wrapper
+
+    yield make
+    for wrapper in wrappers:
+        wrapper.shutdown()
+
+
+def test_llm_client_retries_hedges_and_enforces_deadline(llm_wrapper):
+    import asyncio
+    import time as _time
+
+    metrics = main._metrics
+    calls = []
+
+    class FlakyResponses:
+        """Primera llamada: error pasajero; las siguientes alternan lenta/rápida."""
+
+        def create(self, **kwargs):
+            calls.append(kwargs)
+            if len(calls) == 1:
+                raise main._llm.ProviderError("503")
+            _time.sleep(0.6 if len(calls) == 2 else 0.01)
+            return main._llm.Response(f"respuesta {len(calls)}")
+
+    wrapper = llm_wrapper(deadline=5, max_retries=2, retry_base=0.01, hedge=True, hedge_quantile=0.9)
+    wrapper.responses = FlakyResponses()
+    for _ in range(wrapper.latency.min_samples):
+        wrapper.latency.add(0.05)
+    retries, hedged, wins = metrics.llm_retries.value("create"), metrics.llm_hedged.value("create"), metrics.llm_hedge_wins.value("create")
+
+    resp = asyncio.run(wrapper.acreate(input="x"))
+    # Reintento tras el 503, la segunda llamada se queda pegada y la cobertura gana
+    assert resp.output_text == "respuesta 3" and len(calls) == 3
+    assert metrics.llm_retries.value("create") == retries + 1
+    assert metrics.llm_hedged.value("create") == hedged + 1 and metrics.llm_hedge_wins.value("create") == wins + 1
+
+    class HangingResponses:
+        def create(self, **kwargs):
+            _time.sleep(0.5)
+            return main._llm.Response("tarde")
+
+    wrapper = llm_wrapper(deadline=0.1, max_retries=2, retry_base=0.01)
+    wrapper.responses = HangingResponses()
+    exceeded = metrics.llm_deadline_exceeded.value("create")
+    with pytest.raises(main._llm.DeadlineExceeded):
+        asyncio.run(wrapper.acreate(input="x"))
+    # El hilo de la llamada vencida sigue ocupado hasta que el SDK vuelve
+    assert wrapper.in_flight == 1
+    with pytest.raises(main._llm.DeadlineExceeded):
+        asyncio.run(_consume(wrapper.astream(input="x")))
+    assert wrapper.in_flight == 2
+    for _ in range(100):
+        if wrapper.in_flight == 0:
+            break
+        _time.sleep(0.02)
+    assert wrapper.in_flight == 0
+    assert metrics.llm_deadline_exceeded.value("create") == exceeded + 1
@@ -0,0 +1,158 @@
+import sys
+import os
+
+import pytest
+
+# Asegura que el directorio padre (donde está db.py) esté en sys.path
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import db
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "test.db")
+    db.init_db(path)
+    yield path
+    db.close_connections()
+
+
+def test_connection_is_reused_and_uses_wal(db_path):
+    conn = db._connect(db_path)
+    assert db._connect(db_path) is conn
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    saved = db.save_case(db_path, {"title": "Caso", "eje": "Salud mental", "nivel": "basico"})
+    assert db.get_case(db_path, saved["id"])["title"] == "Caso"
+    assert db._connect(db_path) is conn
+
+
+def test_thread_connections_are_closed_when_the_thread_exits(db_path):
+    import gc
+    import threading
+
+    opened = []
+    worker = threading.Thread(target=lambda: opened.append(db._connect(db_path)))
+    worker.start()
+    worker.join()
+    gc.collect()
+
+    conn = opened[0]
+    assert conn.closed and conn not in db._open
+    with pytest.raises(db.sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
+
+
+def test_migrations_run_once_and_create_indexes(db_path):
+    assert db.migrate(db_path) == db.MIGRATIONS[-1][0]
+    conn = db._connect(db_path)
+    plan = conn.execute(
+        "EXPLAIN QUERY PLAN SELECT id FROM student_sessions WHERE student_id = ? ORDER BY created_at DESC", (1,)
+    ).fetchall()
+    assert any("idx_student_sessions_student" in row[-1] for row in plan)
+
+    db.save_case(db_path, {"title": "Propio"}, created_by=7)
+    db.save_case(db_path, {"title": "Ajeno"})
+    assert [c["title"] for c in db.list_cases(db_path, created_by=7)] == ["Propio"]
+
+
+def test_missing_fts_table_is_created_and_backfilled_on_migrate(db_path, monkeypatch):
+    # Base migrada con un SQLite sin FTS5: user_version al día pero sin cases_fts
+    for i in range(5):
+        db.save_case(db_path, {"title": f"Familia {i}", "text": "Relato en el barrio"})
+    conn = db._connect(db_path)
+    conn.execute("DROP TABLE cases_fts")
+    conn.commit()
+    db._fts_tables.pop(db_path, None)
+    with pytest.raises(RuntimeError):
+        db.search_cases(db_path, "barrio")
+
+    monkeypatch.setattr(db, "FTS_BACKFILL_BATCH", 2)
+    assert db.migrate(db_path) == db.MIGRATIONS[-1][0]
+    assert len(db.search_cases(db_path, "barrio")) == 5
+
+
+def test_case_cache_hits_and_write_through_invalidation(db_path):
+    saved = db.save_case(db_path, {"title": "Original", "questions": [{"text": "P1"}]})
+    before = db.case_cache_stats()
+
+    assert db.get_case(db_path, saved["id"])["title"] == "Original"
+    assert db.get_case(db_path, saved["id"])["title"] == "Original"
+    assert db.get_cases_questions(db_path, [saved["id"]]) == {saved["id"]: [{"text": "P1"}]}
+    stats = db.case_cache_stats()
+    assert stats["misses"] == before["misses"] + 1
+    assert stats["hits"] == before["hits"] + 2
+
+    db.update_case(db_path, saved["id"], {"payload": {"title": "Editado"}})
+    assert db.get_case(db_path, saved["id"])["title"] == "Editado"
+    db.delete_case(db_path, saved["id"])
+    assert db.get_case(db_path, saved["id"])["status"] == "deleted"
+
+
+def test_statistics_follow_inserts_updates_and_soft_deletes(db_path):
+    a = db.save_case(db_path, {"title": "A", "eje": "Salud mental", "nivel": "basico"})
+    b = db.save_case(db_path, {"title": "B", "eje": "Salud mental", "nivel": "avanzado"})
+    c = db.save_case(db_path, {"title": "C", "eje": "Vivienda", "nivel": "basico"})
+    db.save_cases_bulk(db_path, [{"title": "D"}])
+    db.update_case(db_path, a["id"], {"rating": 4})
+    db.update_case(db_path, b["id"], {"rating": 2, "payload": {"title": "B", "eje": "Vivienda"}})
+    db.delete_case(db_path, c["id"])
+
+    stats = db.get_statistics(db_path)
+    assert stats["total_cases"] == 3
+    assert stats["by_theme"] == {"Salud mental": 1, "Vivienda": 1, None: 1}
+    assert stats["by_difficulty"] == {"basico": 1, "avanzado": 1, None: 1}
+    assert stats["average_rating"] == 3.0
+    assert stats["recent_cases"] == 3
+
+
+def test_student_writes_are_group_committed(db_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    case = db.save_case(db_path, {"title": "Examen"})
+    session_id = db.create_session(db_path, 1, case["id"])
+
+    futures = [db.submit_write(db_path, "save_answer", session_id, i, i % 4, None) for i in range(40)]
+    # Una operación fallida solo descarta su SAVEPOINT, no el grupo
+    bad = db.submit_write(db_path, "insert_graded_session", 1, case["id"], [(0, 1)])
+    ids = [f.result() for f in futures]
+    with pytest.raises(Exception):
+        bad.result()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        ids += list(pool.map(lambda i: db.save_answer(db_path, session_id, 40 + i, 0, None), range(40)))
+
+    assert len(set(ids)) == 80
+    assert len(db.get_session_answers(db_path, session_id)) == 80
+    stats = db.writer_stats()[db_path]
+    assert stats["ops"] == 82 and stats["errors"] == 1
+    assert stats["commits"] < stats["ops"]
+
+
+def test_sql_trace_aggregates_statements_and_explains_slow_ones(tmp_path, monkeypatch, caplog):
+    import sqltrace
+
+    monkeypatch.setattr(sqltrace, "SQL_TRACE", True)
+    monkeypatch.setattr(sqltrace, "tracer", sqltrace.SqlTrace(slow_ms=0))
+    path = str(tmp_path / "traced.db")
+    db.init_db(path)
+    try:
+        assert isinstance(db._connect(path), db.TracedConnection)
+        ids = [db.save_case(path, {"title": f"Caso {i}", "eje": "Salud mental"})["id"] for i in range(3)]
+        db.get_cases_questions(path, ids)
+        db.get_cases_questions(path, ids[:2])
+        db.list_cases(path, theme="Salud mental", fields="summary")
+
+        statements = {s["fingerprint"]: s for s in sqltrace.tracer.report(limit=500)}
+        questions = [s for key, s in statements.items() if key == "SELECT id, updated_at FROM cases WHERE id IN (?...)"]
+        # Listas IN de distinto largo comparten huella
+        assert len(questions) == 1 and questions[0]["count"] == 2
+        assert questions[0]["slow_params"] == ["int", "int"]
+        assert any("USING INTEGER PRIMARY KEY" in line for line in questions[0]["plan"])
+        listing = next(s for key, s in statements.items() if key.startswith("SELECT") and "theme = ?" in key)
+        assert listing["plan"] and listing["vm_steps"] >= 0
+        assert "SQL lenta" in caplog.text and "Salud mental" not in caplog.text
+    finally:
+        db.close_connections()
@@ -282,7 +282,14 @@ export default function App({ onLogout, isTeacherAuthenticated: propIsTeacherAut
     
     setLoadingFeedback(true)
     try {
-      const res = await fetch(`${API_BASE}/api/answers?student_id=${studentData.id}`)
+      const token = localStorage.getItem('studentToken')
+      const res = await fetch(`${API_BASE}/api/answers?student_id=${studentData.id}`, {
+        headers: token ? { 'Authorization': `Bearer ${token}` } : {}
+      })
+      if (res.status === 401) {
+        handleExpiredStudentSession()
+        return
+      }
       const data = await res.json()
       if (data.ok) {
         setMyFeedback(data.sessions || [])
@@ -296,7 +303,7 @@ export default function App({ onLogout, isTeacherAuthenticated: propIsTeacherAut
 
   async function loadExistingCases() {
     try {
-      const res = await fetch(`${API_BASE}/api/cases?limit=100&status=active`)
+      const res = await fetch(`${API_BASE}/api/cases?limit=100&status=active&fields=summary`)
       const data = await res.json()
       if (data.ok && data.cases) {
         setExistingCases(data.cases)
@@ -483,6 +490,14 @@ export default function App({ onLogout, isTeacherAuthenticated: propIsTeacherAut
     localStorage.removeItem('studentToken')
   }
 
+  // Token vencido o inválido (p. ej. firmado con otro secreto): se pide un nuevo
+  // login sin desmontar el caso, así las respuestas siguen en memoria
+  function handleExpiredStudentSession() {
+    localStorage.removeItem('studentToken')
+    localStorage.removeItem('studentAuth')
+    setShowStudentLogin(true)
+  }
+
   async function submitAnswers() {
     if (!isStudentAuthenticated || !caseObj) {
       alert('Debes iniciar sesión y generar un caso antes de enviar respuestas')
@@ -534,6 +549,12 @@ export default function App({ onLogout, isTeacherAuthenticated: propIsTeacherAut
         })
       })
 
+      if (response.status === 401) {
+        handleExpiredStudentSession()
+        alert('Tu sesión expiró. Inicia sesión nuevamente y vuelve a enviar: tus respuestas no se perdieron.')
+        return
+      }
+
       const data = await response.json()
       console.log('📥 Respuesta del servidor:', data)
 
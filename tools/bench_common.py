@@ -0,0 +1,50 @@
+"""Utilidades compartidas por los benchmarks y la prueba de carga de `tools/`.
+
+  - `percentile`: percentil por rango más cercano de una lista de latencias
+  - `free_port` / `start_server`: levantan el backend con uvicorn en un
+    subproceso contra la base indicada y esperan a que responda `/api/health`
+"""
+import os
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(db_path: str, env: dict = None):
+    """Arranca `uvicorn main:app` con `SIMTS_DB_PATH=db_path` y las variables de `env`.
+
+    Devuelve (proceso, URL base); el llamador debe terminar el proceso.
+    """
+    # Solo los benchmarks HTTP necesitan httpx; bench_db importa este módulo sin él
+    import httpx
+
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env={**os.environ, "SIMTS_DB_PATH": db_path, **(env or {})},
+    )
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            httpx.get(f"{base}/api/health", timeout=1).raise_for_status()
+            return proc, base
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("El backend no respondió a /api/health")
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks de cada función pública de `backend/db.py` a varias escalas.
+
+Para cada escala siembra (una vez, con caché en `--data-dir`) una base con
+`tools/seed_db.py`, la copia a un directorio temporal y mide cada función:
+operaciones por segundo, latencia media/p95 y memoria asignada por llamada
+(pico de tracemalloc). El resultado es un JSON comparable entre versiones;
+con `--compare` se marcan las funciones que empeoraron más que `--threshold`.
+
+Las funciones públicas de `db` sin benchmark se listan en `uncovered`, así una
+función nueva aparece en el reporte hasta que se agregue aquí. Las escrituras
+de estudiantes pasan por el escritor agrupado, así que su ops/s secuencial
+queda acotado por `SIMTS_WRITE_BATCH_DELAY_MS`.
+
+Usage:
+  python3 tools/bench_db.py [--scales 1000,10000] [--sessions-per-case 2] [--seconds 0.5]
+                            [--only list_cases,get_case] [--output bench.json] [--compare previous.json]
+
+  # Escala grande: 100k casos y 1M de respuestas (200k sesiones x 5 respuestas)
+  python3 tools/bench_db.py --scales 100000 --sessions-per-case 2
+"""
+import argparse
+import inspect
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "backend"))
+TOOLS = os.path.dirname(os.path.abspath(__file__))
+for path in (ROOT, TOOLS):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import seed_db  # noqa: E402
+from seed_db import db  # noqa: E402
+from bench_common import percentile  # noqa: E402
+
+# Funciones de `db` que no se miden: arranque/apagado, infraestructura y ayudantes sin consultas
+SKIPPED = {"init_db", "migrate", "close_connections", "stop_writers", "writer_for", "writer_stats", "case_cache_stats", "write", "submit_write", "describe_answer"}
+
+
+class Context:
+    """Datos de una escala: ruta de la base y ids para elegir al azar."""
+
+    def __init__(self, db_path: str, dataset: dict, seed: int):
+        self.db_path = db_path
+        self.rnd = random.Random(seed)
+        self.case_ids = dataset["case_ids"]
+        self.student_ids = dataset["student_ids"]
+        self.collection_ids = dataset["collection_ids"]
+        conn = sqlite3.connect(db_path)
+        self.session_ids = [r[0] for r in conn.execute("SELECT id FROM student_sessions")]
+        self.answer_ids = [r[0] for r in conn.execute("SELECT id FROM student_answers ORDER BY random() LIMIT 1000")]
+        conn.close()
+
+    def case_id(self) -> int:
+        return self.rnd.choice(self.case_ids)
+
+    def new_case(self) -> dict:
+        return seed_db.make_case(self.rnd, self.rnd.randrange(10 ** 9))
+
+
+def _export_first_batch(gen):
+    try:
+        return next(gen, None)
+    finally:
+        gen.close()
+
+
+def _get_case_uncached(ctx: Context):
+    db._case_cache.clear()
+    return db.get_case(ctx.db_path, ctx.case_id())
+
+
+def _delete_fresh_case(ctx: Context):
+    return db.delete_case(ctx.db_path, db.save_case(ctx.db_path, ctx.new_case())["id"])
+
+
+def _collection_roundtrip(ctx: Context, op: str):
+    collection = db.create_collection(ctx.db_path, "Bench")
+    if op == "update_collection":
+        db.update_collection(ctx.db_path, collection["id"], name="Bench 2")
+    elif op == "delete_collection":
+        db.delete_collection(ctx.db_path, collection["id"])
+    return collection
+
+
+# nombre -> (funciones de db medidas, unidas con "+"; llamada con el contexto)
+# Las lecturas de colecciones van antes de las que crean colecciones
+BENCHMARKS = {
+    "list_cases[full,50]": ("list_cases", lambda c: db.list_cases(c.db_path, limit=50)),
+    "list_cases[summary,50]": ("list_cases", lambda c: db.list_cases(c.db_path, limit=50, fields="summary")),
+    "list_cases[theme,summary,500]": ("list_cases", lambda c: db.list_cases(c.db_path, theme=c.rnd.choice(seed_db.THEMES), limit=500, fields="summary")),
+    "list_cases[keyset]": ("list_cases", lambda c: db.list_cases(c.db_path, limit=50, fields="summary", after_id=c.case_id())),
+    "get_case[cached]": ("get_case", lambda c: db.get_case(c.db_path, c.case_ids[0])),
+    "get_case[uncached]": ("get_case", _get_case_uncached),
+    "search_cases": ("search_cases", lambda c: db.search_cases(c.db_path, c.rnd.choice(seed_db.WORDS))),
+    "recent_generated_case_ids": ("recent_generated_case_ids", lambda c: db.recent_generated_case_ids(c.db_path, "bench", "2000-01-01")),
+    "get_statistics": ("get_statistics", lambda c: db.get_statistics(c.db_path)),
+    "save_case": ("save_case", lambda c: db.save_case(c.db_path, c.new_case())),
+    "save_cases_bulk[10]": ("save_cases_bulk", lambda c: db.save_cases_bulk(c.db_path, [c.new_case() for _ in range(10)])),
+    "update_case": ("update_case", lambda c: db.update_case(c.db_path, c.case_id(), {"rating": c.rnd.randint(1, 5), "notes": "bench"})),
+    "delete_case[+save]": ("delete_case", _delete_fresh_case),
+    "pool_add+pool_take": ("pool_add+pool_take", lambda c: (db.pool_add(c.db_path, "bench", {}, c.new_case()), db.pool_take(c.db_path, "bench"))),
+    "pool_depths": ("pool_depths", lambda c: db.pool_depths(c.db_path)),
+    "import_cases[100]": ("import_cases", lambda c: db.import_cases(c.db_path, [c.new_case() for _ in range(100)], dedupe=True)),
+    "iter_cases_export[first batch]": ("iter_cases_export", lambda c: _export_first_batch(db.iter_cases_export(c.db_path))),
+    "list_collections": ("list_collections", lambda c: db.list_collections(c.db_path)),
+    "get_collection": ("get_collection", lambda c: db.get_collection(c.db_path, c.rnd.choice(c.collection_ids))),
+    "collection_exists": ("collection_exists", lambda c: db.collection_exists(c.db_path, c.rnd.choice(c.collection_ids))),
+    "add+remove_case_collection": ("add_case_to_collection+remove_case_from_collection", lambda c: (
+        db.add_case_to_collection(c.db_path, c.collection_ids[0], c.case_ids[-1]),
+        db.remove_case_from_collection(c.db_path, c.collection_ids[0], c.case_ids[-1]),
+    )),
+    "create_collection": ("create_collection", lambda c: db.create_collection(c.db_path, "Bench")),
+    "update_collection[+create]": ("update_collection", lambda c: _collection_roundtrip(c, "update_collection")),
+    "delete_collection[+create]": ("delete_collection", lambda c: _collection_roundtrip(c, "delete_collection")),
+    "authenticate_student": ("authenticate_student", lambda c: db.authenticate_student(c.db_path, "estudiante001", "pass")),
+    "list_students": ("list_students", lambda c: db.list_students(c.db_path)),
+    "create_session": ("create_session", lambda c: db.create_session(c.db_path, c.rnd.choice(c.student_ids), c.case_id())),
+    "submit_session": ("submit_session", lambda c: db.submit_session(c.db_path, c.rnd.choice(c.session_ids), 60)),
+    "save_answer": ("save_answer", lambda c: db.save_answer(c.db_path, c.rnd.choice(c.session_ids), 0, 1, None)),
+    "grade_session": ("grade_session", lambda c: db.grade_session(c.db_path, c.case_id(), seed_db.make_answers(c.rnd))),
+    "submit_session_bulk": ("submit_session_bulk", lambda c: db.submit_session_bulk(c.db_path, c.rnd.choice(c.student_ids), c.case_id(), seed_db.make_answers(c.rnd), 60)),
+    "update_answer_feedback": ("update_answer_feedback", lambda c: db.update_answer_feedback(c.db_path, c.rnd.choice(c.answer_ids), "Bien", 6.0)),
+    "get_session_answers": ("get_session_answers", lambda c: db.get_session_answers(c.db_path, c.rnd.choice(c.session_ids))),
+    "get_answers_for_sessions[100]": ("get_answers_for_sessions", lambda c: db.get_answers_for_sessions(c.db_path, c.rnd.sample(c.session_ids, min(100, len(c.session_ids))))),
+    "get_cases_questions[50]": ("get_cases_questions", lambda c: db.get_cases_questions(c.db_path, c.rnd.sample(c.case_ids, min(50, len(c.case_ids))))),
+    "get_student_sessions[student]": ("get_student_sessions", lambda c: db.get_student_sessions(c.db_path, student_id=c.rnd.choice(c.student_ids))),
+    "get_student_sessions[case]": ("get_student_sessions", lambda c: db.get_student_sessions(c.db_path, case_id=c.case_id())),
+    "get_student_sessions[all,100]": ("get_student_sessions", lambda c: db.get_student_sessions(c.db_path, limit=100)),
+    "iter_answers_export[first batch]": ("iter_answers_export", lambda c: _export_first_batch(db.iter_answers_export(c.db_path))),
+}
+
+
+def public_functions() -> set:
+    return {
+        name for name, obj in vars(db).items()
+        if inspect.isfunction(obj) and obj.__module__ == db.__name__ and not name.startswith("_") and name not in SKIPPED
+    }
+
+
+def measure(fn, ctx: Context, seconds: float, max_iterations: int = 10000) -> dict:
+    fn(ctx)  # calentamiento: conexión, caché de sentencias
+    timings = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline and len(timings) < max_iterations:
+        start = time.perf_counter()
+        fn(ctx)
+        timings.append(time.perf_counter() - start)
+
+    # Memoria en una pasada aparte: tracemalloc distorsiona los tiempos
+    samples = min(len(timings), 20)
+    tracemalloc.start()
+    peaks = []
+    for _ in range(samples):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn(ctx)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+
+    total = sum(timings)
+    return {
+        "iterations": len(timings),
+        "ops_per_s": round(len(timings) / total, 1) if total else None,
+        "mean_ms": round(total / len(timings) * 1000, 4),
+        "p95_ms": round(percentile(timings, 95) * 1000, 4),
+        "alloc_kb_per_op": round(sum(peaks) / len(peaks) / 1024, 1) if peaks else None,
+    }
+
+
+def seeded_copy(scale: int, args) -> tuple:
+    """Copia temporal de la base sembrada para `scale` (se siembra una vez por escala y semilla)."""
+    os.makedirs(args.data_dir, exist_ok=True)
+    sessions = scale * args.sessions_per_case
+    name = f"bench-{scale}-{sessions}-{args.seed}"
+    cached = os.path.join(args.data_dir, name + ".db")
+    meta_path = os.path.join(args.data_dir, name + ".json")
+    seed_seconds = None
+    if not (os.path.exists(cached) and os.path.exists(meta_path)):
+        start = time.perf_counter()
+        dataset = seed_db.seed(cached, cases=scale, students=max(50, scale // 100), sessions=sessions, seed=args.seed)
+        seed_seconds = round(time.perf_counter() - start, 2)
+        db.close_connections()
+        with open(meta_path, "w") as fh:
+            json.dump(dataset, fh)
+    with open(meta_path) as fh:
+        dataset = json.load(fh)
+
+    workdir = tempfile.mkdtemp(prefix="simts-bench-db-")
+    db_path = os.path.join(workdir, "bench.db")
+    shutil.copyfile(cached, db_path)
+    return db_path, dataset, seed_seconds
+
+
+def run_scale(scale: int, args) -> dict:
+    db_path, dataset, seed_seconds = seeded_copy(scale, args)
+    db.init_db(db_path)
+    ctx = Context(db_path, dataset, args.seed)
+    only = set(args.only.split(",")) if args.only else None
+    results = {}
+    for name, (_, fn) in BENCHMARKS.items():
+        if only and name not in only and name.split("[")[0] not in only:
+            continue
+        results[name] = measure(fn, ctx, args.seconds)
+        print(f"  {scale:>8} {name:40} {results[name]['ops_per_s']:>10} ops/s", file=sys.stderr)
+    db.close_connections()
+    shutil.rmtree(os.path.dirname(db_path), ignore_errors=True)
+    return {
+        "dataset": {"cases": scale, "sessions": scale * args.sessions_per_case, "answers": scale * args.sessions_per_case * seed_db.QUESTIONS_PER_CASE},
+        "seed_seconds": seed_seconds,
+        "benchmarks": results,
+    }
+
+
+def print_comparison(report: dict, baseline: dict, threshold: float):
+    """Funciones cuyo ops/s cayó más que `threshold` respecto de `baseline` (a stderr)."""
+    regressions = 0
+    for scale, data in report["scales"].items():
+        old_scale = baseline.get("scales", {}).get(scale, {}).get("benchmarks", {})
+        for name, result in data["benchmarks"].items():
+            old = old_scale.get(name)
+            if not old or not old.get("ops_per_s") or not result.get("ops_per_s"):
+                continue
+            ratio = result["ops_per_s"] / old["ops_per_s"]
+            flag = "REGRESIÓN" if ratio < 1 - threshold else ""
+            regressions += bool(flag)
+            print(f"{scale:>8} {name:40} {old['ops_per_s']:>10} → {result['ops_per_s']:<10} x{ratio:.2f} {flag}", file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", default="1000,10000", help="Cantidades de casos, separadas por coma")
+    parser.add_argument("--sessions-per-case", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=0.5, help="Tiempo de medición por función")
+    parser.add_argument("--only", help="Benchmarks o funciones a medir, separados por coma")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "simts-bench-data"))
+    parser.add_argument("--output", help="Archivo donde guardar el reporte JSON (por defecto stdout)")
+    parser.add_argument("--compare", help="Reporte anterior contra el cual comparar")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Caída de ops/s que se marca como regresión")
+    args = parser.parse_args()
+
+    try:
+        version = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=ROOT).stdout.strip() or None
+    except OSError:
+        version = None
+    covered = {name for targets, _ in BENCHMARKS.values() for name in targets.split("+")}
+    report = {
+        "meta": {
+            "version": version,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "seed": args.seed,
+            "seconds_per_benchmark": args.seconds,
+        },
+        "scales": {scale: run_scale(int(scale), args) for scale in args.scales.split(",")},
+        "uncovered": sorted(public_functions() - covered),
+    }
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            regressions = print_comparison(report, json.load(fh), args.threshold)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Benchmark de latencia bajo carga mixta: consultas lentas + peticiones rápidas.
+
+Levanta el backend con uvicorn contra una base temporal sembrada y mide la
+latencia de las rutas rápidas mientras otros clientes piden consultas pesadas.
+Compara dos modos: con las consultas en el event loop (`SIMTS_DB_INLINE=1`,
+el comportamiento anterior) y con la fachada asíncrona de `adb.py`. Los modos
+se alternan durante `--rounds` rondas y las latencias de todas las rondas se
+juntan antes de calcular los percentiles, para que el ruido de la máquina no
+favorezca a uno de los dos.
+
+Usage:
+  python3 tools/bench_mixed_load.py [--requests 300] [--concurrency 16] [--cases 1500]
+                                    [--rounds 3] [--db-workers 4]
+
+Requires: httpx, uvicorn
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "backend"))
+TOOLS = os.path.dirname(os.path.abspath(__file__))
+for path in (ROOT, TOOLS):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+try:
+    import httpx
+except Exception:
+    print("The 'httpx' library is required. Install with: pip install httpx")
+    sys.exit(2)
+
+import seed_db  # noqa: E402
+import bench_common  # noqa: E402
+from bench_common import percentile  # noqa: E402
+
+
+def start_server(db_path: str, inline: bool, db_workers: int):
+    return bench_common.start_server(db_path, {"SIMTS_DB_INLINE": "1" if inline else "0", "SIMTS_DB_MAX_WORKERS": str(db_workers)})
+
+
+async def run_load(base_url: str, case_ids, n_requests: int, concurrency: int, latencies: dict) -> float:
+    """Envía `n_requests` peticiones, suma sus latencias (ms) a `latencies` por ruta y devuelve los segundos."""
+    # Rutas pesadas (listados completos, respuestas) mezcladas con rutas baratas
+    slow = [
+        ("GET /api/cases?limit=500", lambda: "/api/cases?limit=500"),
+        ("GET /api/answers?limit=1000", lambda: "/api/answers?limit=1000"),
+        ("GET /api/cases/search", lambda: "/api/cases/search?q=familia%20barrio&limit=50"),
+    ]
+    fast = [
+        ("GET /api/health", lambda: "/api/health"),
+        ("GET /api/cases/{id}", lambda: f"/api/cases/{random.choice(case_ids)}"),
+        ("GET /api/admin/statistics", lambda: "/api/admin/statistics"),
+    ]
+    routes = slow + fast * 3
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(n_requests):
+        queue.put_nowait(routes[i % len(routes)])
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as ac:
+        async def worker():
+            while True:
+                try:
+                    name, path = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                start = time.perf_counter()
+                r = await ac.get(path())
+                r.raise_for_status()
+                latencies.setdefault(name, []).append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        return time.perf_counter() - start
+
+
+def summarize(latencies: dict, n_requests: int, elapsed: float) -> dict:
+    return {
+        "rps": round(n_requests / elapsed, 1),
+        "routes": {
+            name: {
+                "count": len(values),
+                "p50_ms": round(percentile(values, 50), 2),
+                "p99_ms": round(percentile(values, 99), 2),
+            }
+            for name, values in latencies.items()
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--cases", type=int, default=1500)
+    parser.add_argument("--rounds", type=int, default=3, help="Rondas alternando los modos")
+    parser.add_argument("--db-workers", type=int, default=4, help="SIMTS_DB_MAX_WORKERS del modo executor")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="simts-bench-")
+    db_path = os.path.join(tmpdir, "bench.db")
+    case_ids = seed_db.seed(db_path, cases=args.cases, sessions=args.cases * 2)["case_ids"]
+    seed_db.db.close_connections()
+
+    modes = (("inline", True), ("executor", False))
+    latencies = {mode: {} for mode, _ in modes}
+    elapsed = {mode: 0.0 for mode, _ in modes}
+    for _ in range(args.rounds):
+        for mode, inline in modes:
+            proc, base_url = start_server(db_path, inline, args.db_workers)
+            try:
+                elapsed[mode] += asyncio.run(run_load(base_url, case_ids, args.requests, args.concurrency, latencies[mode]))
+            finally:
+                proc.terminate()
+                proc.wait()
+
+    results = {mode: summarize(latencies[mode], args.requests * args.rounds, elapsed[mode]) for mode, _ in modes}
+    print(json.dumps({"params": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""Prueba de carga HTTP reproducible del backend.
+
+Siembra una base SQLite (ver `tools/seed_db.py`), levanta el backend con uvicorn
+en un subproceso con el proveedor sintético del LLM (`SIMTS_LLM_PROVIDER=synthetic`,
+latencia, velocidad de tokens y tasa de fallas configurables), y lo recorre con
+usuarios virtuales que imitan el tráfico real:
+
+  - estudiantes: login, listado de casos, abrir un caso, enviar respuestas, ver su feedback
+  - docentes: panel de respuestas, estadísticas, colecciones, listado completo, búsqueda
+  - generación: POST /api/simulate con temas y dificultades al azar y `cache=false`
+
+El resultado es un JSON (RPS, p50/p95/p99 y tasa de errores por ruta) que sirve
+como línea base; con `--compare` se imprimen las diferencias contra otra corrida.
+
+Usage:
+  python3 tools/load_test.py [--users 30] [--duration 30] [--mix student=70,teacher=20,generate=10]
+                             [--llm-latency 1.5] [--llm-jitter 0.5] [--llm-tokens-per-s 0] [--llm-failure-rate 0]
+                             [--output baseline.json] [--compare previous.json]
+
+Requires: httpx, uvicorn
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "backend"))
+TOOLS = os.path.dirname(os.path.abspath(__file__))
+for path in (ROOT, TOOLS):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+try:
+    import httpx
+except Exception:
+    print("The 'httpx' library is required. Install with: pip install httpx")
+    sys.exit(2)
+
+import seed_db  # noqa: E402
+import bench_common  # noqa: E402
+from bench_common import percentile  # noqa: E402
+
+
+# ===== Servidor con el proveedor sintético del LLM (ver backend/llm.py) =====
+
+def start_server(db_path: str, args):
+    return bench_common.start_server(db_path, {
+        "SIMTS_LLM_PROVIDER": "synthetic",
+        "SIMTS_LLM_SYNTHETIC_LATENCY": str(args.llm_latency),
+        "SIMTS_LLM_SYNTHETIC_JITTER": str(args.llm_jitter),
+        "SIMTS_LLM_SYNTHETIC_TOKENS_PER_S": str(args.llm_tokens_per_s),
+        "SIMTS_LLM_SYNTHETIC_FAILURE_RATE": str(args.llm_failure_rate),
+        "SIMTS_LLM_SYNTHETIC_SEED": str(args.seed),
+        # Sin pool de casos pregenerados: la carga de generación debe llegar al LLM
+        "SIMTS_POOL_SPECS": "",
+    })
+
+
+# ===== Usuarios virtuales =====
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+
+    async def call(self, ac, route: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            r = await ac.request(method, url, **kwargs)
+            ok = r.status_code < 400
+        except httpx.HTTPError:
+            r, ok = None, False
+        self.samples.setdefault(route, []).append(((time.perf_counter() - start) * 1000, ok))
+        return r if ok else None
+
+
+def weighted(rnd: random.Random, choices):
+    return rnd.choices([c[0] for c in choices], weights=[c[1] for c in choices])[0]
+
+
+async def student(ac, rec: Recorder, rnd: random.Random, dataset: dict, deadline: float):
+    username = rnd.choice(dataset["usernames"])
+    r = await rec.call(ac, "POST /api/auth/login", "POST", "/api/auth/login", json={"username": username, "password": "pass"})
+    if r is None:
+        return
+    data = r.json()
+    headers = {"Authorization": f"Bearer {data['token']}"}
+    student_id = data["student"]["id"]
+    actions = [("list", 40), ("get", 35), ("submit", 15), ("feedback", 10)]
+    while time.monotonic() < deadline:
+        action = weighted(rnd, actions)
+        if action == "list":
+            await rec.call(ac, "GET /api/cases?fields=summary", "GET", "/api/cases", params={"fields": "summary", "limit": 50, "status": "active"})
+        elif action == "get":
+            await rec.call(ac, "GET /api/cases/{id}", "GET", f"/api/cases/{rnd.choice(dataset['case_ids'])}")
+        elif action == "submit":
+            await rec.call(ac, "POST /api/answers", "POST", "/api/answers", headers=headers, json={
+                "case_id": rnd.choice(dataset["case_ids"]),
+                "answers": seed_db.make_answers(rnd),
+                "duration_seconds": rnd.randint(120, 3600),
+            })
+        else:
+            await rec.call(ac, "GET /api/answers?student_id", "GET", "/api/answers", headers=headers, params={"student_id": student_id})
+
+
+async def teacher(ac, rec: Recorder, rnd: random.Random, dataset: dict, deadline: float):
+    actions = [("answers", 30), ("statistics", 20), ("collections", 20), ("cases", 20), ("search", 10)]
+    while time.monotonic() < deadline:
+        action = weighted(rnd, actions)
+        if action == "answers":
+            await rec.call(ac, "GET /api/answers", "GET", "/api/answers", params={"limit": 100})
+        elif action == "statistics":
+            await rec.call(ac, "GET /api/admin/statistics", "GET", "/api/admin/statistics")
+        elif action == "collections":
+            await rec.call(ac, "GET /api/collections", "GET", "/api/collections")
+        elif action == "cases":
+            await rec.call(ac, "GET /api/cases", "GET", "/api/cases", params={"limit": 50})
+        else:
+            await rec.call(ac, "GET /api/cases/search", "GET", "/api/cases/search", params={"q": rnd.choice(seed_db.WORDS)})
+
+
+async def generator(ac, rec: Recorder, rnd: random.Random, dataset: dict, deadline: float):
+    while time.monotonic() < deadline:
+        # cache=False: sin caché ni agrupación de generaciones iguales, cada petición llama al LLM
+        await rec.call(ac, "POST /api/simulate", "POST", "/api/simulate", json={
+            "generate": True,
+            "theme": rnd.choice(seed_db.THEMES),
+            "difficulty": rnd.choice(seed_db.DIFFICULTIES),
+            "cache": False,
+        })
+
+
+PERSONAS = {"student": student, "teacher": teacher, "generate": generator}
+
+
+def parse_mix(raw: str) -> dict:
+    mix = {}
+    for part in raw.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in PERSONAS:
+            raise SystemExit(f"Perfil desconocido en --mix: {name!r} (usar {', '.join(PERSONAS)})")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+async def run_load(base_url: str, dataset: dict, args) -> Recorder:
+    rec = Recorder()
+    mix = parse_mix(args.mix)
+    rnd = random.Random(args.seed)
+    personas = rnd.choices(list(mix), weights=list(mix.values()), k=args.users)
+    limits = httpx.Limits(max_connections=args.users)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as ac:
+        deadline = time.monotonic() + args.duration
+        await asyncio.gather(*[
+            PERSONAS[persona](ac, rec, random.Random(args.seed * 1000 + i), dataset, deadline)
+            for i, persona in enumerate(personas)
+        ])
+    return rec
+
+
+# ===== Reporte =====
+
+def build_report(rec: Recorder, elapsed: float, args) -> dict:
+    try:
+        version = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=ROOT).stdout.strip() or None
+    except OSError:
+        version = None
+    routes = {}
+    total = errors = 0
+    for route, samples in sorted(rec.samples.items()):
+        latencies = [ms for ms, _ in samples]
+        failed = sum(1 for _, ok in samples if not ok)
+        total += len(samples)
+        errors += failed
+        routes[route] = {
+            "count": len(samples),
+            "rps": round(len(samples) / elapsed, 2),
+            "error_rate": round(failed / len(samples), 4),
+            "mean_ms": round(sum(latencies) / len(latencies), 2),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+        }
+    return {
+        "meta": {
+            "version": version,
+            "users": args.users,
+            "duration_s": args.duration,
+            "mix": parse_mix(args.mix),
+            "llm_latency_s": args.llm_latency,
+            "llm_jitter_s": args.llm_jitter,
+            "llm_tokens_per_s": args.llm_tokens_per_s,
+            "llm_failure_rate": args.llm_failure_rate,
+            "dataset": {"cases": args.cases, "students": args.students, "sessions": args.sessions},
+            "seed": args.seed,
+        },
+        "totals": {
+            "requests": total,
+            "rps": round(total / elapsed, 2),
+            "error_rate": round(errors / total, 4) if total else 0.0,
+        },
+        "routes": routes,
+    }
+
+
+def print_comparison(report: dict, baseline: dict):
+    """Tabla de diferencias por ruta contra una corrida anterior (a stderr)."""
+    print(f"{'ruta':36} {'rps':>16} {'p95 ms':>20} {'p99 ms':>20} {'errores':>16}", file=sys.stderr)
+    for route in sorted(set(report["routes"]) | set(baseline.get("routes", {}))):
+        new, old = report["routes"].get(route), baseline.get("routes", {}).get(route)
+        cells = []
+        for key, width in (("rps", 16), ("p95_ms", 20), ("p99_ms", 20), ("error_rate", 16)):
+            if new is None or old is None:
+                cells.append(f"{'—':>{width}}")
+            else:
+                cells.append(f"{old[key]:>8}→{new[key]:<{width - 9}}")
+        print(f"{route:36} " + " ".join(cells), file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=30)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--mix", default="student=70,teacher=20,generate=10")
+    parser.add_argument("--llm-latency", type=float, default=1.5)
+    parser.add_argument("--llm-jitter", type=float, default=0.5)
+    parser.add_argument("--llm-tokens-per-s", type=float, default=0, help="Velocidad de salida del LLM sintético (0: instantánea)")
+    parser.add_argument("--llm-failure-rate", type=float, default=0, help="Fracción de llamadas al LLM que fallan")
+    parser.add_argument("--cases", type=int, default=500)
+    parser.add_argument("--students", type=int, default=50)
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", help="Base ya sembrada (por defecto se siembra una temporal)")
+    parser.add_argument("--output", help="Archivo donde guardar el reporte JSON (por defecto stdout)")
+    parser.add_argument("--compare", help="Reporte anterior contra el cual comparar")
+    args = parser.parse_args()
+
+    if args.db:
+        db_path = args.db
+        seed_db.db.init_db(db_path)
+        conn = seed_db.db._connect(db_path)
+        dataset = {
+            "case_ids": [r[0] for r in conn.execute("SELECT id FROM cases WHERE status = 'active'")],
+            "usernames": [r[0] for r in conn.execute("SELECT username FROM students WHERE username LIKE 'estudiante___'")],
+        }
+    else:
+        db_path = os.path.join(tempfile.mkdtemp(prefix="simts-load-"), "load.db")
+        dataset = seed_db.seed(db_path, args.cases, args.students, args.sessions, seed=args.seed)
+    seed_db.db.close_connections()
+
+    proc, base_url = start_server(db_path, args)
+    try:
+        start = time.perf_counter()
+        rec = asyncio.run(run_load(base_url, dataset, args))
+        elapsed = time.perf_counter() - start
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    report = build_report(rec, elapsed, args)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            print_comparison(report, json.load(fh))
+
+
+if __name__ == "__main__":
+    main()
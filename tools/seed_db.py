@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""Genera una base SQLite sembrada y reproducible para pruebas de carga y benchmarks.
+
+Crea casos con preguntas, colecciones, estudiantes (`estudiante001`... con
+contraseña `pass`) y sesiones con respuestas. Con la misma semilla y los mismos
+tamaños el contenido es idéntico (salvo fechas de creación).
+
+Usage:
+  python3 tools/seed_db.py /tmp/simts-seed.db [--cases 500] [--students 50] [--sessions 2000] [--seed 42]
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "backend"))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import db  # noqa: E402
+
+# Mismos ejes temáticos que ofrece el frontend
+THEMES = [
+    "Familia y dinámicas familiares",
+    "Infancia y adolescencia",
+    "Salud mental",
+    "Violencia intrafamiliar",
+    "Adulto mayor",
+    "Migración y multiculturalidad",
+    "Reinserción social",
+    "Discapacidad e inclusión",
+    "Pobreza y vulnerabilidad social",
+    "Adicciones",
+]
+DIFFICULTIES = ["basico", "intermedio", "avanzado"]
+WORDS = [
+    "familia", "red", "apoyo", "derechos", "barrio", "escuela", "vivienda", "salud", "trabajo",
+    "comunidad", "vínculo", "riesgo", "protección", "intervención", "diagnóstico", "territorio",
+]
+QUESTIONS_PER_CASE = 5
+
+
+def make_case(rnd: random.Random, index: int) -> dict:
+    """Caso con la forma que produce el modelo (ver `build_generation_prompt`)."""
+    questions = [
+        {
+            "text": f"Pregunta {q + 1}: " + " ".join(rnd.choice(WORDS) for _ in range(8)),
+            "options": [" ".join(rnd.choice(WORDS) for _ in range(4)) for _ in range(4)],
+            "correct_index": rnd.randrange(4),
+        }
+        for q in range(QUESTIONS_PER_CASE - 1)
+    ]
+    questions.append({"text": f"Pregunta {QUESTIONS_PER_CASE}: fundamente su plan de intervención", "options": []})
+    return {
+        "case_id": f"seed-{index:06d}",
+        "title": f"Caso {index}: " + " ".join(rnd.choice(WORDS) for _ in range(3)),
+        "eje": rnd.choice(THEMES),
+        "nivel": rnd.choice(DIFFICULTIES),
+        "description": " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(150, 450))),
+        "questions": questions,
+    }
+
+
+def make_answers(rnd: random.Random) -> list:
+    answers = [{"question_index": q, "selected_option": rnd.randrange(4)} for q in range(QUESTIONS_PER_CASE - 1)]
+    answers.append({"question_index": QUESTIONS_PER_CASE - 1, "open_answer": " ".join(rnd.choice(WORDS) for _ in range(30))})
+    return answers
+
+
+def seed(db_path: str, cases: int = 500, students: int = 50, sessions: int = 2000, collections: int = 5, seed: int = 42) -> dict:
+    """Siembra `db_path` (se crea si no existe) y devuelve los ids generados."""
+    rnd = random.Random(seed)
+    db.init_db(db_path)
+
+    case_ids = []
+    for start in range(0, cases, 1000):
+        batch = [make_case(rnd, i) for i in range(start, min(cases, start + 1000))]
+        case_ids += [saved["id"] for saved in db.save_cases_bulk(db_path, batch)]
+
+    collection_ids = []
+    for c in range(collections):
+        collection = db.create_collection(db_path, f"Colección {c + 1}", "Sembrada para pruebas de carga")
+        collection_ids.append(collection["id"])
+        for case_id in rnd.sample(case_ids, min(len(case_ids), 20)):
+            db.add_case_to_collection(db_path, collection["id"], case_id)
+
+    questions_by_case = db.get_cases_questions(db_path, case_ids)
+    conn = db._connect(db_path)
+    cur = conn.cursor()
+    now = datetime.utcnow()
+    pw_hash = hashlib.sha256("pass".encode()).hexdigest()
+    cur.executemany(
+        "INSERT OR IGNORE INTO students (username, password_hash, name, created_at, status) VALUES (?,?,?,?,?)",
+        [(f"estudiante{i:03d}", pw_hash, f"Estudiante {i}", now.isoformat(), "active") for i in range(1, students + 1)]
+    )
+    usernames = [f"estudiante{i:03d}" for i in range(1, students + 1)]
+    cur.execute(f"SELECT id FROM students WHERE username IN ({','.join('?' * len(usernames))})", usernames)
+    student_ids = [row[0] for row in cur.fetchall()]
+
+    # Sesiones directo en una transacción (el escritor agrupado espera por cada
+    # llamada síncrona); la corrección no debe usar la conexión mientras tanto
+    for _ in range(sessions):
+        case_id = rnd.choice(case_ids)
+        created = (now - timedelta(days=rnd.randint(0, 120), minutes=rnd.randint(0, 1440))).isoformat()
+        rows, _, _ = db._grade_answers(questions_by_case.get(case_id, []), make_answers(rnd))
+        cur.execute(
+            "INSERT INTO student_sessions (student_id, case_id, created_at, submitted_at, duration_seconds) VALUES (?,?,?,?,?)",
+            (rnd.choice(student_ids), case_id, created, created, rnd.randint(120, 3600))
+        )
+        session_id = cur.lastrowid
+        cur.executemany(
+            "INSERT INTO student_answers (session_id, question_index, selected_option, open_answer, is_correct, created_at) VALUES (?,?,?,?,?,?)",
+            [(session_id, q_idx, selected, open_ans, is_correct, created) for q_idx, selected, open_ans, is_correct in rows]
+        )
+    conn.commit()
+    conn.close()
+    return {"case_ids": case_ids, "student_ids": student_ids, "usernames": usernames, "collection_ids": collection_ids}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("db_path")
+    parser.add_argument("--cases", type=int, default=500)
+    parser.add_argument("--students", type=int, default=50)
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--collections", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    ids = seed(args.db_path, args.cases, args.students, args.sessions, args.collections, args.seed)
+    db.close_connections()
+    print(json.dumps({"db_path": args.db_path, **{k: len(v) for k, v in ids.items()}}))
+
+
+if __name__ == "__main__":
+    main()